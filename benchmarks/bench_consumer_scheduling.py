@@ -0,0 +1,121 @@
+"""Measures the latency of a latency-sensitive queue consumed together with a
+bulk queue holding a large backlog, with FIFO prefetching and with each
+scheduling policy.
+
+Usage: PYTHONPATH=. python benchmarks/bench_consumer_scheduling.py
+    [-n BULK_MESSAGES] [-u URGENT_MESSAGES] [-p PREFETCH] [-w WORKERS]
+"""
+
+import argparse
+import logging
+import statistics
+import threading
+import time
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+from rolecraft.service.consumer import DefaultConsumerFactory
+
+HANDLING_SECONDS = 0.0002
+URGENT_INTERVAL_SECONDS = 0.002
+
+
+def bench(
+    policy: str | None,
+    bulk_num: int,
+    urgent_num: int,
+    prefetch_size: int,
+    worker_num: int,
+) -> list[float]:
+    broker = StubBroker()
+    bulk, urgent = (
+        MessageQueue(
+            name=name,
+            broker=broker,
+            encoder=HeaderBytesEncoder(),
+            settings={"weight": weight},
+        )
+        for name, weight in (("bulk", 1), ("urgent", 10))
+    )
+    bulk.enqueue_many(
+        [Message(role_name="role", queue=bulk) for _ in range(bulk_num)]
+    )
+    consumer = DefaultConsumerFactory()(
+        queues=[bulk, urgent],
+        prefetch_size=prefetch_size,
+        scheduling_policy=policy,
+    )
+
+    lock = threading.Lock()
+    latencies = []
+    all_handled = threading.Event()
+
+    def work():
+        for msg in consumer:
+            if msg.queue is urgent:
+                latency = time.perf_counter() - float(msg.role_data)
+                with lock:
+                    latencies.append(latency)
+                    if len(latencies) == urgent_num:
+                        all_handled.set()
+            time.sleep(HANDLING_SECONDS)
+            msg.ack()
+
+    workers = [threading.Thread(target=work) for _ in range(worker_num)]
+    for t in workers:
+        t.start()
+    # let the bulk messages fill the buffer
+    time.sleep(0.2)
+
+    for _ in range(urgent_num):
+        urgent.enqueue(
+            Message(
+                role_name="role",
+                role_data=str(time.perf_counter()),
+                queue=urgent,
+            )
+        )
+        time.sleep(URGENT_INTERVAL_SECONDS)
+    all_handled.wait()
+
+    consumer.stop()
+    for t in workers:
+        t.join()
+    consumer.join()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--bulk-messages", type=int, default=200_000)
+    parser.add_argument("-u", "--urgent-messages", type=int, default=200)
+    parser.add_argument("-p", "--prefetch", type=int, default=256)
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    args = parser.parse_args()
+    # the prefetched bulk messages are requeued after stopping
+    logging.disable(logging.WARNING)
+
+    for policy in (
+        None,
+        "strict_priority",
+        "weighted_fair",
+        "deficit_round_robin",
+        "shortest_backlog",
+    ):
+        latencies = bench(
+            policy,
+            args.bulk_messages,
+            args.urgent_messages,
+            args.prefetch,
+            args.workers,
+        )
+        p50 = statistics.median(latencies)
+        p99 = statistics.quantiles(latencies, n=100)[98]
+        print(
+            f"{policy or 'fifo':>19}: urgent p50 {p50 * 1000:.2f}ms, "
+            f"p99 {p99 * 1000:.2f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compares the encode and decode time and the encoded size per message of
+the JSON encoders and of BinaryEncoder.
+
+Usage: PYTHONPATH=. python benchmarks/bench_encoders.py
+    [-n MESSAGES] [-s ROLE_DATA_SIZE]
+"""
+
+import argparse
+import json
+import time
+
+from rolecraft.broker import HeaderBytesRawMessage
+from rolecraft.queue import (
+    BinaryEncoder,
+    BytesEncoder,
+    Encoder,
+    HeaderBytesEncoder,
+    Message,
+)
+
+META = {"retries": 2, "trace_id": "4bf92f3577b34da6", "priority": 0.5}
+
+
+def bench(
+    encoder: Encoder, num: int, data_size: int
+) -> tuple[float, float, int]:
+    msgs = [
+        Message(
+            id=str(i),
+            meta=dict(META),
+            role_name="bench_role",
+            role_data="x" * data_size,
+            queue=None,  # type: ignore
+        )
+        for i in range(num)
+    ]
+
+    start = time.perf_counter()
+    raw_msgs = [encoder.encode(msg) for msg in msgs]
+    encode_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for raw_msg in raw_msgs:
+        encoder.decode(raw_msg, queue=None)
+    decode_elapsed = time.perf_counter() - start
+
+    # The headers kept beside the data are stored by the broker too
+    size = len(raw_msgs[0].data)
+    if isinstance(raw_msgs[0], HeaderBytesRawMessage):
+        size += len(json.dumps(raw_msgs[0].headers))
+    return encode_elapsed / num, decode_elapsed / num, size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=100_000)
+    parser.add_argument("-s", "--role-data-size", type=int, default=64)
+    args = parser.parse_args()
+
+    encoders = {
+        "header-bytes": HeaderBytesEncoder(),
+        "bytes": BytesEncoder(HeaderBytesEncoder()),
+        "binary": BinaryEncoder(),
+    }
+    print(f"{'':>12} {'encode':>9} {'decode':>9} {'bytes':>6}")
+    for name, encoder in encoders.items():
+        encode, decode, size = bench(
+            encoder, args.messages, args.role_data_size
+        )
+        print(
+            f"{name:>12} {encode * 1e6:>7.2f}us {decode * 1e6:>7.2f}us "
+            f"{size:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
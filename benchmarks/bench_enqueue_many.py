@@ -0,0 +1,64 @@
+"""Compares enqueuing messages one by one with enqueuing them in batches.
+
+Usage: python benchmarks/bench_enqueue_many.py [-n MESSAGES] [-b BATCH_SIZE]
+"""
+
+import argparse
+import time
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+
+ROLE_DATA = '{"a": [1, 2], "k": {}}'
+
+
+def new_queue() -> MessageQueue:
+    return MessageQueue(
+        name="bench", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+
+
+def new_messages(queue: MessageQueue, num: int) -> list[Message]:
+    return [
+        Message(role_name="bench_role", role_data=ROLE_DATA, queue=queue)
+        for _ in range(num)
+    ]
+
+
+def bench_per_message(num: int) -> float:
+    queue = new_queue()
+    msgs = new_messages(queue, num)
+    start = time.perf_counter()
+    for msg in msgs:
+        queue.enqueue(msg)
+    return time.perf_counter() - start
+
+
+def bench_batched(num: int, batch_size: int) -> float:
+    queue = new_queue()
+    msgs = new_messages(queue, num)
+    start = time.perf_counter()
+    for i in range(0, num, batch_size):
+        queue.enqueue_many(msgs[i : i + batch_size])
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=50_000)
+    parser.add_argument("-b", "--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    per_message = bench_per_message(args.messages)
+    batched = bench_batched(args.messages, args.batch_size)
+
+    for name, elapsed in (("per-message", per_message), ("batched", batched)):
+        print(
+            f"{name:>12}: {elapsed:.3f}s "
+            f"({args.messages / elapsed:,.0f} msg/s)"
+        )
+    print(f"     speedup: {per_message / batched:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Measures decoding multi-megabyte bytes payloads with BinaryEncoder, with
+the role data copied out of the frame and with it kept as a memoryview, and
+the framing of BytesEncoder with large headers.
+
+Usage: PYTHONPATH=. python benchmarks/bench_large_payload.py
+    [-n MESSAGES] [-s PAYLOAD_MIB]
+"""
+
+import argparse
+import time
+
+from rolecraft.queue import (
+    BinaryEncoder,
+    BytesEncoder,
+    Encoder,
+    HeaderBytesEncoder,
+    Message,
+)
+
+
+def bench(encoder: Encoder, message: Message, num: int) -> float:
+    raw_msg = encoder.encode(message)
+    start = time.perf_counter()
+    for _ in range(num):
+        encoder.decode(raw_msg, queue=None)
+    return (time.perf_counter() - start) / num
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=200)
+    parser.add_argument("-s", "--payload-mib", type=int, default=4)
+    args = parser.parse_args()
+
+    size = args.payload_mib * 1024 * 1024
+    binary_message = Message(
+        role_name="bench_role",
+        role_data=b"x" * size,
+        queue=None,  # type: ignore
+    )
+    # BytesEncoder carries the large data in the headers, as its role data
+    # is JSON
+    bytes_message = Message(
+        role_name="bench_role",
+        meta={"blob": "x" * size},
+        queue=None,  # type: ignore
+    )
+
+    results = {
+        "binary copy": bench(BinaryEncoder(), binary_message, args.messages),
+        "binary buffer": bench(
+            BinaryEncoder(buffer_payload=True), binary_message, args.messages
+        ),
+        "bytes": bench(
+            BytesEncoder(HeaderBytesEncoder()), bytes_message, args.messages
+        ),
+    }
+    for name, elapsed in results.items():
+        print(f"{name:>14}: {elapsed * 1e6:>9.1f}us per message")
+
+
+if __name__ == "__main__":
+    main()
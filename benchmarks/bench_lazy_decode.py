@@ -0,0 +1,51 @@
+"""Measures the time per message of receiving and requeuing messages, as
+the leftover messages are at shutdown, with the role data decoded eagerly
+and lazily.
+
+Usage: PYTHONPATH=. python benchmarks/bench_lazy_decode.py
+    [-n MESSAGES] [-s ROLE_DATA_SIZE]
+"""
+
+import argparse
+import json
+import time
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+
+
+def bench(num: int, data_size: int, lazy: bool) -> float:
+    queue = MessageQueue(
+        name="bench",
+        broker=StubBroker(),
+        encoder=HeaderBytesEncoder(lazy=lazy),
+    )
+    role_data = json.dumps({"a": ["x" * 16] * (data_size // 20)})
+    queue.enqueue_many(
+        [
+            Message(role_name="bench_role", role_data=role_data, queue=queue)
+            for _ in range(num)
+        ]
+    )
+
+    start = time.perf_counter()
+    for _ in range(num):
+        queue.requeue_many(queue.receive(max_number=10))
+    return (time.perf_counter() - start) / (num * 10)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=10_000)
+    parser.add_argument("-s", "--role-data-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    eager = bench(args.messages, args.role_data_size, lazy=False)
+    lazy = bench(args.messages, args.role_data_size, lazy=True)
+    for name, elapsed in (("eager", eager), ("lazy", lazy)):
+        print(f"{name:>6}: {elapsed * 1e6:.2f}us per message")
+    print(f"speedup: {eager / lazy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
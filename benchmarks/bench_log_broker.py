@@ -0,0 +1,66 @@
+"""Compares the throughput of the LogBroker with the in-memory StubBroker
+and the SqliteBroker: batched enqueue, then receive + ack.
+
+Usage: python benchmarks/bench_log_broker.py [-n MESSAGES] [-s DATA_SIZE]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+from rolecraft.broker import (
+    Broker,
+    HeaderBytesRawMessage,
+    LogBroker,
+    SqliteBroker,
+    StubBroker,
+)
+
+QUEUE = "bench"
+
+
+def bench(broker: Broker, num: int, data_size: int) -> tuple[float, float]:
+    msgs = [
+        HeaderBytesRawMessage(data=b"x" * data_size, headers={"k": "v"})
+        for _ in range(num)
+    ]
+
+    start = time.perf_counter()
+    for i in range(0, num, 1000):
+        broker.enqueue_many(QUEUE, msgs[i : i + 1000])
+    enqueued = time.perf_counter()
+
+    received = 0
+    while received < num:
+        batch = broker.receive(QUEUE, max_number=100)
+        if not batch:
+            break
+        broker.ack_many(batch, QUEUE)
+        received += len(batch)
+    return enqueued - start, time.perf_counter() - enqueued
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=50_000)
+    parser.add_argument("-s", "--data-size", type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        brokers = {
+            "stub": StubBroker(),
+            "log": LogBroker(os.path.join(tmpdir, "log")),
+            "sqlite": SqliteBroker(os.path.join(tmpdir, "bench.db")),
+        }
+        for name, broker in brokers.items():
+            enqueue, receive = bench(broker, args.messages, args.data_size)
+            broker.close()
+            print(
+                f"{name:>8}: enqueue {args.messages / enqueue:>10,.0f} msg/s"
+                f", receive+ack {args.messages / receive:>10,.0f} msg/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Measures the CPU time per message of receiving and then acking, nacking or
+requeuing it, with the raw message encoded again for the broker and with the
+received raw message reused.
+
+Usage: PYTHONPATH=. python benchmarks/bench_message_lifecycle.py
+    [-n MESSAGES] [-s ROLE_DATA_SIZE]
+"""
+
+import argparse
+import time
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+
+
+def bench(num: int, data_size: int, reuse: bool) -> dict[str, float]:
+    queue = MessageQueue(
+        name="bench", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+    role_data = "x" * data_size
+    queue.enqueue_many(
+        [
+            Message(
+                role_name="bench_role",
+                role_data=role_data,
+                meta={"trace": "abc", "retries": 0},
+                queue=queue,
+            )
+            for _ in range(num)
+        ]
+    )
+
+    per_message = {}
+    for name in ("requeue", "nack", "ack"):
+        start = time.process_time()
+        for _ in range(num):
+            (msg,) = queue.receive()
+            if not reuse:
+                # As before the raw message was kept on the message
+                msg.raw_message = None
+            if name == "ack":
+                msg.ack()
+            elif name == "nack":
+                # The stub broker drops a nacked message, enqueue it back
+                msg.nack(exception=ValueError())
+                queue.enqueue(msg)
+            else:
+                msg.requeue()
+        per_message[name] = (time.process_time() - start) / num
+    return per_message
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=50_000)
+    parser.add_argument("-s", "--role-data-size", type=int, default=1024)
+    args = parser.parse_args()
+
+    encoded = bench(args.messages, args.role_data_size, reuse=False)
+    reused = bench(args.messages, args.role_data_size, reuse=True)
+
+    print(f"{'':>8} {'encoded':>10} {'reused':>10}")
+    for name in encoded:
+        print(
+            f"{name:>8} {encoded[name] * 1e6:>8.2f}us "
+            f"{reused[name] * 1e6:>8.2f}us "
+            f"({encoded[name] / reused[name]:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compares the MultiplexConsumer with the ThreadedConsumer for many
+low-traffic queues: the number of threads, the peak memory allocated by
+Python and the time to consume the messages.
+
+Usage: python benchmarks/bench_multiplex_consumer.py [-q QUEUES]
+    [-n MESSAGES] [-p POLLERS]
+"""
+
+import argparse
+import random
+import threading
+import time
+import tracemalloc
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+from rolecraft.service.consumer.multiplex_consumer import MultiplexConsumer
+from rolecraft.service.consumer.threaded_consumer import ThreadedConsumer
+
+
+def new_queues(num: int) -> list[MessageQueue]:
+    broker = StubBroker()
+    return [
+        MessageQueue(
+            name=f"queue{i}",
+            broker=broker,
+            encoder=HeaderBytesEncoder(),
+            wait_time_seconds=1,
+        )
+        for i in range(num)
+    ]
+
+
+def bench(consumer, queues: list[MessageQueue], num: int):
+    tracemalloc.start()
+    consumer.start()
+    consumer._start_consumer_threads()
+    threads = threading.active_count()
+
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(num):
+        queue = rng.choice(queues)
+        queue.enqueue(Message(role_name="bench", queue=queue))
+    received = 0
+    while received < num:
+        msgs = consumer.consume(max_num=num - received)
+        for msg in msgs:
+            msg.ack()
+        received += len(msgs)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    consumer.stop()
+    consumer.join()
+    return threads, peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-q", "--queues", type=int, default=1000)
+    parser.add_argument("-n", "--messages", type=int, default=5000)
+    parser.add_argument("-p", "--pollers", type=int, default=4)
+    args = parser.parse_args()
+
+    queues = new_queues(args.queues)
+    multiplex = MultiplexConsumer(
+        queues, prefetch_size=100, poller_num=args.pollers
+    )
+    queues = new_queues(args.queues)
+    threaded = ThreadedConsumer(queues, prefetch_size=100)
+
+    for name, consumer in (("multiplex", multiplex), ("threaded", threaded)):
+        threads, peak, elapsed = bench(
+            consumer, consumer.queues, args.messages
+        )
+        print(
+            f"{name:>10}: {threads:>5} threads, "
+            f"peak {peak / 1024 / 1024:.1f} MiB, {elapsed:.3f}s "
+            f"({args.messages / elapsed:,.0f} msg/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
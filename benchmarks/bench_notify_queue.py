@@ -0,0 +1,148 @@
+"""Compares the NotifyQueue with its previous implementation, a condition
+over queue.Queue, handing items from consumer threads to worker threads.
+
+Usage: PYTHONPATH=. python benchmarks/bench_notify_queue.py [-n ITEMS]
+    [-w WORKERS [WORKERS ...]] [-c CONSUMERS] [-b BATCH] [-m MAXSIZE]
+"""
+
+import argparse
+import queue
+import threading
+import time
+
+from rolecraft.service.consumer.notify_queue import NotifyQueue
+
+
+class LegacyNotifyQueue:
+    def __init__(self, maxsize: int = 0) -> None:
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._condition = threading.Condition()
+        self._all_notfied = False
+
+    def get_nowait(self):
+        try:
+            return self._queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    def get(self, wakeup_until_notify_all=False):
+        item = self.get_nowait()
+        if item is not None:
+            return item
+
+        with self._condition:
+            if not self._queue.empty():
+                item = self.get_nowait()
+                if item is not None:
+                    return item
+
+            if wakeup_until_notify_all and self._all_notfied:
+                return
+
+            while True:
+                self._condition.wait()
+
+                item = self.get_nowait()
+                if item is not None:
+                    return item
+
+                if not wakeup_until_notify_all or self._all_notfied:
+                    return
+
+    def put(self, item):
+        self._queue.put(item)
+
+        with self._condition:
+            self._condition.notify()
+
+    def notify_all(self):
+        with self._condition:
+            self._all_notfied = True
+            self._condition.notify_all()
+
+    # The consumer's former usages in batches
+    def get_many(self, max_num, wakeup_until_notify_all=False):
+        item = self.get(wakeup_until_notify_all=wakeup_until_notify_all)
+        if item is None:
+            return []
+        items = [item]
+        while len(items) < max_num:
+            item = self.get_nowait()
+            if item is None:
+                break
+            items.append(item)
+        return items
+
+    def put_many(self, items):
+        for item in items:
+            self.put(item)
+
+
+def bench(
+    queue_cls,
+    num: int,
+    worker_num: int,
+    consumer_num: int,
+    batch_size: int,
+    maxsize: int,
+) -> float:
+    notify_queue = queue_cls(maxsize=maxsize)
+    per_consumer = num // consumer_num
+
+    def consume():
+        for start in range(0, per_consumer, batch_size):
+            notify_queue.put_many(
+                range(start, min(start + batch_size, per_consumer))
+            )
+
+    def work():
+        while notify_queue.get_many(batch_size, wakeup_until_notify_all=True):
+            pass
+
+    consumers = [threading.Thread(target=consume) for _ in range(consumer_num)]
+    workers = [threading.Thread(target=work) for _ in range(worker_num)]
+
+    start = time.perf_counter()
+    for t in workers + consumers:
+        t.start()
+    for t in consumers:
+        t.join()
+    # The workers drain the queue before stopping
+    notify_queue.notify_all()
+    for t in workers:
+        t.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--items", type=int, default=200_000)
+    parser.add_argument(
+        "-w", "--workers", type=int, nargs="+", default=[1, 8, 32]
+    )
+    parser.add_argument("-c", "--consumers", type=int, default=4)
+    parser.add_argument("-b", "--batch", type=int, default=10)
+    parser.add_argument("-m", "--maxsize", type=int, default=64)
+    args = parser.parse_args()
+
+    for worker_num in args.workers:
+        for name, queue_cls in (
+            ("legacy", LegacyNotifyQueue),
+            ("current", NotifyQueue),
+        ):
+            elapsed = bench(
+                queue_cls,
+                args.items,
+                worker_num,
+                args.consumers,
+                args.batch,
+                args.maxsize,
+            )
+            print(
+                f"{worker_num:>3} workers, {name:>7}: {elapsed:.3f}s "
+                f"({args.items / elapsed:,.0f} items/s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
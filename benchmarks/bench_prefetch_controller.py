@@ -0,0 +1,110 @@
+"""Compares a fixed prefetch split with the adaptive prefetch controller on a
+fast and a slow queue, measuring throughput and when each queue is drained.
+
+Usage: PYTHONPATH=. python benchmarks/bench_prefetch_controller.py
+    [-n MESSAGES] [-p PREFETCH] [-w WORKERS] [-s TARGET_SECONDS]
+"""
+
+import argparse
+import threading
+import time
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+from rolecraft.service.consumer import PrefetchController
+from rolecraft.service.consumer.threaded_consumer import ThreadedConsumer
+
+HANDLING_SECONDS = {"fast": 0.0005, "slow": 0.02}
+
+
+def bench(
+    num: int,
+    prefetch_size: int,
+    worker_num: int,
+    target_seconds: float | None,
+) -> tuple[float, dict[str, float]]:
+    broker = StubBroker()
+    queues = [
+        MessageQueue(name=name, broker=broker, encoder=HeaderBytesEncoder())
+        for name in HANDLING_SECONDS
+    ]
+    for queue in queues:
+        msg_num = num if queue.name == "fast" else num // 20
+        queue.enqueue_many(
+            [Message(role_name="role", queue=queue) for _ in range(msg_num)]
+        )
+
+    controller = None
+    if target_seconds:
+        controller = PrefetchController(
+            max_buffered=prefetch_size, target_seconds=target_seconds
+        )
+    consumer = ThreadedConsumer(
+        queues=queues,
+        prefetch_size=prefetch_size,
+        prefetch_controller=controller,
+    )
+
+    lock = threading.Lock()
+    all_handled = threading.Event()
+    remaining = {
+        queue.name: num if queue.name == "fast" else num // 20
+        for queue in queues
+    }
+    # the seconds since the start when each queue is drained
+    drained: dict[str, float] = {}
+
+    def work():
+        for msg in consumer:
+            name = msg.queue.name
+            time.sleep(HANDLING_SECONDS[name])
+            msg.ack()
+            with lock:
+                remaining[name] -= 1
+                if not remaining[name]:
+                    drained[name] = time.perf_counter() - start
+                    if len(drained) == len(remaining):
+                        all_handled.set()
+
+    start = time.perf_counter()
+    consumer.start()
+    workers = [threading.Thread(target=work) for _ in range(worker_num)]
+    for t in workers:
+        t.start()
+    all_handled.wait()
+    elapsed = time.perf_counter() - start
+    consumer.stop()
+    for t in workers:
+        t.join()
+    consumer.join()
+
+    return elapsed, drained
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=2000)
+    parser.add_argument("-p", "--prefetch", type=int, default=64)
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("-s", "--target-seconds", type=float, default=0.05)
+    args = parser.parse_args()
+
+    for name, target_seconds in (
+        ("fixed", None),
+        ("adaptive", args.target_seconds),
+    ):
+        elapsed, drained = bench(
+            args.messages, args.prefetch, args.workers, target_seconds
+        )
+        total = args.messages + args.messages // 20
+        print(
+            f"{name:>8}: {elapsed:.3f}s ({total / elapsed:,.0f} msg/s), "
+            + ", ".join(
+                f"{queue_name} drained at {seconds:.3f}s"
+                for queue_name, seconds in sorted(drained.items())
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
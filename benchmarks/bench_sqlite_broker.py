@@ -0,0 +1,88 @@
+"""Measures the throughput of the SqliteBroker: batched enqueue, concurrent
+single-message enqueue (which relies on group commit) and receive + ack.
+
+Usage: python benchmarks/bench_sqlite_broker.py [-n MESSAGES] [-t THREADS]
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from rolecraft.broker import HeaderBytesRawMessage, SqliteBroker
+
+QUEUE = "bench"
+
+
+def new_messages(num: int) -> list[HeaderBytesRawMessage]:
+    return [
+        HeaderBytesRawMessage(data=b'{"a": [1, 2]}', headers={"k": "v"})
+        for _ in range(num)
+    ]
+
+
+def bench_enqueue_many(broker: SqliteBroker, num: int) -> float:
+    msgs = new_messages(num)
+    start = time.perf_counter()
+    for i in range(0, num, 1000):
+        broker.enqueue_many(QUEUE, msgs[i : i + 1000])
+    return time.perf_counter() - start
+
+
+def bench_concurrent_enqueue(
+    broker: SqliteBroker, num: int, thread_num: int
+) -> float:
+    msgs = new_messages(num)
+    chunks = [msgs[i::thread_num] for i in range(thread_num)]
+
+    def enqueue(chunk):
+        for msg in chunk:
+            broker.enqueue(QUEUE, msg)
+
+    threads = [threading.Thread(target=enqueue, args=(c,)) for c in chunks]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start
+
+
+def bench_receive_ack(broker: SqliteBroker, num: int) -> float:
+    start = time.perf_counter()
+    received = 0
+    while received < num:
+        msgs = broker.receive(QUEUE, max_number=100)
+        if not msgs:
+            break
+        broker.ack_many(msgs, QUEUE)
+        received += len(msgs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=20_000)
+    parser.add_argument("-t", "--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        broker = SqliteBroker(os.path.join(tmpdir, "bench.db"))
+        results = [
+            ("enqueue_many", bench_enqueue_many(broker, args.messages)),
+            (
+                f"enqueue x{args.threads}",
+                bench_concurrent_enqueue(broker, args.messages, args.threads),
+            ),
+            ("receive+ack", bench_receive_ack(broker, args.messages * 2)),
+        ]
+        broker.close()
+
+    for name, elapsed in results:
+        num = args.messages * (2 if name == "receive+ack" else 1)
+        print(f"{name:>14}: {elapsed:.3f}s ({num / elapsed:,.0f} msg/s)")
+
+
+if __name__ == "__main__":
+    main()
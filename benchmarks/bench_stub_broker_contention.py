@@ -0,0 +1,78 @@
+"""Measures the multi-producer/multi-consumer throughput of the StubBroker.
+Each run starts the same number of producer and consumer threads.
+
+Usage: python benchmarks/bench_stub_broker_contention.py [-n MESSAGES]
+    [-t THREADS [THREADS ...]] [-b BATCH_SIZE]
+"""
+
+import argparse
+import threading
+import time
+
+from rolecraft.broker import HeaderBytesRawMessage, StubBroker
+
+QUEUE = "bench"
+
+
+def bench(num: int, thread_num: int, batch_size: int) -> float:
+    broker = StubBroker()
+    per_thread = num // thread_num
+    start_barrier = threading.Barrier(thread_num * 2 + 1)
+
+    def produce():
+        msgs = [HeaderBytesRawMessage(data=b"x") for _ in range(per_thread)]
+        start_barrier.wait()
+        for msg in msgs:
+            broker.enqueue(QUEUE, msg)
+
+    def consume():
+        start_barrier.wait()
+        received = 0
+        while received < per_thread:
+            future = broker.block_receive(
+                QUEUE,
+                max_number=min(batch_size, per_thread - received),
+                wait_time_seconds=5,
+            )
+            msgs = future.result()
+            if not msgs:
+                raise RuntimeError("timed out")
+            broker.ack_many(msgs, QUEUE)
+            received += len(msgs)
+
+    threads = [
+        threading.Thread(target=target)
+        for _ in range(thread_num)
+        for target in (produce, consume)
+    ]
+    for t in threads:
+        t.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    assert broker.qsize(QUEUE) == 0
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=100_000)
+    parser.add_argument(
+        "-t", "--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16, 64]
+    )
+    parser.add_argument("-b", "--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    for thread_num in args.threads:
+        num = args.messages // thread_num * thread_num
+        elapsed = bench(num, thread_num, args.batch_size)
+        print(
+            f"{thread_num:>3} producers/{thread_num:>3} consumers: "
+            f"{elapsed:.3f}s ({num / elapsed:,.0f} msg/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+"""Measures scheduling and promoting delayed messages in the StubBroker.
+
+Usage: python benchmarks/bench_stub_broker_delay.py [-n MESSAGES]
+"""
+
+import argparse
+import random
+import time
+
+from rolecraft.broker import HeaderBytesRawMessage, StubBroker
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+    num: int = args.messages
+
+    broker = StubBroker()
+    msgs = [HeaderBytesRawMessage(id=str(i), data=b"") for i in range(num)]
+    delays = [random.randint(1, 1000) for _ in range(num)]
+
+    start = time.perf_counter()
+    for msg, delay in zip(msgs, delays):
+        broker.enqueue("bench", msg, delay_millis=delay)
+    elapsed = time.perf_counter() - start
+    print(f"schedule: {elapsed:.3f}s ({num / elapsed:,.0f} msg/s)")
+
+    time.sleep(1)
+
+    start = time.perf_counter()
+    received = 0
+    while received < num:
+        received += len(broker.receive("bench", max_number=1000))
+    elapsed = time.perf_counter() - start
+    print(f" promote: {elapsed:.3f}s ({num / elapsed:,.0f} msg/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Measures the StubBroker throughput at several numbers of priority levels,
+against a plain deque.
+
+Usage: python benchmarks/bench_stub_broker_priority.py [-n MESSAGES]
+"""
+
+import argparse
+import collections
+import random
+import time
+
+from rolecraft.broker import HeaderBytesRawMessage, StubBroker
+
+
+def new_messages(num: int) -> list[HeaderBytesRawMessage]:
+    return [HeaderBytesRawMessage(id=str(i), data=b"") for i in range(num)]
+
+
+def bench_deque(num: int) -> float:
+    msgs = new_messages(num)
+    queue = collections.deque()
+    start = time.perf_counter()
+    for msg in msgs:
+        queue.append(msg)
+    while queue:
+        queue.popleft()
+    return time.perf_counter() - start
+
+
+def bench_broker(num: int, levels: int | None) -> float:
+    msgs = new_messages(num)
+    priorities = (
+        [random.randrange(levels) for _ in range(num)] if levels else []
+    )
+    broker = StubBroker()
+
+    start = time.perf_counter()
+    if levels:
+        for msg, priority in zip(msgs, priorities):
+            broker.enqueue("bench", msg, priority=priority)
+    else:
+        for msg in msgs:
+            broker.enqueue("bench", msg)
+    received = 0
+    while received < num:
+        received += len(broker.receive("bench", max_number=10))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=200_000)
+    args = parser.parse_args()
+    num: int = args.messages
+
+    results = [("plain deque", bench_deque(num))]
+    results.append(("no priority", bench_broker(num, None)))
+    for levels in (1, 3, 10, 100, 1000):
+        results.append((f"{levels} levels", bench_broker(num, levels)))
+
+    for name, elapsed in results:
+        print(f"{name:>12}: {elapsed:.3f}s ({num / elapsed:,.0f} msg/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Measures how fast a single thread receives messages from many StubBroker
+queues with wait_any, compared with one thread per queue.
+
+Usage: python benchmarks/bench_wait_any.py [-n MESSAGES]
+    [-q QUEUES [QUEUES ...]]
+"""
+
+import argparse
+import random
+import threading
+import time
+
+from rolecraft.broker import HeaderBytesRawMessage, StubBroker, wait_any
+
+
+def produce(broker: StubBroker, queue_names: list[str], num: int):
+    rng = random.Random(0)
+    for _ in range(num):
+        queue_name = rng.choice(queue_names)
+        broker.enqueue(queue_name, HeaderBytesRawMessage(data=b"x"))
+
+
+def bench_wait_any(queue_num: int, num: int) -> float:
+    broker = StubBroker()
+    queue_names = [f"queue{i}" for i in range(queue_num)]
+    futures = {
+        broker.block_receive(name, max_number=10): name for name in queue_names
+    }
+    producer = threading.Thread(
+        target=produce, args=(broker, queue_names, num)
+    )
+
+    start = time.perf_counter()
+    producer.start()
+    received = 0
+    while received < num:
+        for future, msgs in wait_any(futures, timeout=5).items():
+            name = futures.pop(future)
+            broker.ack_many(msgs, name)
+            received += len(msgs)
+            futures[broker.block_receive(name, max_number=10)] = name
+    elapsed = time.perf_counter() - start
+    producer.join()
+
+    for future in futures:
+        future.cancel()
+    return elapsed
+
+
+def bench_threads(queue_num: int, num: int) -> float:
+    broker = StubBroker()
+    queue_names = [f"queue{i}" for i in range(queue_num)]
+    lock = threading.Lock()
+    received = 0
+    all_received = threading.Event()
+    futures = {}
+
+    def consume(name):
+        nonlocal received
+        while not all_received.is_set():
+            future = broker.block_receive(name, max_number=10)
+            with lock:
+                if all_received.is_set():
+                    return
+                futures[name] = future
+            msgs = future.result()
+            broker.ack_many(msgs, name)
+            with lock:
+                received += len(msgs)
+                if received >= num:
+                    all_received.set()
+                    for future in futures.values():
+                        future.cancel()
+
+    consumers = [
+        threading.Thread(target=consume, args=(name,)) for name in queue_names
+    ]
+    for t in consumers:
+        t.start()
+    producer = threading.Thread(
+        target=produce, args=(broker, queue_names, num)
+    )
+
+    start = time.perf_counter()
+    producer.start()
+    all_received.wait()
+    elapsed = time.perf_counter() - start
+    producer.join()
+    for t in consumers:
+        t.join()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--messages", type=int, default=20_000)
+    parser.add_argument(
+        "-q", "--queues", type=int, nargs="+", default=[1, 10, 100, 1000]
+    )
+    args = parser.parse_args()
+
+    for queue_num in args.queues:
+        for name, bench in (
+            ("wait_any", bench_wait_any),
+            ("threads", bench_threads),
+        ):
+            elapsed = bench(queue_num, args.messages)
+            print(
+                f"{queue_num:>5} queues, {name:>8}: {elapsed:.3f}s "
+                f"({args.messages / elapsed:,.0f} msg/s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -7,8 +7,16 @@ from .error import (
     QueueNotFound,
     RecoverableError,
 )
+from .log_broker import LogBroker
 from .raw_message import BytesRawMessage, HeaderBytesRawMessage, RawMessage
-from .receive_future import ProvidedReceiveFuture, ReceiveFuture
+from .receive_future import (
+    Notifier,
+    ProvidedReceiveFuture,
+    ReceiveFuture,
+    as_completed,
+    wait_any,
+)
+from .sqlite_broker import SqliteBroker
 from .stub_broker import StubBroker
 
 __all__ = [
@@ -18,6 +26,8 @@ __all__ = [
     "BytesRawMessage",
     "HeaderBytesRawMessage",
     "StubBroker",
+    "SqliteBroker",
+    "LogBroker",
     "BrokerError",
     "RecoverableError",
     "IrrecoverableError",
@@ -26,4 +36,7 @@ __all__ = [
     "QueueNotFound",
     "RawMessage",
     "ProvidedReceiveFuture",
+    "Notifier",
+    "wait_any",
+    "as_completed",
 ]
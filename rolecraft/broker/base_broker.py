@@ -11,13 +11,38 @@ class BaseBroker(Broker[HeaderBytesRawMessage]):
         delay_millis: int = 0,
         exception: Exception | None = None,
     ) -> str:
-        self.ack(message, queue_name)
+        # The message may have been received with only part of its headers
+        headers = self._stored_headers(message, queue_name)
+        headers.update(message.headers)
+        options = {}
+        priority = self._stored_priority(message, queue_name)
+        if priority is not None:
+            options["priority"] = priority
 
         # update retries header
-        retries = int(message.headers.get("retries") or 0)
-        headers = message.headers.copy()
+        retries = int(headers.get("retries") or 0)
         headers["retries"] = retries + 1
 
-        # enqueue a new message
+        # enqueue a new message before acking the old one, so a crash in
+        # between delivers the message twice instead of losing it
         new_message = message.replace(id="", headers=headers)
-        return self.enqueue(queue_name, new_message, delay_millis=delay_millis)
+        new_id = self.enqueue(
+            queue_name, new_message, delay_millis=delay_millis, **options
+        )
+        self.ack(message, queue_name)
+        return new_id
+
+    def _stored_headers(
+        self, message: HeaderBytesRawMessage, queue_name: str
+    ) -> dict[str, str | int | float]:
+        """Returns a copy of all the headers of the message in processing.
+        Brokers supporting header projection should override it."""
+        return message.headers.copy()
+
+    def _stored_priority(
+        self, message: HeaderBytesRawMessage, queue_name: str
+    ) -> int | None:
+        """Returns the priority of the message in processing, which the
+        retried message keeps, or None for the default one. Brokers
+        supporting priorities should override it."""
+        return None
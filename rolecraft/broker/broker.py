@@ -1,6 +1,7 @@
 import abc
 from abc import abstractmethod
-from typing import TypedDict
+from collections.abc import Sequence
+from typing import TypedDict, Unpack
 
 from .receive_future import ReceiveFuture
 
@@ -23,8 +24,34 @@ class Broker[Message](abc.ABC):
         auto_create_queue: bool = False,
         **kwargs,
     ) -> str:
+        """Enqueues the message. Messages with a larger priority are
+        delivered first if the broker supports priorities.
+
+        A message id, if set, must not be used by another message of the
+        broker. Brokers may reject a duplicate id with BrokerError.
+
+        Returns: the message id.
+        """
         raise NotImplementedError
 
+    def enqueue_many(
+        self,
+        queue_name: str,
+        messages: Sequence[Message],
+        **options: Unpack[EnqueueOptions],
+    ) -> list[str]:
+        """Enqueues the messages with the same options.
+
+        The default implementation enqueues them one by one. Brokers should
+        override it if they can enqueue a batch in one go.
+
+        Returns: the message ids in the same order as the messages.
+        """
+        return [
+            self.enqueue(queue_name, message, **options)
+            for message in messages
+        ]
+
     @abstractmethod
     def block_receive(
         self,
@@ -35,6 +62,13 @@ class Broker[Message](abc.ABC):
         header_keys: list[str] | None = None,
         **kwargs,
     ) -> ReceiveFuture[list[Message]]:
+        """Receives at most `max_number` messages, waiting for them for at
+        most `wait_time_seconds`, or forever if it is None.
+
+        If `header_keys` is not None, the messages are received with only
+        the headers of these keys. Retrying such a message keeps the headers
+        not received.
+        """
         raise NotImplementedError
 
     def receive(
@@ -95,6 +129,51 @@ class Broker[Message](abc.ABC):
         """
         raise NotImplementedError
 
+    def ack_many(
+        self,
+        messages: Sequence[Message],
+        queue_name: str | None = None,
+        *,
+        results: Sequence | None = None,
+    ):
+        """Marks the messages as completed successfully. The results, if any,
+        are paired with the messages by position.
+
+        The default implementation acks them one by one. If the operation
+        fails, raises errors.
+        """
+        if results is None:
+            results = [None] * len(messages)
+        for message, result in zip(messages, results, strict=True):
+            self.ack(message, queue_name, result=result)
+
+    def nack_many(
+        self,
+        messages: Sequence[Message],
+        queue_name: str | None = None,
+        *,
+        exceptions: Sequence[Exception],
+    ):
+        """Marks the messages as permanently failed. The exceptions are paired
+        with the messages by position.
+
+        The default implementation nacks them one by one. If the operation
+        fails, raises errors.
+        """
+        for message, exception in zip(messages, exceptions, strict=True):
+            self.nack(message, queue_name, exception=exception)
+
+    def requeue_many(
+        self, messages: Sequence[Message], queue_name: str | None = None
+    ):
+        """Requeue the messages.
+
+        The default implementation requeues them one by one. If the operation
+        fails, raises errors.
+        """
+        for message in messages:
+            self.requeue(message, queue_name)
+
     @abstractmethod
     def retry(
         self,
@@ -110,6 +189,22 @@ class Broker[Message](abc.ABC):
         """
         raise NotImplementedError
 
+    def extend_visibility(
+        self,
+        message: Message,
+        queue_name: str | None = None,
+        *,
+        seconds: float,
+    ):
+        """Keeps the message invisible to the other consumers for another
+        `seconds` from now, so that a long-running handling doesn't lose it to
+        the redelivery of the expired messages.
+
+        If the message is not in processing, e.g. its visibility timeout has
+        expired, raises MessageNotFound.
+        """
+        raise NotImplementedError
+
     def close(self):
         pass
 
@@ -0,0 +1,563 @@
+import contextlib
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from collections.abc import Iterator, Sequence
+
+from . import error as _error
+from . import stub_broker as _stub_broker
+from .base_broker import BaseBroker
+from .raw_message import HeaderBytesRawMessage
+from .receive_future import ReceiveFuture
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_PRIORITY = 50
+
+# magic, id length, headers length, data length, priority, ready time
+_RECORD_HEADER = struct.Struct("!BxHIIid")
+_RECORD_MAGIC = 0xA5
+_ACK_ENTRY = struct.Struct("!I")
+
+_SEGMENT_SUFFIX = ".log"
+_ACK_SUFFIX = ".ack"
+_TMP_SUFFIX = ".tmp"
+
+
+class _Segment:
+    """A preallocated segment file, written and read through mmap.
+
+    A record's body is written before its header, so a record whose header
+    hasn't been written, e.g. the process crashed in between, is not a valid
+    record and ends the segment.
+
+    The indexes of the acked records are appended to the `.ack` file next to
+    the segment and kept in a bitmap.
+    """
+
+    def __init__(self, path: str, *, sync: bool = False) -> None:
+        self.path = path
+        self.ack_path = path.removesuffix(_SEGMENT_SUFFIX) + _ACK_SUFFIX
+        self.sync = sync
+        # A sealed segment doesn't accept new records
+        self.sealed = False
+
+        with open(path, "r+b") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0)
+        self._view = memoryview(self._mmap)
+        self.write_offset = 0
+        self.record_num = 0
+
+        self._acked = bytearray()
+        self.acked_num = 0
+        # The segment is unmapped if the acks can't be loaded
+        with contextlib.ExitStack() as stack:
+            stack.callback(self._mmap.close)
+            stack.callback(self._view.release)
+            self._load_acks()
+            self._ack_file = stack.enter_context(
+                open(self.ack_path, "ab", buffering=0)
+            )
+            stack.pop_all()
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path!r})"
+
+    @classmethod
+    def create(cls, path: str, size: int, *, sync: bool = False):
+        # Preallocated under a temporary name, so a crash doesn't leave an
+        # empty segment, which can't be mapped
+        tmp_path = path + _TMP_SUFFIX
+        with open(tmp_path, "xb") as f:
+            f.truncate(size)
+            if sync:
+                os.fsync(f.fileno())
+        os.rename(tmp_path, path)
+        return cls(path, sync=sync)
+
+    @property
+    def done(self) -> bool:
+        """All records of a sealed segment are acked."""
+        return self.sealed and self.acked_num == self.record_num
+
+    def _load_acks(self):
+        if not os.path.exists(self.ack_path):
+            return
+        with open(self.ack_path, "rb") as f:
+            data = f.read()
+        # A partially written entry at the end is ignored
+        end = len(data) - len(data) % _ACK_ENTRY.size
+        for (index,) in _ACK_ENTRY.iter_unpack(data[:end]):
+            self._set_acked(index)
+
+    def _set_acked(self, index: int) -> bool:
+        byte, bit = index >> 3, 1 << (index & 7)
+        if byte >= len(self._acked):
+            self._acked.extend(bytes(byte - len(self._acked) + 1))
+        if self._acked[byte] & bit:
+            return False
+        self._acked[byte] |= bit
+        self.acked_num += 1
+        return True
+
+    def is_acked(self, index: int) -> bool:
+        byte = index >> 3
+        return byte < len(self._acked) and bool(
+            self._acked[byte] & (1 << (index & 7))
+        )
+
+    def scan(
+        self,
+    ) -> Iterator[tuple[int, str, dict, memoryview, int, float]]:
+        """Yields the records as (index, id, headers, data, priority, ready
+        time) and moves the write offset to the end of the last record."""
+        view = self._view
+        offset = 0
+        while offset + _RECORD_HEADER.size <= len(view):
+            (
+                magic,
+                id_len,
+                headers_len,
+                data_len,
+                priority,
+                ready_at,
+            ) = _RECORD_HEADER.unpack_from(view, offset)
+            if magic != _RECORD_MAGIC:
+                break
+            id_start = offset + _RECORD_HEADER.size
+            headers_start = id_start + id_len
+            data_start = headers_start + headers_len
+            end = data_start + data_len
+            if end > len(view):
+                break
+
+            index = self.record_num
+            self.record_num += 1
+            self.write_offset = end
+            yield (
+                index,
+                str(view[id_start:headers_start], "utf-8"),
+                json.loads(str(view[headers_start:data_start], "utf-8")),
+                view[data_start:end].toreadonly(),
+                priority,
+                ready_at,
+            )
+            offset = end
+
+    def append(
+        self,
+        msg_id: bytes,
+        headers: bytes,
+        data: bytes,
+        priority: int,
+        ready_at: float,
+    ) -> tuple[int, memoryview] | None:
+        """Returns the record index and the view of the data, or None if the
+        segment doesn't have enough space."""
+        data_len = memoryview(data).nbytes
+        id_start = self.write_offset + _RECORD_HEADER.size
+        headers_start = id_start + len(msg_id)
+        data_start = headers_start + len(headers)
+        end = data_start + data_len
+        if self.sealed or end > len(self._view):
+            return None
+
+        view = self._view
+        view[id_start:headers_start] = msg_id
+        view[headers_start:data_start] = headers
+        view[data_start:end] = data
+        _RECORD_HEADER.pack_into(
+            view,
+            self.write_offset,
+            _RECORD_MAGIC,
+            len(msg_id),
+            len(headers),
+            data_len,
+            priority,
+            ready_at,
+        )
+        if self.sync:
+            self._mmap.flush()
+
+        index = self.record_num
+        self.record_num += 1
+        self.write_offset = end
+        return index, view[data_start:end].toreadonly()
+
+    def ack(self, indexes: Sequence[int]):
+        newly_acked = [index for index in indexes if self._set_acked(index)]
+        if not newly_acked:
+            return
+        self._ack_file.write(
+            b"".join(_ACK_ENTRY.pack(index) for index in newly_acked)
+        )
+        if self.sync:
+            os.fsync(self._ack_file.fileno())
+
+    def close(self):
+        self._ack_file.close()
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # The received messages still refer to the map. It is unmapped
+            # once they are released.
+            pass
+
+    def delete(self):
+        self.close()
+        os.remove(self.path)
+        os.remove(self.ack_path)
+
+
+class _LogQueue:
+    """Persists the messages of a queue in the segments, while the stub queue
+    holds them in memory for delivery."""
+
+    def __init__(
+        self, directory: str, *, segment_size: int, sync: bool
+    ) -> None:
+        self.directory = directory
+        self.segment_size = segment_size
+        self.sync = sync
+
+        # Only the ready, delayed and in-flight messages are kept in memory,
+        # and their data refers to the mapped segments. The private queue of
+        # the stub broker is reused on purpose, to share its delivery logic.
+        self.queue = _stub_broker._Queue()
+        self._lock = threading.Lock()
+        self._segments: list[_Segment] = []
+        # message id -> (segment, record index)
+        self._locations: dict[str, tuple[_Segment, int]] = {}
+        self._closed = False
+
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+        self._active = self._new_segment(0)
+
+    def _segment_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"{number:020d}{_SEGMENT_SUFFIX}")
+
+    def _new_segment(self, min_size: int) -> _Segment:
+        number = 0
+        if self._segments:
+            last = os.path.basename(self._segments[-1].path)
+            number = int(last.removesuffix(_SEGMENT_SUFFIX)) + 1
+        segment = _Segment.create(
+            self._segment_path(number),
+            max(self.segment_size, min_size),
+            sync=self.sync,
+        )
+        self._segments.append(segment)
+        return segment
+
+    def _recover(self):
+        names = []
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(_SEGMENT_SUFFIX + _TMP_SUFFIX):
+                # A segment whose creation was interrupted
+                os.remove(os.path.join(self.directory, name))
+            elif name.endswith(_SEGMENT_SUFFIX):
+                names.append(name)
+        now = time.time()
+        for name in names:
+            segment = _Segment(
+                os.path.join(self.directory, name), sync=self.sync
+            )
+            # A new segment is always started, as the tail of the last one
+            # may be torn.
+            segment.sealed = True
+            self._segments.append(segment)
+
+            for (
+                index,
+                msg_id,
+                headers,
+                data,
+                priority,
+                ready_at,
+            ) in segment.scan():
+                if segment.is_acked(index):
+                    continue
+                msg = HeaderBytesRawMessage(
+                    id=msg_id, data=data, headers=headers
+                )
+                self._locations[msg_id] = (segment, index)
+                self.queue.enqueue(
+                    msg,
+                    priority=priority,
+                    delay_millis=max(int((ready_at - now) * 1000), 0),
+                )
+
+            if segment.done:
+                self._delete_segment(segment)
+
+        if self._locations:
+            logger.info(
+                "Recovered %i messages from %s",
+                len(self._locations),
+                self.directory,
+            )
+
+    def _delete_segment(self, segment: _Segment):
+        self._segments.remove(segment)
+        segment.delete()
+
+    def _check_closed(self):
+        if self._closed:
+            raise _error.BrokerError(f"Queue {self.directory} has closed")
+
+    def enqueue_many(
+        self,
+        msgs: Sequence[HeaderBytesRawMessage],
+        *,
+        priority: int = _DEFAULT_PRIORITY,
+        delay_millis: int = 0,
+        **options,
+    ) -> list[str]:
+        ready_at = time.time()
+        if delay_millis and delay_millis > 0:
+            ready_at += delay_millis / 1000
+
+        with self._lock:
+            self._check_closed()
+            mapped_msgs = []
+            for msg in msgs:
+                if not msg.id:
+                    msg.id = uuid.uuid4().hex
+                mapped_msgs.append(self._append(msg, priority, ready_at))
+
+            # enqueue with the lock held to keep the order of the log
+            self.queue.enqueue_many(
+                mapped_msgs, priority=priority, delay_millis=delay_millis
+            )
+        return [msg.id for msg in msgs]
+
+    def _append(
+        self, msg: HeaderBytesRawMessage, priority: int, ready_at: float
+    ) -> HeaderBytesRawMessage:
+        """It should be called with the lock held."""
+        msg_id = msg.id.encode()
+        headers = json.dumps(msg.headers).encode()
+        rv = self._active.append(msg_id, headers, msg.data, priority, ready_at)
+        if rv is None:
+            self._active.sealed = True
+            if self._active.done:
+                self._delete_segment(self._active)
+            self._active = self._new_segment(
+                _RECORD_HEADER.size
+                + len(msg_id)
+                + len(headers)
+                + memoryview(msg.data).nbytes
+            )
+            rv = self._active.append(
+                msg_id, headers, msg.data, priority, ready_at
+            )
+            assert rv is not None
+
+        index, data = rv
+        self._locations[msg.id] = (self._active, index)
+        return HeaderBytesRawMessage(
+            id=msg.id, data=data, headers=msg.headers.copy()
+        )
+
+    def ack_many(self, msgs: Sequence[HeaderBytesRawMessage]):
+        self.queue.ack_many(msgs)
+
+        with self._lock:
+            self._check_closed()
+            indexes_by_segment: dict[_Segment, list[int]] = {}
+            for msg in msgs:
+                segment, index = self._locations.pop(msg.id)
+                indexes_by_segment.setdefault(segment, []).append(index)
+
+            for segment, indexes in indexes_by_segment.items():
+                segment.ack(indexes)
+                if segment.done:
+                    self._delete_segment(segment)
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for segment in self._segments:
+                segment.close()
+
+
+class LogBroker(BaseBroker):
+    """A durable broker storing each queue in append-only segment files under
+    `directory/<queue name>/`.
+
+    Segments are preallocated with `segment_size_bytes` and mapped into
+    memory. Only an index of the unacked messages is kept in memory: the data
+    of a received message is a read-only `memoryview` of the mapped segment
+    instead of a copy. A segment is deleted once all of its messages are
+    acked.
+
+    Written messages survive a crash of the process. With `sync`, every
+    write is flushed to the disk before returning, which makes them survive
+    a crash of the system as well.
+
+    Requeueing is not persisted: the unacked messages, including the ones in
+    processing, are delivered again after a restart.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        *,
+        segment_size_bytes: int = 64 * 1024 * 1024,
+        sync: bool = False,
+    ) -> None:
+        if segment_size_bytes <= 0:
+            raise ValueError("segment size should be greater than 0")
+
+        self.directory = directory
+        self.segment_size_bytes = segment_size_bytes
+        self.sync = sync
+
+        self._lock = threading.Lock()
+        self._queues: dict[str, _LogQueue] = {}
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.directory!r})"
+
+    def _queue(self, queue_name: str) -> _LogQueue:
+        if queue := self._queues.get(queue_name):
+            return queue
+
+        if not queue_name or os.sep in queue_name or queue_name in ("..", "."):
+            raise ValueError(f"Invalid queue name: {queue_name!r}")
+
+        with self._lock:
+            if (queue := self._queues.get(queue_name)) is None:
+                queue = self._queues[queue_name] = _LogQueue(
+                    os.path.join(self.directory, queue_name),
+                    segment_size=self.segment_size_bytes,
+                    sync=self.sync,
+                )
+        return queue
+
+    def enqueue(
+        self,
+        queue_name: str,
+        message: HeaderBytesRawMessage,
+        **options,
+    ) -> str:
+        return self._queue(queue_name).enqueue_many([message], **options)[0]
+
+    def enqueue_many(
+        self,
+        queue_name: str,
+        messages: Sequence[HeaderBytesRawMessage],
+        **options,
+    ) -> list[str]:
+        return self._queue(queue_name).enqueue_many(messages, **options)
+
+    def block_receive(
+        self,
+        queue_name: str,
+        *,
+        max_number: int = 1,
+        wait_time_seconds: float | None = None,
+        header_keys: list[str] | None = None,
+    ) -> ReceiveFuture[list[HeaderBytesRawMessage]]:
+        queue = self._queue(queue_name).queue
+        proxy = queue.receive(max_number, wait_time_seconds)
+        # Deliberately shared with the stub broker, like its queue
+        return _stub_broker._receive_future(proxy, header_keys)
+
+    def qsize(self, queue_name: str) -> int:
+        return len(self._queue(queue_name).queue)
+
+    def ack(
+        self,
+        message: HeaderBytesRawMessage,
+        queue_name: str,
+        *,
+        result=None,
+    ):
+        return self._queue(queue_name).ack_many([message])
+
+    def nack(
+        self,
+        message: HeaderBytesRawMessage,
+        queue_name: str,
+        *,
+        exception: Exception,
+    ):
+        return self._queue(queue_name).ack_many([message])
+
+    def requeue(self, message: HeaderBytesRawMessage, queue_name: str):
+        return self._queue(queue_name).queue.requeue(message)
+
+    def _stored_headers(
+        self, message: HeaderBytesRawMessage, queue_name: str
+    ) -> dict[str, str | int | float]:
+        queue = self._queue(queue_name).queue
+        return queue.processing_message(message.id).headers.copy()
+
+    def _stored_priority(
+        self, message: HeaderBytesRawMessage, queue_name: str
+    ) -> int | None:
+        return self._queue(queue_name).queue.processing_priority(message.id)
+
+    def ack_many(
+        self,
+        messages: Sequence[HeaderBytesRawMessage],
+        queue_name: str,
+        *,
+        results: Sequence | None = None,
+    ):
+        return self._queue(queue_name).ack_many(messages)
+
+    def nack_many(
+        self,
+        messages: Sequence[HeaderBytesRawMessage],
+        queue_name: str,
+        *,
+        exceptions: Sequence[Exception],
+    ):
+        return self._queue(queue_name).ack_many(messages)
+
+    def requeue_many(
+        self, messages: Sequence[HeaderBytesRawMessage], queue_name: str
+    ):
+        return self._queue(queue_name).queue.requeue_many(messages)
+
+    def extend_visibility(
+        self,
+        message: HeaderBytesRawMessage,
+        queue_name: str,
+        *,
+        seconds: float,
+    ):
+        queue = self._queue(queue_name).queue
+        return queue.extend_visibility(message, seconds)
+
+    def prepare_queue(
+        self,
+        queue_name: str,
+        *,
+        visibility_timeout_seconds: float | None = None,
+        **kwds,
+    ):
+        """Arguments:
+        visibility_timeout_seconds: if it is set, the received messages which
+            are neither acked nor requeued within it are redelivered.
+        """
+        queue = self._queue(queue_name)
+        if visibility_timeout_seconds is not None:
+            queue.queue.visibility_timeout = visibility_timeout_seconds
+
+    def close(self):
+        with self._lock:
+            queues = list(self._queues.values())
+        for queue in queues:
+            queue.close()
@@ -1,4 +1,5 @@
 import dataclasses
+from collections.abc import Collection
 from typing import Self
 
 
@@ -23,3 +24,12 @@ class HeaderBytesRawMessage(BytesRawMessage):
 
     def replace(self, **kwds) -> Self:
         return dataclasses.replace(self, **kwds)
+
+    def project(self, header_keys: Collection[str]) -> Self:
+        """A copy with only the headers of the keys"""
+        headers = self.headers
+        return self.replace(
+            headers={
+                key: headers[key] for key in header_keys if key in headers
+            }
+        )
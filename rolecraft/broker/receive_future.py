@@ -1,6 +1,44 @@
 import abc
+import threading
+import time
 from abc import abstractmethod
-from collections.abc import Callable, Hashable
+from collections.abc import Callable, Hashable, Iterable, Iterator
+
+
+class Notifier:
+    """Wakes up `wait_any` when one of the futures may have completed.
+
+    A future can also ask to be checked again at a time, e.g. when its wait
+    time is up, as nothing else would wake up the waiting thread.
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._due: float | None = None
+
+    def notify(self):
+        self._event.set()
+
+    def wake_at(self, due: float):
+        """`due` is a time of `time.monotonic()`."""
+        with self._lock:
+            if self._due is None or due < self._due:
+                self._due = due
+
+    def clear(self):
+        with self._lock:
+            self._due = None
+            self._event.clear()
+
+    def wait(self, deadline: float | None = None):
+        with self._lock:
+            due = self._due
+        if deadline is None or (due is not None and due < deadline):
+            deadline = due
+        timeout = None if deadline is None else deadline - time.monotonic()
+        if timeout is None or timeout > 0:
+            self._event.wait(timeout)
 
 
 class ReceiveFuture[R](abc.ABC, Hashable):
@@ -13,6 +51,23 @@ class ReceiveFuture[R](abc.ABC, Hashable):
     def cancel(self):
         raise NotImplementedError
 
+    def try_result(self) -> R | None:
+        """Returns the result if the future has completed, otherwise None. It
+        doesn't block."""
+        return None
+
+    def add_notifier(self, notifier: Notifier) -> bool:
+        """Notifies the notifier when the future may have completed, so that
+        `try_result()` should be called again.
+
+        Returns False if it is not supported, and then `result()` has to be
+        called to wait for it.
+        """
+        return False
+
+    def remove_notifier(self, notifier: Notifier):
+        pass
+
     def transform[T](
         self, transformer: Callable[[R], T]
     ) -> "ReceiveFuture[T]":
@@ -35,6 +90,16 @@ class TransformerReceiveFuture[R, O](ReceiveFuture[O]):
     def cancel(self):
         return self.future.cancel()
 
+    def try_result(self) -> O | None:
+        rv = self.future.try_result()
+        return None if rv is None else self.transformer(rv)
+
+    def add_notifier(self, notifier: Notifier) -> bool:
+        return self.future.add_notifier(notifier)
+
+    def remove_notifier(self, notifier: Notifier):
+        return self.future.remove_notifier(notifier)
+
     def __hash__(self) -> int:
         return hash(self.future)
 
@@ -48,3 +113,98 @@ class ProvidedReceiveFuture[R](ReceiveFuture[R]):
 
     def cancel(self):
         return
+
+    def try_result(self) -> R | None:
+        return self._result
+
+    def add_notifier(self, notifier: Notifier) -> bool:
+        return True
+
+
+def wait_any[R](
+    futures: Iterable[ReceiveFuture[R]], timeout: float | None = None
+) -> dict[ReceiveFuture[R], R]:
+    """Waits until any of the futures completes, or the timeout. Returns the
+    completed futures with their results.
+
+    The futures supporting notifiers are waited for by the calling thread,
+    and the ones not completed are left pending: they can be waited again,
+    or cancelled and then their results should still be taken, as messages
+    may have been received before the cancellation.
+
+    The other futures are waited for in helper threads. Before returning,
+    the ones not completed are cancelled and joined, and their results are
+    returned as well, so that no message is dropped.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    notifier = Notifier()
+    notifiable: list[ReceiveFuture[R]] = []
+    others: list[ReceiveFuture[R]] = []
+    for future in futures:
+        if future.add_notifier(notifier):
+            notifiable.append(future)
+        else:
+            others.append(future)
+
+    lock = threading.Lock()
+    done: dict[ReceiveFuture[R], R] = {}
+
+    def wait(future: ReceiveFuture[R]):
+        rv = future.result()
+        with lock:
+            done[future] = rv
+        notifier.notify()
+
+    threads = [
+        threading.Thread(target=wait, args=(future,), name="wait_any")
+        for future in others
+    ]
+    for thread in threads:
+        thread.start()
+
+    try:
+        while True:
+            notifier.clear()
+            for future in notifiable:
+                if (rv := future.try_result()) is not None:
+                    with lock:
+                        done[future] = rv
+            with lock:
+                if done:
+                    break
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            notifier.wait(deadline)
+    finally:
+        for future in notifiable:
+            future.remove_notifier(notifier)
+        for future, thread in zip(others, threads):
+            if thread.is_alive():
+                future.cancel()
+        for thread in threads:
+            thread.join()
+
+    return done
+
+
+def as_completed[R](
+    futures: Iterable[ReceiveFuture[R]], timeout: float | None = None
+) -> Iterator[tuple[ReceiveFuture[R], R]]:
+    """Yields the futures with their results as they complete, until all of
+    them have completed or the timeout.
+
+    Like `wait_any`, the futures not supporting notifiers are completed by
+    cancellation whenever a future completes, so they are better not mixed
+    with the others.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    pending = set(futures)
+    while pending:
+        remaining = None
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+        for future, rv in wait_any(pending, remaining).items():
+            pending.discard(future)
+            yield future, rv
@@ -0,0 +1,538 @@
+import collections
+import dataclasses
+import functools
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections.abc import Callable, Collection, Sequence
+from typing import Any
+
+from . import error as _error
+from .base_broker import BaseBroker
+from .raw_message import HeaderBytesRawMessage
+from .receive_future import ReceiveFuture
+
+logger = logging.getLogger(__name__)
+
+_READY = 0
+_PROCESSING = 1
+_DELAYED = 2
+
+_DEFAULT_PRIORITY = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rolecraft_messages (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    queue TEXT NOT NULL,
+    state INTEGER NOT NULL,
+    priority INTEGER NOT NULL,
+    ready_at REAL NOT NULL,
+    headers TEXT NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rolecraft_messages_priority
+    ON rolecraft_messages (queue, state, priority DESC, seq);
+CREATE INDEX IF NOT EXISTS rolecraft_messages_ready_at
+    ON rolecraft_messages (queue, state, ready_at);
+"""
+
+
+# The errors of an operation, which only fail the operation itself
+_OPERATION_ERRORS = (
+    sqlite3.Error,
+    _error.BrokerError,
+    _error.RecoverableError,
+    _error.IrrecoverableError,
+)
+
+
+def _load_headers(
+    headers: str, header_keys: Collection[str] | None
+) -> dict[str, str | int | float]:
+    loaded = json.loads(headers)
+    if header_keys is None:
+        return loaded
+    return {key: loaded[key] for key in header_keys if key in loaded}
+
+
+@dataclasses.dataclass
+class _Operation:
+    fn: Callable[[sqlite3.Connection], Any]
+    result: Any = None
+    error: Exception | None = None
+    done: bool = False
+
+
+@dataclasses.dataclass
+class _QueueSignal:
+    """Wakes up the local waiters of a queue when it is changed."""
+
+    condition: threading.Condition = dataclasses.field(
+        default_factory=threading.Condition
+    )
+    version: int = 0
+
+    def notify(self, n: int | None = None):
+        with self.condition:
+            self.version += 1
+            if n is None:
+                self.condition.notify_all()
+            else:
+                self.condition.notify(n)
+
+
+class _ReceiveFuture(ReceiveFuture[list[HeaderBytesRawMessage]]):
+    def __init__(
+        self,
+        broker: "SqliteBroker",
+        queue_name: str,
+        max_number: int,
+        wait_time_seconds: float | None,
+        header_keys: Collection[str] | None = None,
+    ) -> None:
+        self.broker = broker
+        self.queue_name = queue_name
+        self.max_number = max_number
+        self.wait_time_seconds = wait_time_seconds
+        self.header_keys = header_keys
+        self.cancelled = False
+
+    def result(self) -> list[HeaderBytesRawMessage]:
+        return self.broker._block_receive(self)
+
+    def cancel(self):
+        self.cancelled = True
+        self.broker._signal(self.queue_name).notify()
+
+
+class SqliteBroker(BaseBroker):
+    """A durable broker storing messages in a SQLite database in WAL mode.
+
+    Concurrent writes are committed together (group commit): while one
+    thread is committing, the operations of the other threads are queued and
+    then committed by the next thread in a single transaction.
+
+    Waiters in the same process are woken up when messages are enqueued or
+    become due. Messages written by other processes are picked up within
+    `poll_interval_seconds`.
+
+    The messages left in processing, e.g. by a crashed process, are made
+    ready again when the database is opened. `recover_processing` should be
+    disabled if several processes share the database, as the messages being
+    processed by the others would be delivered twice.
+
+    The id of an enqueued message must not be used by any message in the
+    database, otherwise BrokerError is raised.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        synchronous: str = "NORMAL",
+        busy_timeout_millis: int = 5000,
+        poll_interval_seconds: float | None = 1.0,
+        recover_processing: bool = True,
+    ) -> None:
+        self.path = path
+        self.poll_interval_seconds = poll_interval_seconds
+
+        self._conn = sqlite3.connect(
+            path, isolation_level=None, check_same_thread=False
+        )
+        self._conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_millis)}")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute(f"PRAGMA synchronous = {synchronous}")
+        self._conn.executescript(_SCHEMA)
+        if recover_processing:
+            cursor = self._conn.execute(
+                "UPDATE rolecraft_messages SET state = ? WHERE state = ?",
+                (_READY, _PROCESSING),
+            )
+            if cursor.rowcount:
+                logger.info(
+                    "Recovered %i messages in processing from %s",
+                    cursor.rowcount,
+                    path,
+                )
+
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending: list[_Operation] = []
+
+        self._signals = collections.defaultdict[str, _QueueSignal](
+            _QueueSignal
+        )
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.path!r})"
+
+    # -- group commit --
+    def _execute[R](self, fn: Callable[[sqlite3.Connection], R]) -> R:
+        op = _Operation(fn)
+        with self._pending_lock:
+            self._pending.append(op)
+
+        with self._write_lock:
+            if not op.done:
+                with self._pending_lock:
+                    batch, self._pending = self._pending, []
+                self._commit(batch)
+
+        if op.error:
+            raise op.error
+        return op.result
+
+    def _commit(self, batch: list[_Operation]):
+        """Runs the operations in one transaction. Each operation is isolated
+        by a savepoint so that a failed one doesn't affect the others."""
+        conn = self._conn
+        committed = False
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for op in batch:
+                conn.execute("SAVEPOINT op")
+                try:
+                    op.result = op.fn(conn)
+                except _OPERATION_ERRORS as e:
+                    conn.execute("ROLLBACK TO op")
+                    op.error = self._convert_error(e)
+                conn.execute("RELEASE op")
+            conn.execute("COMMIT")
+            committed = True
+        except sqlite3.Error as e:
+            error = self._convert_error(e)
+            for op in batch:
+                op.result = None
+                op.error = error
+        finally:
+            if not committed:
+                # An unexpected error propagates to the committing thread,
+                # the other operations fail with the transaction
+                self._rollback()
+                for op in batch:
+                    if op.error is None:
+                        op.result = None
+                        op.error = _error.BrokerError("Transaction aborted")
+            for op in batch:
+                op.done = True
+
+    def _rollback(self):
+        try:
+            if self._conn.in_transaction:
+                self._conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+    def _convert_error(self, e: Exception) -> Exception:
+        if isinstance(e, sqlite3.OperationalError):
+            error = _error.RecoverableError(str(e))
+        elif isinstance(e, sqlite3.Error):
+            error = _error.BrokerError(str(e))
+        else:
+            return e
+        error.__cause__ = e
+        return error
+
+    def _signal(self, queue_name: str) -> _QueueSignal:
+        return self._signals[queue_name]
+
+    # -- Broker implementation --
+    def enqueue(
+        self,
+        queue_name: str,
+        message: HeaderBytesRawMessage,
+        **options,
+    ) -> str:
+        """A message id already used by another message of the database is
+        rejected with BrokerError."""
+        return self.enqueue_many(queue_name, [message], **options)[0]
+
+    def enqueue_many(
+        self,
+        queue_name: str,
+        messages: Sequence[HeaderBytesRawMessage],
+        *,
+        priority: int = _DEFAULT_PRIORITY,
+        delay_millis: int = 0,
+        **options,
+    ) -> list[str]:
+        now = time.time()
+        if delay_millis and delay_millis > 0:
+            state, ready_at = _DELAYED, now + delay_millis / 1000
+        else:
+            state, ready_at = _READY, now
+
+        rows = []
+        for message in messages:
+            rows.append(
+                (
+                    message.id or uuid.uuid4().hex,
+                    queue_name,
+                    state,
+                    priority,
+                    ready_at,
+                    json.dumps(message.headers),
+                    message.data,
+                )
+            )
+
+        def insert(conn: sqlite3.Connection):
+            try:
+                conn.executemany(
+                    "INSERT INTO rolecraft_messages"
+                    " (id, queue, state, priority, ready_at, headers, data)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+            except sqlite3.IntegrityError as e:
+                raise _error.BrokerError(f"Duplicate message id: {e}") from e
+
+        self._execute(insert)
+
+        ids = [row[0] for row in rows]
+        for message, msg_id in zip(messages, ids):
+            message.id = msg_id
+
+        signal = self._signal(queue_name)
+        if state == _READY:
+            signal.notify(len(ids))
+        else:
+            # let a waiter recompute its timeout for the new due time
+            signal.notify(1)
+        return ids
+
+    def block_receive(
+        self,
+        queue_name: str,
+        *,
+        max_number: int = 1,
+        wait_time_seconds: float | None = None,
+        header_keys: list[str] | None = None,
+    ) -> ReceiveFuture[list[HeaderBytesRawMessage]]:
+        return _ReceiveFuture(
+            self, queue_name, max_number, wait_time_seconds, header_keys
+        )
+
+    def _block_receive(
+        self, future: _ReceiveFuture
+    ) -> list[HeaderBytesRawMessage]:
+        deadline = (
+            None
+            if future.wait_time_seconds is None
+            else time.monotonic() + future.wait_time_seconds
+        )
+        signal = self._signal(future.queue_name)
+        receive = functools.partial(
+            self._receive,
+            future.queue_name,
+            future.max_number,
+            future.header_keys,
+        )
+
+        while not future.cancelled:
+            version = signal.version
+            msgs, next_ready_at = self._execute(receive)
+            if msgs:
+                return msgs
+
+            timeouts = []
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                timeouts.append(remaining)
+            if next_ready_at is not None:
+                timeouts.append(max(next_ready_at - time.time(), 0))
+            if self.poll_interval_seconds is not None:
+                timeouts.append(self.poll_interval_seconds)
+
+            with signal.condition:
+                if signal.version == version and not future.cancelled:
+                    signal.condition.wait(min(timeouts, default=None))
+
+        return []
+
+    def _receive(
+        self,
+        queue_name: str,
+        max_number: int,
+        header_keys: Collection[str] | None,
+        conn: sqlite3.Connection,
+    ) -> tuple[list[HeaderBytesRawMessage], float | None]:
+        """Returns the received messages and the ready time of the next
+        delayed message."""
+        conn.execute(
+            "UPDATE rolecraft_messages SET state = ?"
+            " WHERE queue = ? AND state = ? AND ready_at <= ?",
+            (_READY, queue_name, _DELAYED, time.time()),
+        )
+        rows = conn.execute(
+            "SELECT seq, id, headers, data FROM rolecraft_messages"
+            " WHERE queue = ? AND state = ?"
+            " ORDER BY priority DESC, seq LIMIT ?",
+            (queue_name, _READY, max_number),
+        ).fetchall()
+        if rows:
+            conn.executemany(
+                "UPDATE rolecraft_messages SET state = ? WHERE seq = ?",
+                [(_PROCESSING, row[0]) for row in rows],
+            )
+            return [
+                HeaderBytesRawMessage(
+                    id=msg_id,
+                    data=data,
+                    headers=_load_headers(headers, header_keys),
+                )
+                for _, msg_id, headers, data in rows
+            ], None
+
+        (next_ready_at,) = conn.execute(
+            "SELECT MIN(ready_at) FROM rolecraft_messages"
+            " WHERE queue = ? AND state = ?",
+            (queue_name, _DELAYED),
+        ).fetchone()
+        return [], next_ready_at
+
+    def qsize(self, queue_name: str) -> int:
+        def count(conn: sqlite3.Connection) -> int:
+            return conn.execute(
+                "SELECT COUNT(*) FROM rolecraft_messages WHERE queue = ?",
+                (queue_name,),
+            ).fetchone()[0]
+
+        return self._execute(count)
+
+    def _delete_processing(
+        self,
+        messages: Sequence[HeaderBytesRawMessage],
+        queue_name: str,
+        conn: sqlite3.Connection,
+    ):
+        cursor = conn.executemany(
+            "DELETE FROM rolecraft_messages"
+            " WHERE id = ? AND queue = ? AND state = ?",
+            [(message.id, queue_name, _PROCESSING) for message in messages],
+        )
+        if cursor.rowcount != len(messages):
+            raise _error.MessageNotFound
+
+    def ack(
+        self,
+        message: HeaderBytesRawMessage,
+        queue_name: str,
+        *,
+        result=None,
+    ):
+        return self.ack_many([message], queue_name)
+
+    def ack_many(
+        self,
+        messages: Sequence[HeaderBytesRawMessage],
+        queue_name: str,
+        *,
+        results: Sequence | None = None,
+    ):
+        self._execute(
+            functools.partial(self._delete_processing, messages, queue_name)
+        )
+
+    def nack(
+        self,
+        message: HeaderBytesRawMessage,
+        queue_name: str,
+        *,
+        exception: Exception,
+    ):
+        return self.ack_many([message], queue_name)
+
+    def nack_many(
+        self,
+        messages: Sequence[HeaderBytesRawMessage],
+        queue_name: str,
+        *,
+        exceptions: Sequence[Exception],
+    ):
+        return self.ack_many(messages, queue_name)
+
+    def requeue(self, message: HeaderBytesRawMessage, queue_name: str):
+        return self.requeue_many([message], queue_name)
+
+    def requeue_many(
+        self, messages: Sequence[HeaderBytesRawMessage], queue_name: str
+    ):
+        def requeue(conn: sqlite3.Connection):
+            cursor = conn.executemany(
+                "UPDATE rolecraft_messages SET state = ?, ready_at = ?"
+                " WHERE id = ? AND queue = ? AND state = ?",
+                [
+                    (_READY, now, message.id, queue_name, _PROCESSING)
+                    for message in messages
+                ],
+            )
+            if cursor.rowcount != len(messages):
+                raise _error.MessageNotFound
+
+        now = time.time()
+        self._execute(requeue)
+        self._signal(queue_name).notify(len(messages))
+
+    def retry(
+        self,
+        message: HeaderBytesRawMessage,
+        queue_name: str,
+        *,
+        delay_millis: int = 0,
+        exception: Exception | None = None,
+    ) -> str:
+        """Acks the message and enqueues a new one in the same transaction.
+        The new one has the stored headers updated with the ones of the
+        message, which may have been received with part of them."""
+        now = time.time()
+        if delay_millis and delay_millis > 0:
+            state, ready_at = _DELAYED, now + delay_millis / 1000
+        else:
+            state, ready_at = _READY, now
+        new_id = uuid.uuid4().hex
+
+        def retry(conn: sqlite3.Connection):
+            row = conn.execute(
+                "SELECT priority, headers FROM rolecraft_messages"
+                " WHERE id = ? AND queue = ? AND state = ?",
+                (message.id, queue_name, _PROCESSING),
+            ).fetchone()
+            if not row:
+                raise _error.MessageNotFound
+            headers = json.loads(row[1])
+            headers.update(message.headers)
+            headers["retries"] = int(headers.get("retries") or 0) + 1
+            self._delete_processing([message], queue_name, conn)
+            conn.execute(
+                "INSERT INTO rolecraft_messages"
+                " (id, queue, state, priority, ready_at, headers, data)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    new_id,
+                    queue_name,
+                    state,
+                    row[0],
+                    ready_at,
+                    json.dumps(headers),
+                    message.data,
+                ),
+            )
+
+        self._execute(retry)
+        self._signal(queue_name).notify(1)
+        return new_id
+
+    def close(self):
+        """Closes the database. The later operations raise BrokerError."""
+        with self._write_lock:
+            self._conn.close()
+        for signal in list(self._signals.values()):
+            signal.notify()
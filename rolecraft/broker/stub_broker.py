@@ -1,127 +1,468 @@
+import bisect
 import collections
 import dataclasses
+import functools
+import heapq
+import itertools
 import threading
+import time
 import uuid
 from collections import deque
+from collections.abc import Collection, Sequence
 
 from . import error as _error
 from .base_broker import BaseBroker
 from .raw_message import HeaderBytesRawMessage
-from .receive_future import ReceiveFuture
+from .receive_future import Notifier, ReceiveFuture
 
+_DEFAULT_PRIORITY = 50
 
-@dataclasses.dataclass
+
+class _PriorityDeque:
+    """Ready messages bucketed by priority. Messages with a larger priority
+    are popped first, and messages with the same priority are FIFO."""
+
+    def __init__(self) -> None:
+        self._buckets: dict[int, deque[HeaderBytesRawMessage]] = {}
+        # priorities of the non-empty buckets in ascending order
+        self._priorities: list[int] = []
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _bucket(self, priority: int) -> deque[HeaderBytesRawMessage]:
+        bucket = self._buckets.get(priority)
+        if bucket is None:
+            bucket = self._buckets[priority] = deque()
+            bisect.insort(self._priorities, priority)
+        return bucket
+
+    def append(self, msg: HeaderBytesRawMessage, priority: int):
+        self._bucket(priority).append(msg)
+        self._len += 1
+
+    def appendleft(self, msg: HeaderBytesRawMessage, priority: int):
+        self._bucket(priority).appendleft(msg)
+        self._len += 1
+
+    def extend(self, msgs: Sequence[HeaderBytesRawMessage], priority: int):
+        self._bucket(priority).extend(msgs)
+        self._len += len(msgs)
+
+    def popleft(self) -> tuple[HeaderBytesRawMessage, int]:
+        priority = self._priorities[-1]
+        bucket = self._buckets[priority]
+        msg = bucket.popleft()
+        if not bucket:
+            del self._buckets[priority]
+            self._priorities.pop()
+        self._len -= 1
+        return msg, priority
+
+
+@dataclasses.dataclass(eq=False)
 class _QueueWaitProxy:
     num: int
     wait_time_seconds: float | None
     queue: "_Queue"
-    event: threading.Event = dataclasses.field(default_factory=threading.Event)
+    # It is created only when the receiver has to wait
+    event: threading.Event | None = None
+    # The notifiers of wait_any, which are notified along with the event
+    notifiers: list[Notifier] = dataclasses.field(default_factory=list)
+    started: bool = False
+    deadline: float | None = None
     cancelled: bool = False
+    # The messages received. None if it is still waiting.
+    msgs: list[HeaderBytesRawMessage] | None = None
+    # The time of the timer that the waiter will wake up for
+    timer_due: float | None = None
 
-    def cancel(self):
-        self.cancelled = True
+    def wake(self):
+        assert self.event
         self.event.set()
+        for notifier in self.notifiers:
+            notifier.notify()
+
+    def cancel(self):
+        self.queue.cancel(self)
 
     def result(self) -> list[HeaderBytesRawMessage]:
         return self.queue.receive_with_proxy(self)
 
+    def try_result(self) -> list[HeaderBytesRawMessage] | None:
+        return self.queue.try_receive_with_proxy(self)
+
 
 @dataclasses.dataclass
 class _Queue:
-    _msg_queue: deque[HeaderBytesRawMessage] = dataclasses.field(
-        default_factory=deque
+    """An in-memory queue.
+
+    Receivers that have to wait are queued in _waiting_queue, and ready
+    messages are handed off directly to the oldest waiter under the lock.
+    This makes receiving fair: the waiters are served in the order they
+    started to wait, and a new receiver never takes messages ahead of a
+    waiter. Only the waiters that are handed messages are woken up.
+
+    When there are no waiters and messages are ready, receiving takes the
+    lock once and doesn't allocate any synchronization primitives.
+
+    The oldest waiter also runs the timers of delayed messages and expired
+    leases.
+    """
+
+    _msg_queue: _PriorityDeque = dataclasses.field(
+        default_factory=_PriorityDeque
     )
-    _processing_msgs: dict[str, HeaderBytesRawMessage] = dataclasses.field(
-        default_factory=dict
+    # message id -> (message, priority)
+    _processing_msgs: dict[str, tuple[HeaderBytesRawMessage, int]] = (
+        dataclasses.field(default_factory=dict)
+    )
+    # A min-heap of (due time, sequence, priority, message). Messages are
+    # moved into the _msg_queue once they are due.
+    _delayed_msgs: list[tuple[float, int, int, HeaderBytesRawMessage]] = (
+        dataclasses.field(default_factory=list)
+    )
+    _delayed_seq: itertools.count = dataclasses.field(
+        default_factory=itertools.count
     )
 
-    _lock: threading.RLock = dataclasses.field(default_factory=threading.RLock)
+    # Received messages are redelivered if they are neither acked nor
+    # requeued within the timeout. None means they are never redelivered.
+    visibility_timeout: float | None = None
+    # A min-heap of (deadline, lease sequence, message id). The entries are
+    # invalidated lazily: an entry is valid only if its sequence is the
+    # current lease of the message in _lease_seqs.
+    _leases: list[tuple[float, int, str]] = dataclasses.field(
+        default_factory=list
+    )
+    _lease_seqs: dict[str, int] = dataclasses.field(default_factory=dict)
+    _lease_seq: itertools.count = dataclasses.field(
+        default_factory=itertools.count
+    )
+
+    _lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
     _waiting_queue: deque[_QueueWaitProxy] = dataclasses.field(
         default_factory=deque
     )
 
     def __len__(self) -> int:
-        return len(self._msg_queue) + len(self._processing_msgs)
+        return (
+            len(self._msg_queue)
+            + len(self._processing_msgs)
+            + len(self._delayed_msgs)
+        )
 
     def enqueue(self, msg: HeaderBytesRawMessage, **options) -> str:
-        if not msg.id:
-            msg.id = uuid.uuid4().hex
-        self._msg_queue.append(msg)
+        return self.enqueue_many([msg], **options)[0]
+
+    def enqueue_many(
+        self,
+        msgs: Sequence[HeaderBytesRawMessage],
+        *,
+        priority: int = _DEFAULT_PRIORITY,
+        delay_millis: int = 0,
+        **options,
+    ) -> list[str]:
+        for msg in msgs:
+            if not msg.id:
+                msg.id = uuid.uuid4().hex
 
-        # The following code can be in an async job
         with self._lock:
-            if self._waiting_queue:
-                self._waiting_queue[0].event.set()
+            if delay_millis and delay_millis > 0:
+                self._delay(
+                    msgs, time.monotonic() + delay_millis / 1000, priority
+                )
+            else:
+                self._msg_queue.extend(msgs, priority)
+                self._handoff()
+
+        return [msg.id for msg in msgs]
 
-        return msg.id
+    def _delay(
+        self,
+        msgs: Sequence[HeaderBytesRawMessage],
+        due: float,
+        priority: int,
+    ):
+        """It should be called with the lock held."""
+        delayed_msgs = self._delayed_msgs
+        for msg in msgs:
+            heapq.heappush(
+                delayed_msgs, (due, next(self._delayed_seq), priority, msg)
+            )
+        self._arm_timer()
+
+    def _run_timers(self):
+        """Moves due messages and the messages with expired leases into the
+        _msg_queue. It should be called with the lock held."""
+        next_due = self._next_timer_due()
+        if next_due is None or next_due > time.monotonic():
+            return
+
+        now = time.monotonic()
+        delayed_msgs = self._delayed_msgs
+        while delayed_msgs and delayed_msgs[0][0] <= now:
+            _, _, priority, msg = heapq.heappop(delayed_msgs)
+            self._msg_queue.append(msg, priority)
+        self._reclaim_expired_leases(now)
+        self._handoff()
+
+    def _reclaim_expired_leases(self, now: float):
+        """Redelivers the messages with expired leases at the head of the
+        _msg_queue, the earliest received first. It should be called with the
+        lock held."""
+        leases = self._leases
+        expired = []
+        while leases and leases[0][0] <= now:
+            _, seq, msg_id = heapq.heappop(leases)
+            if self._lease_seqs.get(msg_id) == seq:
+                del self._lease_seqs[msg_id]
+                expired.append(self._processing_msgs.pop(msg_id))
+
+        for msg, priority in reversed(expired):
+            self._msg_queue.appendleft(msg, priority)
+
+    def _lease(self, msg_id: str, seconds: float):
+        """It should be called with the lock held."""
+        seq = next(self._lease_seq)
+        self._lease_seqs[msg_id] = seq
+        heapq.heappush(self._leases, (time.monotonic() + seconds, seq, msg_id))
+
+    def _compact_leases(self):
+        """Drops the invalidated leases once they outnumber the valid ones.
+        It should be called with the lock held."""
+        leases = self._leases
+        if len(leases) <= 2 * len(self._lease_seqs) + 64:
+            return
+        lease_seqs = self._lease_seqs
+        leases[:] = [
+            lease for lease in leases if lease_seqs.get(lease[2]) == lease[1]
+        ]
+        heapq.heapify(leases)
+
+    def _next_timer_due(self) -> float | None:
+        """Returns the time that the next delayed message becomes due or the
+        next lease expires. It should be called with the lock held."""
+        leases = self._leases
+        # drop the invalidated leases at the top
+        while leases and self._lease_seqs.get(leases[0][2]) != leases[0][1]:
+            heapq.heappop(leases)
+
+        if self._delayed_msgs and leases:
+            return min(self._delayed_msgs[0][0], leases[0][0])
+        elif self._delayed_msgs:
+            return self._delayed_msgs[0][0]
+        elif leases:
+            return leases[0][0]
+        return None
+
+    def _arm_timer(self):
+        """Makes sure the oldest waiter wakes up when the next timer is due.
+        It should be called with the lock held."""
+        if not self._waiting_queue:
+            return
+        next_due = self._next_timer_due()
+        if next_due is None:
+            return
+        waiter = self._waiting_queue[0]
+        if waiter.timer_due is None or waiter.timer_due > next_due:
+            # let the waiter recompute its timeout
+            waiter.wake()
+
+    def _wait_timeout(self, proxy: _QueueWaitProxy) -> float | None:
+        """Only the oldest waiter waits for the timers. It should be called
+        with the lock held."""
+        now = time.monotonic()
+        deadline = proxy.deadline
+        timeout = None if deadline is None else max(deadline - now, 0)
+
+        proxy.timer_due = None
+        if self._waiting_queue[0] is proxy and (
+            (due := self._next_timer_due()) is not None
+        ):
+            proxy.timer_due = due
+            if timeout is None or due - now < timeout:
+                timeout = max(due - now, 0)
+        return timeout
+
+    def _handoff(self):
+        """Hands the ready messages off to the waiters, the oldest first, and
+        wakes them up. It should be called with the lock held."""
+        waiting_queue = self._waiting_queue
+        while waiting_queue and self._msg_queue:
+            waiter = waiting_queue.popleft()
+            waiter.msgs = self._receive_directly(waiter.num)
+            waiter.wake()
+        self._arm_timer()
 
     def _receive_directly(self, num: int) -> list[HeaderBytesRawMessage]:
         msgs = list[HeaderBytesRawMessage]()
         while len(msgs) < num and self._msg_queue:
-            msg = self._msg_queue.popleft()
-            self._processing_msgs[msg.id] = msg
+            msg, priority = self._msg_queue.popleft()
+            self._processing_msgs[msg.id] = (msg, priority)
+            if self.visibility_timeout is not None:
+                self._lease(msg.id, self.visibility_timeout)
             msgs.append(msg)
         return msgs
 
     def ack(self, message: HeaderBytesRawMessage):
-        try:
-            self._processing_msgs.pop(message.id)
-        except KeyError:
-            raise _error.MessageNotFound
+        return self.ack_many([message])
 
     def nack(self, message: HeaderBytesRawMessage):
         return self.ack(message)
 
+    def processing_message(self, msg_id: str) -> HeaderBytesRawMessage:
+        with self._lock:
+            if msg_id not in self._processing_msgs:
+                raise _error.MessageNotFound
+            return self._processing_msgs[msg_id][0]
+
+    def processing_priority(self, msg_id: str) -> int:
+        with self._lock:
+            if msg_id not in self._processing_msgs:
+                raise _error.MessageNotFound
+            return self._processing_msgs[msg_id][1]
+
     def requeue(self, message: HeaderBytesRawMessage):
-        try:
-            msg = self._processing_msgs.pop(message.id)
-        except KeyError:
+        return self.requeue_many([message])
+
+    def _pop_processing_msgs(
+        self, messages: Sequence[HeaderBytesRawMessage]
+    ) -> list[tuple[HeaderBytesRawMessage, int]]:
+        """Pops all the messages or none of them. It should be called with the
+        lock held."""
+        processing_msgs = self._processing_msgs
+        if any(msg.id not in processing_msgs for msg in messages):
             raise _error.MessageNotFound
-        else:
-            self.enqueue(msg)
+        if self._lease_seqs:
+            for msg in messages:
+                self._lease_seqs.pop(msg.id, None)
+            self._compact_leases()
+        return [processing_msgs.pop(msg.id) for msg in messages]
 
-    def receive(
-        self, num: int, wait_time_seconds: float | None
-    ) -> _QueueWaitProxy:
-        return _QueueWaitProxy(num, wait_time_seconds, self)
+    def ack_many(self, messages: Sequence[HeaderBytesRawMessage]):
+        with self._lock:
+            self._pop_processing_msgs(messages)
 
-    def receive_with_proxy(
-        self, proxy: _QueueWaitProxy
-    ) -> list[HeaderBytesRawMessage]:
-        # TODO: improvement: receive directly before get the lock
+    def nack_many(self, messages: Sequence[HeaderBytesRawMessage]):
+        return self.ack_many(messages)
 
-        with self._lock:  # assume it will acquire the lock soon
-            if not self._waiting_queue:
-                if msgs := self._receive_directly(proxy.num):
-                    return msgs
+    def requeue_many(self, messages: Sequence[HeaderBytesRawMessage]):
+        with self._lock:
+            for msg, priority in self._pop_processing_msgs(messages):
+                self._msg_queue.append(msg, priority)
+            self._handoff()
 
-            self._waiting_queue.append(proxy)
+    def extend_visibility(
+        self, message: HeaderBytesRawMessage, seconds: float
+    ):
+        with self._lock:
+            self._run_timers()
+            if message.id not in self._processing_msgs:
+                raise _error.MessageNotFound
+            # Without a visibility timeout the message is never redelivered
+            if self.visibility_timeout is not None:
+                self._lease(message.id, seconds)
 
-        notified = proxy.event.wait(proxy.wait_time_seconds)
+    def receive(
+        self, num: int, wait_time_seconds: float | None
+    ) -> _QueueWaitProxy:
+        return _QueueWaitProxy(num, wait_time_seconds, self)
 
+    def cancel(self, proxy: _QueueWaitProxy):
         with self._lock:
-            if not notified or proxy.cancelled:
-                # Edge case: self is the top one and being notifed and timed-out near the same time.
-                if (
-                    self._waiting_queue[0] is proxy
-                    and len(self._waiting_queue) > 1
-                    and self._msg_queue
-                ):
-                    self._waiting_queue[1].event.set()
-
-                self._waiting_queue.remove(proxy)
-                return []
+            proxy.cancelled = True
+            if proxy.event:
+                proxy.wake()
 
-            assert self._waiting_queue[0] is proxy
-            self._waiting_queue.popleft()
+    def add_notifier(self, proxy: _QueueWaitProxy, notifier: Notifier):
+        with self._lock:
+            proxy.notifiers.append(notifier)
 
-            msgs = self._receive_directly(proxy.num)
-            assert msgs
+    def remove_notifier(self, proxy: _QueueWaitProxy, notifier: Notifier):
+        with self._lock:
+            proxy.notifiers.remove(notifier)
+
+    def _start_waiting(self, proxy: _QueueWaitProxy):
+        """Receives directly if possible, otherwise the proxy starts waiting.
+        It should be called with the lock held."""
+        proxy.started = True
+        if proxy.cancelled:
+            proxy.msgs = []
+            return
+        self._run_timers()
+        # fast path
+        if not self._waiting_queue and self._msg_queue:
+            proxy.msgs = self._receive_directly(proxy.num)
+            return
+
+        if proxy.wait_time_seconds is not None:
+            proxy.deadline = time.monotonic() + proxy.wait_time_seconds
+        proxy.event = threading.Event()
+        self._waiting_queue.append(proxy)
+
+    def _check_waiting(self, proxy: _QueueWaitProxy) -> bool:
+        """Returns True if the proxy has completed. It should be called with
+        the lock held."""
+        if proxy.msgs is None:
+            # The oldest waiter is woken up by the timers
+            self._run_timers()
+        if proxy.msgs is not None:
+            # Returns the handed off messages even if it has been cancelled,
+            # so that they are not lost.
+            return True
+
+        timed_out = proxy.deadline is not None and (
+            time.monotonic() >= proxy.deadline
+        )
+        if proxy.cancelled or timed_out:
+            self._waiting_queue.remove(proxy)
+            proxy.msgs = []
+            # pass the timers on to the next oldest waiter
+            self._arm_timer()
+            return True
+        return False
 
-            if self._waiting_queue:
-                self._waiting_queue[0].event.set()
+    def receive_with_proxy(
+        self, proxy: _QueueWaitProxy
+    ) -> list[HeaderBytesRawMessage]:
+        with self._lock:
+            if not proxy.started:
+                self._start_waiting(proxy)
+            if proxy.msgs is not None:
+                return proxy.msgs
+            event = proxy.event
+            assert event
+            timeout = self._wait_timeout(proxy)
+
+        while True:
+            event.wait(timeout)
+
+            with self._lock:
+                if self._check_waiting(proxy):
+                    assert proxy.msgs is not None
+                    return proxy.msgs
+                event.clear()
+                timeout = self._wait_timeout(proxy)
+
+    def try_receive_with_proxy(
+        self, proxy: _QueueWaitProxy
+    ) -> list[HeaderBytesRawMessage] | None:
+        """Returns None if the proxy is still waiting. Then the notifiers of
+        the proxy are notified when it should be checked again."""
+        with self._lock:
+            if not proxy.started:
+                self._start_waiting(proxy)
+            if proxy.msgs is not None or self._check_waiting(proxy):
+                return proxy.msgs
 
-            return msgs
+            timeout = self._wait_timeout(proxy)
+            if timeout is not None:
+                due = time.monotonic() + timeout
+                for notifier in proxy.notifiers:
+                    notifier.wake_at(due)
+            return None
 
 
 @dataclasses.dataclass
@@ -134,10 +475,37 @@ class _ReceiveFuture(ReceiveFuture[list[HeaderBytesRawMessage]]):
     def cancel(self):
         self._proxy.cancel()
 
+    def try_result(self) -> list[HeaderBytesRawMessage] | None:
+        return self._proxy.try_result()
+
+    def add_notifier(self, notifier: Notifier) -> bool:
+        self._proxy.queue.add_notifier(self._proxy, notifier)
+        return True
+
+    def remove_notifier(self, notifier: Notifier):
+        self._proxy.queue.remove_notifier(self._proxy, notifier)
+
     def __hash__(self) -> int:
         return id(self._proxy)
 
 
+def _project(
+    header_keys: Collection[str], msgs: list[HeaderBytesRawMessage]
+) -> list[HeaderBytesRawMessage]:
+    return [msg.project(header_keys) for msg in msgs]
+
+
+def _receive_future(
+    proxy: _QueueWaitProxy, header_keys: Collection[str] | None
+) -> ReceiveFuture[list[HeaderBytesRawMessage]]:
+    """The messages are received as they are stored, or copies with the
+    projected headers"""
+    future = _ReceiveFuture(proxy)
+    if header_keys is None:
+        return future
+    return future.transform(functools.partial(_project, header_keys))
+
+
 class StubBroker(BaseBroker):
     def __init__(self) -> None:
         self._queues = collections.defaultdict[str, _Queue](_Queue)
@@ -148,12 +516,18 @@ class StubBroker(BaseBroker):
         message: HeaderBytesRawMessage,
         **options,
     ) -> str:
-        delay_millis = options.get("delay_millis") or 0
-        if "priority" in options or delay_millis > 0:
-            raise NotImplementedError
         queue = self._queues[queue_name]
         return queue.enqueue(message, **options)
 
+    def enqueue_many(
+        self,
+        queue_name: str,
+        messages: Sequence[HeaderBytesRawMessage],
+        **options,
+    ) -> list[str]:
+        queue = self._queues[queue_name]
+        return queue.enqueue_many(messages, **options)
+
     def block_receive(
         self,
         queue_name: str,
@@ -164,7 +538,18 @@ class StubBroker(BaseBroker):
     ) -> ReceiveFuture[list[HeaderBytesRawMessage]]:
         queue = self._queues[queue_name]
         proxy = queue.receive(max_number, wait_time_seconds)
-        return _ReceiveFuture(proxy)
+        return _receive_future(proxy, header_keys)
+
+    def _stored_headers(
+        self, message: HeaderBytesRawMessage, queue_name: str
+    ) -> dict[str, str | int | float]:
+        stored = self._queues[queue_name].processing_message(message.id)
+        return stored.headers.copy()
+
+    def _stored_priority(
+        self, message: HeaderBytesRawMessage, queue_name: str
+    ) -> int | None:
+        return self._queues[queue_name].processing_priority(message.id)
 
     def qsize(self, queue_name: str) -> int:
         return len(self._queues[queue_name])
@@ -190,6 +575,51 @@ class StubBroker(BaseBroker):
     def requeue(self, message: HeaderBytesRawMessage, queue_name: str):
         return self._queues[queue_name].requeue(message)
 
-    def prepare_queue(self, queue_name: str, **kwds):
+    def ack_many(
+        self,
+        messages: Sequence[HeaderBytesRawMessage],
+        queue_name: str,
+        *,
+        results: Sequence | None = None,
+    ):
+        return self._queues[queue_name].ack_many(messages)
+
+    def nack_many(
+        self,
+        messages: Sequence[HeaderBytesRawMessage],
+        queue_name: str,
+        *,
+        exceptions: Sequence[Exception],
+    ):
+        return self._queues[queue_name].nack_many(messages)
+
+    def requeue_many(
+        self, messages: Sequence[HeaderBytesRawMessage], queue_name: str
+    ):
+        return self._queues[queue_name].requeue_many(messages)
+
+    def extend_visibility(
+        self,
+        message: HeaderBytesRawMessage,
+        queue_name: str,
+        *,
+        seconds: float,
+    ):
+        return self._queues[queue_name].extend_visibility(message, seconds)
+
+    def prepare_queue(
+        self,
+        queue_name: str,
+        *,
+        visibility_timeout_seconds: float | None = None,
+        **kwds,
+    ):
+        """Arguments:
+        visibility_timeout_seconds: if it is set, the received messages which
+            are neither acked nor requeued within it are redelivered.
+        """
         if queue_name not in self._queues:
             self._queues[queue_name] = _Queue()
+        if visibility_timeout_seconds is not None:
+            queue = self._queues[queue_name]
+            queue.visibility_timeout = visibility_timeout_seconds
@@ -1,10 +1,15 @@
 import argparse
+import functools
 import importlib
 import logging
 import os
 import sys
+import typing
 
 import rolecraft
+from rolecraft.service import AutoscalingThreadWorkerPool, PreforkSupervisor
+from rolecraft.service.consumer import NoPrefetch
+from rolecraft.service.consumer.scheduling_policy import SchedulingPolicyName
 
 parser = argparse.ArgumentParser(
     prog="RoleCraft",
@@ -13,13 +18,81 @@ parser = argparse.ArgumentParser(
 
 parser.add_argument("module")
 parser.add_argument("-t", "--worker-threads", type=int)
+parser.add_argument(
+    "--max-worker-threads",
+    type=int,
+    help="scale the worker threads between the worker threads and the number "
+    "with the load",
+)
+parser.add_argument(
+    "-p",
+    "--processes",
+    type=int,
+    help="fork the number of worker processes, each running the service with "
+    "the worker threads",
+)
+parser.add_argument(
+    "--max-tasks-per-process",
+    type=int,
+    help="recycle a worker process after it handled the number of messages",
+)
+parser.add_argument(
+    "--max-rss-per-process",
+    type=int,
+    help="recycle a worker process after its RSS exceeds the megabytes",
+)
+parser.add_argument(
+    "--pollers",
+    type=int,
+    help="serve the queues with the number of poller threads instead of a "
+    "thread per queue",
+)
+parser.add_argument(
+    "--no-prefetch",
+    action="store_true",
+    help="receive messages only when a worker thread is free",
+)
+parser.add_argument(
+    "--prefetch-size",
+    type=int,
+    default=1,
+    help="the maximum number of messages buffered for the workers",
+)
+parser.add_argument(
+    "--prefetch-seconds",
+    type=float,
+    help="size the prefetching of each queue to buffer about the seconds of "
+    "work, within the prefetch size",
+)
+parser.add_argument(
+    "--prefetch-bytes",
+    type=int,
+    help="the maximum encoded bytes of the messages buffered for the workers",
+)
+parser.add_argument(
+    "--prefetch-queue-bytes",
+    type=int,
+    help="the maximum encoded bytes buffered for each queue",
+)
+parser.add_argument(
+    "--scheduling",
+    choices=typing.get_args(SchedulingPolicyName),
+    help="consume the prefetched messages of the queues in the order of the "
+    "policy, weighted by the 'weight' setting of the queues",
+)
+parser.add_argument(
+    "--drain-timeout",
+    type=float,
+    help="requeue the prefetched messages for at most the seconds when "
+    "stopping",
+)
 parser.add_argument("--verbose", "-v", action="count", default=0)
 
 
 def main():
     args = parser.parse_args()
     module: str = args.module
-    worker_thread_num: int = args.worker_threads or 1
+    worker_thread_num: int | None = args.worker_threads or 1
     verbose: int = args.verbose
 
     if verbose == 1:
@@ -36,7 +109,51 @@ def main():
     sys.path.insert(0, os.getcwd())
     importlib.import_module(module)
 
-    service = rolecraft.ServiceFactory().create(prefetch_size=1)
+    options = {}
+    if args.no_prefetch:
+        options["no_prefetch"] = NoPrefetch()
+    if args.pollers:
+        options["poller_num"] = args.pollers
+    if args.prefetch_seconds:
+        options["prefetch_target_seconds"] = args.prefetch_seconds
+    if args.prefetch_bytes:
+        options["prefetch_max_bytes"] = args.prefetch_bytes
+    if args.prefetch_queue_bytes:
+        options["prefetch_queue_max_bytes"] = args.prefetch_queue_bytes
+    if args.scheduling:
+        options["scheduling_policy"] = args.scheduling
+    if args.drain_timeout is not None:
+        options["drain_timeout_seconds"] = args.drain_timeout
+
+    worker_pool_factory = None
+    if args.max_worker_threads:
+        worker_pool_factory = functools.partial(
+            AutoscalingThreadWorkerPool,
+            min_threads=worker_thread_num,
+            max_threads=args.max_worker_threads,
+        )
+        # the threads are started by the worker pool
+        worker_thread_num = None
+
+    def create_service():
+        return rolecraft.ServiceFactory(
+            worker_pool_factory=worker_pool_factory
+        ).create(prefetch_size=args.prefetch_size, **options)
+
+    if args.processes:
+        max_rss_bytes = None
+        if args.max_rss_per_process:
+            max_rss_bytes = args.max_rss_per_process * 2**20
+        supervisor = PreforkSupervisor(
+            create_service,
+            args.processes,
+            thread_num=worker_thread_num,
+            max_tasks_per_process=args.max_tasks_per_process,
+            max_rss_bytes=max_rss_bytes,
+        )
+        return supervisor.run()
+
+    service = create_service()
     service.start(thread_num=worker_thread_num)
     service.join()
 
@@ -33,6 +33,10 @@ class BaseMiddleware(Middleware):
     def options(self) -> dict[str, Any]:
         return {}
 
+    @property
+    def required_header_keys(self) -> tuple[str, ...]:  # type: ignore
+        return tuple(field.name for field in dataclasses.fields(self.Meta))
+
     def __call__(self, queue: MessageQueue) -> MessageQueue:
         if isinstance(queue, Outermost):
             outermost, queue = queue, queue._guarded_queue
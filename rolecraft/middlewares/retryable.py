@@ -80,18 +80,56 @@ class Retryable(BaseMiddleware):
         return retry_attempt < self.max_retries
 
     def nack(self, message: Message, exception: Exception, **kwargs):
+        if self._retry(message, exception):
+            return
+
+        return self._guarded_queue.nack(message, exception=exception, **kwargs)
+
+    def nack_many(
+        self,
+        messages: Sequence[Message],
+        exceptions: Sequence[Exception],
+        **kwargs,
+    ):
+        """Retries the messages that should be retried and nacks the others in
+        bulk.
+
+        If retrying a message fails, it is left to the broker as by `nack`,
+        and the first error is raised once the others are handled."""
+        nack_messages: list[Message] = []
+        nack_exceptions: list[Exception] = []
+        retry_error: Exception | None = None
+        for message, exception in zip(messages, exceptions, strict=True):
+            try:
+                if self._retry(message, exception):
+                    continue
+            except Exception as e:  # noqa: BLE001 - raised at the end
+                retry_error = retry_error or e
+                continue
+            nack_messages.append(message)
+            nack_exceptions.append(exception)
+
+        rv = None
+        if nack_messages:
+            rv = self._guarded_queue.nack_many(
+                nack_messages, exceptions=nack_exceptions, **kwargs
+            )
+        if retry_error:
+            raise retry_error
+        return rv
+
+    def _retry(self, message: Message, exception: Exception) -> bool:
+        """Returns False if the message should not be retried."""
         retries = self.Meta.create_from(message.meta).retries
 
         if not self._should_retry(message, exception, retries):
-            return self._guarded_queue.nack(
-                message, exception=exception, **kwargs
-            )
+            return False
 
         delay_millis = int(self._compute_delay_millis(retries))
         self._guarded_queue.retry(
             message, delay_millis=delay_millis, exception=exception
         )
-        return
+        return True
 
     def _compute_delay_millis(self, retry_attempt: int) -> float:
         if retry_attempt == 0:
@@ -1,5 +1,10 @@
-from .encoder import BytesEncoder, Encoder, HeaderBytesEncoder
-from .message import Message
+from .encoder import (
+    BinaryEncoder,
+    BytesEncoder,
+    Encoder,
+    HeaderBytesEncoder,
+)
+from .message import LazyMessage, Message
 from .middleware import Middleware, MiddlewareError
 from .queue import EnqueueOptions, MessageQueue
 from .queue_config import (
@@ -11,9 +16,11 @@ from .queue_config import (
 
 __all__ = [
     "Message",
+    "LazyMessage",
     "MessageQueue",
     "Encoder",
     "BytesEncoder",
+    "BinaryEncoder",
     "HeaderBytesEncoder",
     "Middleware",
     "MiddlewareError",
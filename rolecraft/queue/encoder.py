@@ -1,12 +1,22 @@
 import abc
 import dataclasses
+import functools
 import json
+import operator
+import re
 import struct
+from collections.abc import Collection
 from typing import Any
 
 from rolecraft.broker import BytesRawMessage, HeaderBytesRawMessage
 
-from .message import Message
+from .message import LazyMessage, Message
+
+_json_decoder = json.JSONDecoder()
+# The encoded role name and role data are in the order of the fields
+_ROLE_NAME_PREFIX = '{"role_name": "'
+# The head of the data up to the role data, matched without decoding it
+_ROLE_HEAD = re.compile(rb'\{"role_name": "(?:[^"\\]|\\.)*", "role_data": ')
 
 
 class Encoder[RawMessage](abc.ABC):
@@ -16,14 +26,26 @@ class Encoder[RawMessage](abc.ABC):
 
     @abc.abstractmethod
     def decode(self, raw_message: RawMessage, **kwargs) -> Message:
+        """The keyword `header_keys`, if not None, is the headers the message
+        is received with. The encoders keeping the headers in the data should
+        only decode those."""
         raise NotImplementedError
 
 
 class HeaderBytesEncoder(Encoder[HeaderBytesRawMessage]):
+    """Encodes the message into JSON, with the meta as the headers.
+
+    With `lazy`, it decodes a LazyMessage, parsing only the role name from
+    the JSON and the role data when it is accessed.
+    """
+
     _META_VALUE_TYPE = str | int | float
 
+    def __init__(self, *, lazy: bool = False) -> None:
+        self.lazy = lazy
+
     def encode(self, message: Message) -> HeaderBytesRawMessage:
-        if isinstance(message.role_data, bytes):
+        if isinstance(message.role_data, (bytes, memoryview)):
             raise NotImplementedError
         msg_dict = self._to_dict(message)
 
@@ -35,7 +57,13 @@ class HeaderBytesEncoder(Encoder[HeaderBytesRawMessage]):
     def _to_dict(self, message: Message) -> dict[str, Any]:
         data = {}
         for field in dataclasses.fields(message):
-            if field.name in ("id", "meta", "queue"):
+            if field.name in (
+                "id",
+                "meta",
+                "queue",
+                "encoded_size",
+                "raw_message",
+            ):
                 continue
             data[field.name] = getattr(message, field.name)
         return data
@@ -43,14 +71,71 @@ class HeaderBytesEncoder(Encoder[HeaderBytesRawMessage]):
     def decode(
         self, raw_message: HeaderBytesRawMessage, *, queue, **kwargs
     ) -> Message:
-        msg_dict = json.loads(raw_message.data)
+        # The headers have been projected by the broker
+        # The data may be a buffer, e.g. a memoryview of a mapped file
+        if self.lazy:
+            message = self._decode_lazily(raw_message, queue)
+            if message is not None:
+                return message
+
+        msg_dict = json.loads(str(raw_message.data, "utf-8"))
         msg_dict["id"] = raw_message.id
         msg_dict["queue"] = queue
         msg_dict["meta"] = raw_message.headers
         return Message(**msg_dict)
 
+    def _decode_lazily(
+        self, raw_message: HeaderBytesRawMessage, queue
+    ) -> LazyMessage | None:
+        """Returns None if the data isn't in the form encoded by `encode`.
+        Only the head up to the role data is decoded."""
+        data = raw_message.data
+        match = _ROLE_HEAD.match(data)
+        if match is None:
+            return None
+        try:
+            head = str(data[: match.end()], "utf-8")
+            role_name, _ = json.decoder.scanstring(
+                head, len(_ROLE_NAME_PREFIX)
+            )
+        except ValueError:
+            return None
+
+        return LazyMessage(
+            id=raw_message.id,
+            meta=raw_message.headers,
+            role_name=role_name,
+            queue=queue,
+            load_role_data=functools.partial(
+                self._load_role_data, data, match.end()
+            ),
+        )
+
+    def _load_role_data(self, data: bytes, start: int) -> str | None:
+        text = str(data[start:], "utf-8")
+        role_data, end = _json_decoder.raw_decode(text)
+        if text[end:] != "}":
+            # More fields follow
+            return json.loads(str(data, "utf-8"))["role_data"]
+        return role_data
+
+
+_HEADER_LENGTH = struct.Struct("!H")
+_WIDE_HEADER_LENGTH = struct.Struct("!HI")
+# The 2-byte header length marking a 4-byte length following it
+_HEADER_LENGTH_ESCAPE = 0xFFFF
+
 
 class BytesEncoder(Encoder[BytesRawMessage]):
+    """Packs the headers and the data of a HeaderBytesEncoder into a frame:
+    the header length, the JSON headers and the data.
+
+    The header length takes 2 bytes, or 6 bytes, the escape 0xFFFF and a
+    4-byte length, for headers of at least 64 KiB. The parts are joined
+    into the frame in a single copy, and a frame is decoded into memoryview
+    slices of the received data without copying it.
+    """
+
     def __init__(self, encoder: HeaderBytesEncoder) -> None:
         self.encoder = encoder
 
@@ -60,22 +145,242 @@ class BytesEncoder(Encoder[BytesRawMessage]):
         data = self._pack(header_data, encoded.data)
         return BytesRawMessage(id=encoded.id, data=data)
 
-    def _pack(self, header_data: bytes, data: bytes):
-        header = struct.pack("!H", len(header_data))
-        return header + header_data + data
+    def _pack(self, header_data: bytes, data: bytes) -> bytes:
+        header_data_len = len(header_data)
+        if header_data_len < _HEADER_LENGTH_ESCAPE:
+            prefix = _HEADER_LENGTH.pack(header_data_len)
+        else:
+            prefix = _WIDE_HEADER_LENGTH.pack(
+                _HEADER_LENGTH_ESCAPE, header_data_len
+            )
+        return b"".join((prefix, header_data, data))
+
+    def _unpack(self, packed_data: bytes) -> tuple[memoryview, memoryview]:
+        view = memoryview(packed_data)
+        (header_data_len,) = _HEADER_LENGTH.unpack_from(view)
+        offset = _HEADER_LENGTH.size
+        if header_data_len == _HEADER_LENGTH_ESCAPE:
+            _, header_data_len = _WIDE_HEADER_LENGTH.unpack_from(view)
+            offset = _WIDE_HEADER_LENGTH.size
 
-    def _unpack(self, packed_data: bytes):
-        header_data_len, _ = struct.unpack("!H", packed_data[:2])
-        header_data = packed_data[2 : 2 + header_data_len]
-        data = packed_data[2 + header_data_len :]
-        return header_data, data
+        end = offset + header_data_len
+        return view[offset:end], view[end:]
 
-    def decode(self, raw_message: BytesRawMessage, **kwargs) -> Message:
+    def decode(
+        self,
+        raw_message: BytesRawMessage,
+        *,
+        header_keys: Collection[str] | None = None,
+        **kwargs,
+    ) -> Message:
         header_data, data = self._unpack(raw_message.data)
-        headers = json.loads(header_data)
+        headers = json.loads(str(header_data, "utf-8"))
+        if header_keys is not None:
+            headers = {
+                key: headers[key] for key in header_keys if key in headers
+            }
         msg = HeaderBytesRawMessage(
             id=raw_message.id,
-            data=data,
+            data=data,  # type: ignore
             headers=headers,
         )
         return self.encoder.decode(msg, **kwargs)
+
+
+# magic, version, payload type, role name length, header number
+_BINARY_PREFIX = struct.Struct("!BBBHH")
+# key length, value type
+_BINARY_HEADER = struct.Struct("!BB")
+_BINARY_LENGTH = struct.Struct("!I")
+_BINARY_INT = struct.Struct("!q")
+_BINARY_FLOAT = struct.Struct("!d")
+
+_PAYLOAD_NONE = 0
+_PAYLOAD_STR = 1
+_PAYLOAD_BYTES = 2
+
+_VALUE_STR = 0
+_VALUE_INT = 1
+_VALUE_FLOAT = 2
+_VALUE_BOOL = 3
+
+
+class BinaryEncoder(Encoder[BytesRawMessage]):
+    """Encodes a message into a compact binary frame, without JSON.
+
+    The frame is in network byte order: a prefix of the magic byte, the
+    format version, the payload type, the role name length and the header
+    number, then the role name, the header table, where each header is its
+    key length, its value type, its key and its value, and the payload
+    taking the rest of the frame. The role data may be None, a str or bytes,
+    and the header values str, int, float or bool.
+
+    A frame not starting with the magic byte is decoded by `legacy_encoder`,
+    so that the messages encoded by BytesEncoder can still be consumed while
+    rolling out. A BytesEncoder frame starts with the magic byte too if its
+    headers are 46848 to 47103 (0xB700 to 0xB7FF) bytes long. It is told
+    apart by its third byte, which starts its JSON headers, where a binary
+    frame has the payload type.
+
+    With `buffer_payload`, bytes role data is decoded as a memoryview of the
+    frame instead of being copied, for the serializers that can consume a
+    buffer. It keeps the whole frame alive as long as the role data.
+
+    With `lazy`, it decodes a LazyMessage, whose role data is decoded from
+    the payload when it is accessed.
+    """
+
+    MAGIC = 0xB7
+    VERSION = 1
+
+    _fields = operator.attrgetter("id", "meta", "role_name", "role_data")
+
+    def __init__(
+        self,
+        legacy_encoder: Encoder | None = None,
+        *,
+        buffer_payload: bool = False,
+        lazy: bool = False,
+    ) -> None:
+        self.legacy_encoder = legacy_encoder or BytesEncoder(
+            HeaderBytesEncoder(lazy=lazy)
+        )
+        self.buffer_payload = buffer_payload
+        self.lazy = lazy
+
+    def encode(self, message: Message) -> BytesRawMessage:
+        id, meta, role_name, role_data = self._fields(message)
+        if role_data is None:
+            payload_type, payload = _PAYLOAD_NONE, b""
+        elif isinstance(role_data, str):
+            payload_type, payload = _PAYLOAD_STR, role_data.encode()
+        else:
+            payload_type, payload = _PAYLOAD_BYTES, role_data
+
+        name = role_name.encode()
+        # The prefix is filled in last
+        parts = [b"", name]
+        append = parts.append
+        pack_header = _BINARY_HEADER.pack
+        for key, value in meta.items():
+            key_data = key.encode()
+            # bool is checked before int, which it is a subclass of
+            if isinstance(value, bool):
+                append(pack_header(len(key_data), _VALUE_BOOL))
+                append(key_data)
+                append(b"\x01" if value else b"\x00")
+            elif isinstance(value, int):
+                append(pack_header(len(key_data), _VALUE_INT))
+                append(key_data)
+                append(_BINARY_INT.pack(value))
+            elif isinstance(value, float):
+                append(pack_header(len(key_data), _VALUE_FLOAT))
+                append(key_data)
+                append(_BINARY_FLOAT.pack(value))
+            elif isinstance(value, str):
+                value_data = value.encode()
+                append(pack_header(len(key_data), _VALUE_STR))
+                append(key_data)
+                append(_BINARY_LENGTH.pack(len(value_data)))
+                append(value_data)
+            else:
+                raise TypeError(
+                    f"Unsupported type of header {key!r}: "
+                    f"{type(value).__name__}"
+                )
+        append(payload)
+        parts[0] = _BINARY_PREFIX.pack(
+            self.MAGIC, self.VERSION, payload_type, len(name), len(meta)
+        )
+        return BytesRawMessage(id=id, data=b"".join(parts))
+
+    def decode(
+        self,
+        raw_message: BytesRawMessage,
+        *,
+        queue,
+        header_keys: Collection[str] | None = None,
+        **kwargs,
+    ) -> Message:
+        """Only the headers of `header_keys` are decoded, if it isn't None"""
+        data = raw_message.data
+        if not data or data[0] != self.MAGIC or data[2:3] == b"{":
+            return self.legacy_encoder.decode(
+                raw_message, queue=queue, header_keys=header_keys, **kwargs
+            )
+
+        _, version, payload_type, name_len, header_num = (
+            _BINARY_PREFIX.unpack_from(data)
+        )
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported binary frame version: {version}")
+        if payload_type not in (_PAYLOAD_NONE, _PAYLOAD_STR, _PAYLOAD_BYTES):
+            raise ValueError(f"Unknown payload type: {payload_type}")
+
+        offset = _BINARY_PREFIX.size
+        end = offset + name_len
+        role_name = str(data[offset:end], "utf-8")
+        offset = end
+
+        meta: dict[str, str | int | float] = {}
+        unpack_header = _BINARY_HEADER.unpack_from
+        for _ in range(header_num):
+            key_len, value_type = unpack_header(data, offset)
+            offset += 2
+            end = offset + key_len
+            key = str(data[offset:end], "utf-8")
+            offset = end
+            # The value of a header not projected is skipped over
+            wanted = header_keys is None or key in header_keys
+
+            if value_type == _VALUE_INT:
+                if wanted:
+                    meta[key] = _BINARY_INT.unpack_from(data, offset)[0]
+                offset += 8
+            elif value_type == _VALUE_STR:
+                (value_len,) = _BINARY_LENGTH.unpack_from(data, offset)
+                offset += 4
+                end = offset + value_len
+                if wanted:
+                    meta[key] = str(data[offset:end], "utf-8")
+                offset = end
+            elif value_type == _VALUE_FLOAT:
+                if wanted:
+                    meta[key] = _BINARY_FLOAT.unpack_from(data, offset)[0]
+                offset += 8
+            elif value_type == _VALUE_BOOL:
+                if wanted:
+                    meta[key] = data[offset] != 0
+                offset += 1
+            else:
+                raise ValueError(f"Unknown header value type: {value_type}")
+
+        if self.lazy and payload_type != _PAYLOAD_NONE:
+            return LazyMessage(
+                id=raw_message.id,
+                meta=meta,
+                role_name=role_name,
+                queue=queue,
+                load_role_data=functools.partial(
+                    self._load_payload, data, offset, payload_type
+                ),
+            )
+
+        return Message(
+            id=raw_message.id,
+            meta=meta,
+            role_name=role_name,
+            role_data=self._load_payload(data, offset, payload_type),
+            queue=queue,
+        )
+
+    def _load_payload(
+        self, data: bytes, offset: int, payload_type: int
+    ) -> str | bytes | memoryview | None:
+        if payload_type == _PAYLOAD_STR:
+            return str(data[offset:], "utf-8")
+        elif payload_type == _PAYLOAD_BYTES:
+            if self.buffer_payload:
+                return memoryview(data)[offset:]
+            return bytes(data[offset:])
+        return None
@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import dataclasses
 import typing
+from collections.abc import Callable
+from typing import Any
 
 if typing.TYPE_CHECKING:
     from . import MessageQueue
@@ -17,10 +19,22 @@ class Message:
     )
 
     role_name: str
-    role_data: str | bytes | None = None
+    # It may be a memoryview of the received data, see BinaryEncoder
+    role_data: str | bytes | memoryview | None = None
 
     queue: MessageQueue
 
+    # The size of the encoded message received from the broker, used to
+    # bound the buffered bytes. It is 0 for messages not received.
+    encoded_size: int = dataclasses.field(default=0, compare=False)
+
+    # The raw message received from the broker, which is passed back to the
+    # broker by ack, nack, requeue etc. instead of encoding the message again.
+    # It is None for messages not received.
+    raw_message: Any = dataclasses.field(
+        default=None, compare=False, repr=False
+    )
+
     # Stub queue metheods for convenient
     def enqueue(self, **kwargs):
         return self.queue.enqueue(self, **kwargs)
@@ -33,3 +47,43 @@ class Message:
 
     def requeue(self, **kwargs):
         return self.queue.requeue(self, **kwargs)
+
+    def extend_visibility(self, **kwargs):
+        return self.queue.extend_visibility(self, **kwargs)
+
+
+class LazyMessage(Message):
+    """A message whose role data is loaded on first access, e.g. parsed
+    from the received payload, so that a message requeued or rejected
+    before its role data is used doesn't cost the parsing.
+
+    An error loading the role data is raised by that first access.
+    """
+
+    def __init__(
+        self,
+        *,
+        load_role_data: Callable[[], str | bytes | memoryview | None]
+        | None = None,
+        **kwargs,
+    ) -> None:
+        super().__init__(**kwargs)
+        # Set after the role data, as setting the role data drops the loader
+        self._load_role_data = load_role_data
+
+    @property  # type: ignore[override]
+    def role_data(self) -> str | bytes | memoryview | None:
+        load_role_data = self._load_role_data
+        if load_role_data is not None:
+            self._role_data = load_role_data()
+            self._load_role_data = None
+        return self._role_data
+
+    @role_data.setter
+    def role_data(self, value: str | bytes | memoryview | None):
+        self._role_data = value
+        self._load_role_data = None
+
+    @property
+    def role_data_loaded(self) -> bool:
+        return self._load_role_data is None
@@ -1,4 +1,5 @@
 import abc
+from collections.abc import Sequence
 
 from .queue import MessageQueue
 
@@ -9,6 +10,10 @@ class MiddlewareError(Exception):
 
 @MessageQueue.register
 class Middleware(abc.ABC):
+    # The headers the middleware reads from the received messages, which are
+    # received even if the queue is configured with a header projection
+    required_header_keys: Sequence[str] = ()
+
     def __init__(self, queue: MessageQueue | None = None) -> None:
         self.queue: MessageQueue | None = queue
 
@@ -1,7 +1,7 @@
 import abc
 import functools
 import logging
-from collections.abc import Callable, Mapping
+from collections.abc import Callable, Collection, Mapping, Sequence
 from typing import Any, Concatenate
 
 from rolecraft.broker import Broker, EnqueueOptions
@@ -46,6 +46,30 @@ def copy_msg_method_signature[CLS, **P, T](
     return wrapper
 
 
+# Omit `queue_name: str | None` from the Broker's batch method signature
+def copy_msgs_method_signature[CLS, **P, T](
+    source: Callable[Concatenate[Any, Sequence[Message], str | None, P], T],
+) -> Callable[
+    [Callable[..., T]], Callable[Concatenate[CLS, Sequence[Message], P], T]
+]:
+    def wrapper(
+        target: Callable[..., T],
+    ) -> Callable[Concatenate[CLS, Sequence[Message], P], T]:
+        @functools.wraps(target)
+        def wrapped(
+            self: CLS,
+            /,
+            messages: Sequence[Message],
+            *args: P.args,
+            **kwargs: P.kwargs,
+        ) -> T:
+            return target(self, messages, *args, **kwargs)
+
+        return wrapped
+
+    return wrapper
+
+
 class MessageQueue[RawMessage](abc.ABC):
     def __init__(
         self,
@@ -54,12 +78,15 @@ class MessageQueue[RawMessage](abc.ABC):
         encoder: Encoder[RawMessage],
         wait_time_seconds: int | None = None,
         settings: Mapping[str, Any] | None = None,
+        header_keys: Collection[str] | None = None,
     ) -> None:
         self.name = name
         self.broker = broker
         self.encoder = encoder
         self.wait_time_seconds = wait_time_seconds
         self.settings = settings or {}
+        # The headers to receive the messages with, or None for all of them
+        self.header_keys = None if header_keys is None else list(header_keys)
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}({self.name}, {self.broker})"
@@ -69,31 +96,56 @@ class MessageQueue[RawMessage](abc.ABC):
         raw_message = self.encoder.encode(message)
         return self.broker.enqueue(self.name, raw_message, *args, **kwargs)
 
+    @copy_method_signature(Broker[Message].enqueue_many)
+    def enqueue_many(self, messages: Sequence[Message], *args, **kwargs):
+        return self.broker.enqueue_many(
+            self.name, self._encode_messages(messages), *args, **kwargs
+        )
+
     @copy_method_signature(Broker[Message].block_receive)
     def block_receive(self, *args, **kwargs):
         """If the wait_time_seconds is None, it will be default value of the
-        queue."""
+        queue. The header_keys is the one of the queue if not passed."""
         kwargs.setdefault("wait_time_seconds", self.wait_time_seconds)
+        header_keys = kwargs.setdefault("header_keys", self.header_keys)
         future = self.broker.block_receive(self.name, *args, **kwargs)
-        return future.transform(self._decode_messages)
+        return future.transform(
+            functools.partial(self._decode_messages, header_keys=header_keys)
+        )
 
     @copy_method_signature(Broker[Message].receive)
     def receive(self, *args, **kwargs):
+        header_keys = kwargs.setdefault("header_keys", self.header_keys)
         return self._decode_messages(
-            self.broker.receive(self.name, *args, **kwargs)
+            self.broker.receive(self.name, *args, **kwargs),
+            header_keys=header_keys,
         )
 
-    def _decode_messages(self, messages: list[RawMessage]) -> list[Message]:
+    def _decode_messages(
+        self,
+        messages: list[RawMessage],
+        header_keys: Collection[str] | None = None,
+    ) -> list[Message]:
+        """The encoder projects the headers as well, as the broker can't if
+        they are encoded into the data"""
         decoded = []
         for msg in messages:
             try:
-                decoded.append(self.encoder.decode(msg, queue=self))
+                message = self.encoder.decode(
+                    msg, queue=self, header_keys=header_keys
+                )
             except Exception as e:
                 logger.error(
                     "Decode error for message %s",
                     getattr(msg, "id", msg),
                     exc_info=e,
                 )
+                continue
+            # Measured before decoding, the data may not be kept by the
+            # decoded message
+            message.encoded_size = len(getattr(msg, "data", b""))
+            message.raw_message = msg
+            decoded.append(message)
         return decoded
 
     @copy_method_signature(Broker[Message].qsize)
@@ -103,26 +155,73 @@ class MessageQueue[RawMessage](abc.ABC):
     @copy_msg_method_signature(Broker[Message].ack)
     def ack(self, message: Message, *args, **kwargs):
         return self.broker.ack(
-            self.encoder.encode(message), self.name, *args, **kwargs
+            self._raw_message(message), self.name, *args, **kwargs
         )
 
     @copy_msg_method_signature(Broker[Message].nack)
     def nack(self, message: Message, *args, **kwargs):
         return self.broker.nack(
-            self.encoder.encode(message), self.name, *args, **kwargs
+            self._raw_message(message), self.name, *args, **kwargs
         )
 
     @copy_msg_method_signature(Broker[Message].requeue)
     def requeue(self, message: Message, *args, **kwargs):
         return self.broker.requeue(
-            self.encoder.encode(message), self.name, *args, **kwargs
+            self._raw_message(message), self.name, *args, **kwargs
+        )
+
+    @copy_msg_method_signature(Broker[Message].extend_visibility)
+    def extend_visibility(self, message: Message, *args, **kwargs):
+        return self.broker.extend_visibility(
+            self._raw_message(message), self.name, *args, **kwargs
+        )
+
+    @copy_msgs_method_signature(Broker[Message].ack_many)
+    def ack_many(self, messages: Sequence[Message], *args, **kwargs):
+        return self.broker.ack_many(
+            self._raw_messages(messages), self.name, *args, **kwargs
+        )
+
+    @copy_msgs_method_signature(Broker[Message].nack_many)
+    def nack_many(self, messages: Sequence[Message], *args, **kwargs):
+        return self.broker.nack_many(
+            self._raw_messages(messages), self.name, *args, **kwargs
+        )
+
+    @copy_msgs_method_signature(Broker[Message].requeue_many)
+    def requeue_many(self, messages: Sequence[Message], *args, **kwargs):
+        return self.broker.requeue_many(
+            self._raw_messages(messages), self.name, *args, **kwargs
         )
 
+    def _encode_messages(
+        self, messages: Sequence[Message]
+    ) -> list[RawMessage]:
+        encode = self.encoder.encode
+        return [encode(message) for message in messages]
+
+    def _raw_message(self, message: Message) -> RawMessage:
+        """The raw message identifying a received message to the broker,
+        which is the one it was decoded from if any."""
+        raw_message = message.raw_message
+        if raw_message is None:
+            return self.encoder.encode(message)
+        return raw_message
+
+    def _raw_messages(self, messages: Sequence[Message]) -> list[RawMessage]:
+        raw_message = self._raw_message
+        return [raw_message(message) for message in messages]
+
     @copy_msg_method_signature(Broker[Message].retry)
     def retry(self, message: Message, *args, **kwargs):
-        return self.broker.retry(
-            self.encoder.encode(message), self.name, *args, **kwargs
-        )
+        # The broker enqueues the data and headers of the raw message again,
+        # so it is only reused while the meta is still its headers, as the
+        # meta of a message decoded by HeaderBytesEncoder is. The role data
+        # isn't changed once received.
+        raw_message = message.raw_message
+        if getattr(raw_message, "headers", None) is not message.meta:
+            raw_message = self.encoder.encode(message)
+        return self.broker.retry(raw_message, self.name, *args, **kwargs)
 
     def close(self):
         return self.broker.close()
@@ -14,6 +14,7 @@ class PartialQueueConfigOptions(TypedDict, total=False):
     middlewares: Sequence[Middleware]
     wait_time_seconds: int | None
     settings: Mapping[str, Any]
+    header_keys: Sequence[str] | None
 
 
 class QueueConfigOptions[M](PartialQueueConfigOptions, total=False):
@@ -29,6 +30,9 @@ class IncompleteQueueConfig[M_co]:
     middlewares: Sequence[Middleware] = dataclasses.field(default_factory=list)
     wait_time_seconds: int | None = None
     settings: Mapping[str, Any] = dataclasses.field(default_factory=dict)
+    # The headers to receive the messages with, besides the ones required by
+    # the middlewares, or None for all of them
+    header_keys: Sequence[str] | None = None
 
     def replace(self, **kwds: Unpack[QueueConfigOptions[Any]]):
         return dataclasses.replace(self, **kwds)
@@ -87,4 +87,13 @@ class QueueBuilder:
             encoder=config.encoder,
             wait_time_seconds=config.wait_time_seconds,
             settings=config.settings,
+            header_keys=self._header_keys(config),
         )
+
+    def _header_keys(self, config: QueueConfig) -> list[str] | None:
+        if config.header_keys is None:
+            return None
+        keys = list(config.header_keys)
+        for middleware in config.middlewares:
+            keys.extend(middleware.required_header_keys)
+        return list(dict.fromkeys(keys))
@@ -4,13 +4,23 @@ from .consumer import (
     ConsumerOptions,
     DefaultConsumerFactory,
 )
+from .prefork import PreforkSupervisor
 from .queue_discovery import QueueDiscovery
 from .service import Service
 from .service_factory import ServiceCreateOptions, ServiceFactory
 from .thread_local import StopEvent, ThreadLocal
 from .thread_local import thread_local as local
-from .worker import RoleMissingError, Worker
-from .worker_pool import ThreadWorkerPool, WorkerPool
+from .worker import RoleMissingError, Worker, WorkerOptions
+from .worker_pool import (
+    AutoscalingThreadWorkerPool,
+    ProcessWorkerPool,
+    RemoteError,
+    ScalingDecision,
+    ThreadStats,
+    ThreadWorkerPool,
+    WorkerPool,
+    WorkerProcessError,
+)
 
 __all__ = [
     "ServiceFactory",
@@ -21,12 +31,20 @@ __all__ = [
     "StopEvent",
     "WorkerPool",
     "ThreadWorkerPool",
+    "ThreadStats",
+    "AutoscalingThreadWorkerPool",
+    "ScalingDecision",
+    "ProcessWorkerPool",
+    "WorkerProcessError",
+    "RemoteError",
     "Consumer",
     "ConsumerFactory",
     "DefaultConsumerFactory",
     "ConsumerOptions",
     "Worker",
+    "WorkerOptions",
     "RoleMissingError",
     "QueueDiscovery",
     "Service",
+    "PreforkSupervisor",
 ]
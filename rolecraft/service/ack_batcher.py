@@ -0,0 +1,103 @@
+import collections
+import logging
+import threading
+
+from rolecraft.queue import Message, MessageQueue
+
+logger = logging.getLogger(__name__)
+
+
+class AckBatcher:
+    """Collects the acks of finished messages and sends them to the queues in
+    bulk. A queue's pending acks are flushed once there are `batch_size` of
+    them, or by the flushing thread every `flush_interval_seconds`.
+
+    After it is closed, pending acks are flushed and the later acks are sent
+    immediately.
+    """
+
+    def __init__(
+        self, batch_size: int, flush_interval_seconds: float = 0.1
+    ) -> None:
+        if batch_size < 1:
+            raise ValueError("batch size should be greater than 0")
+
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+
+        self._lock = threading.Lock()
+        self._pending = collections.defaultdict[
+            MessageQueue, list[tuple[Message, object]]
+        ](list)
+        self._closed = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._closed.is_set():
+            raise RuntimeError(f"{self.__class__.__name__} has closed!")
+
+        self._thread = threading.Thread(
+            target=self._flush_periodically,
+            name=f"{self.__class__.__name__}-Flush",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def ack(self, message: Message, result=None):
+        """The method is thread-safe."""
+        queue = message.queue
+        with self._lock:
+            pending = self._pending[queue]
+            pending.append((message, result))
+            if len(pending) < self.batch_size and not self._closed.is_set():
+                return
+            batch = self._pending.pop(queue)
+
+        self._flush_batch(queue, batch)
+
+    def flush(self):
+        """Flush all pending acks."""
+        with self._lock:
+            batches = list(self._pending.items())
+            self._pending.clear()
+
+        for queue, batch in batches:
+            self._flush_batch(queue, batch)
+
+    def close(self):
+        """Stop the flushing thread and flush all pending acks."""
+        self._closed.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    def _flush_periodically(self):
+        while not self._closed.wait(self.flush_interval_seconds):
+            self.flush()
+
+    def _flush_batch(
+        self, queue: MessageQueue, batch: list[tuple[Message, object]]
+    ):
+        messages = [message for message, _ in batch]
+        results = [result for _, result in batch]
+        logger.debug("Acking %i messages of %r", len(messages), queue)
+        try:
+            queue.ack_many(messages, results=results)
+        except Exception as e:
+            logger.error(
+                "Failed to ack %i messages in bulk, acking them one by one",
+                len(messages),
+                exc_info=e,
+            )
+        else:
+            return
+
+        for message, result in batch:
+            try:
+                message.ack(result=result)
+            except Exception as e:
+                logger.error(
+                    "Failed to ack message with ID: %s",
+                    message.id,
+                    exc_info=e,
+                )
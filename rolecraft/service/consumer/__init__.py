@@ -1,9 +1,21 @@
+from .byte_budget import ByteBudget
 from .consumer import Consumer, ConsumerStoppedError
 from .consumer_factory import (
     ConsumerFactory,
     ConsumerOptions,
     DefaultConsumerFactory,
+    NoPrefetch,
 )
+from .direct_consumer import DirectConsumer
+from .prefetch_controller import PrefetchController, PrefetchDecision
+from .scheduling_policy import (
+    DeficitRoundRobinPolicy,
+    SchedulingPolicy,
+    ShortestBacklogPolicy,
+    StrictPriorityPolicy,
+    WeightedFairPolicy,
+)
+from .threaded_consumer import DrainResult
 
 __all__ = [
     "Consumer",
@@ -11,4 +23,15 @@ __all__ = [
     "ConsumerFactory",
     "DefaultConsumerFactory",
     "ConsumerOptions",
+    "NoPrefetch",
+    "DirectConsumer",
+    "PrefetchController",
+    "PrefetchDecision",
+    "ByteBudget",
+    "SchedulingPolicy",
+    "StrictPriorityPolicy",
+    "WeightedFairPolicy",
+    "DeficitRoundRobinPolicy",
+    "ShortestBacklogPolicy",
+    "DrainResult",
 ]
@@ -0,0 +1,124 @@
+import threading
+from collections.abc import Mapping
+
+# The key of the queue settings for the byte quota of the queue
+QUOTA_SETTING = "prefetch_max_bytes"
+
+
+class ByteBudget:
+    """Bounds the encoded bytes of the buffered messages, in total and per
+    queue.
+
+    A message larger than a limit is still admitted when nothing is counted
+    against that limit, so an oversized message can't stall its queue
+    forever. While a queue waits for its quota, the other queues keep
+    admitting messages within the total.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        queue_max_bytes: int | None = None,
+        *,
+        queue_quotas: Mapping[str, int] | None = None,
+    ) -> None:
+        """`queue_quotas` overrides `queue_max_bytes` for specific queues.
+        A queue without a quota is only bounded by `max_bytes`."""
+        if max_bytes < 1:
+            raise ValueError("max bytes should be greater than 0")
+
+        self.max_bytes = max_bytes
+        self.queue_max_bytes = queue_max_bytes
+        self.queue_quotas = dict(queue_quotas or {})
+
+        self._condition = threading.Condition()
+        self._used = 0
+        self._queue_used: dict[str, int] = {}
+        self._closed = False
+
+    def quota(self, queue_name: str) -> int:
+        return min(
+            self.queue_quotas.get(
+                queue_name, self.queue_max_bytes or self.max_bytes
+            ),
+            self.max_bytes,
+        )
+
+    def _admissible(self, queue_name: str, size: int) -> bool:
+        queue_used = self._queue_used.get(queue_name, 0)
+        if queue_used and queue_used + size > self.quota(queue_name):
+            return False
+        return not self._used or self._used + size <= self.max_bytes
+
+    def _has_room(self, queue_name: str) -> bool:
+        return self._closed or (
+            self._queue_used.get(queue_name, 0) < self.quota(queue_name)
+            and self._used < self.max_bytes
+        )
+
+    def has_room(self, queue_name: str) -> bool:
+        """Whether the queue has any quota left."""
+        with self._condition:
+            return self._has_room(queue_name)
+
+    def room(self, queue_name: str) -> int:
+        """Returns the bytes the queue can still count within its quota and
+        the total."""
+        with self._condition:
+            return max(
+                min(
+                    self.quota(queue_name)
+                    - self._queue_used.get(queue_name, 0),
+                    self.max_bytes - self._used,
+                ),
+                0,
+            )
+
+    def wait_for_room(
+        self, queue_name: str, timeout: float | None = None
+    ) -> bool:
+        """Waits until the queue has any quota left. Returns False if it has
+        timed out."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self._has_room(queue_name), timeout
+            )
+
+    def acquire(
+        self, queue_name: str, size: int, timeout: float | None = None
+    ) -> bool:
+        """Waits until the message of the size can be buffered and counts
+        it. Returns False if it has timed out.
+
+        Once closed, it counts the message without waiting.
+        """
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._closed or self._admissible(queue_name, size),
+                timeout,
+            ):
+                return False
+            self._used += size
+            self._queue_used[queue_name] = (
+                self._queue_used.get(queue_name, 0) + size
+            )
+            return True
+
+    def release(self, queue_name: str, size: int):
+        with self._condition:
+            self._used -= size
+            self._queue_used[queue_name] -= size
+            self._condition.notify_all()
+
+    def close(self):
+        """Wakes up and stops all waiting acquisitions."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def used(self, queue_name: str | None = None) -> int:
+        """Returns the bytes counted, in total or for the queue."""
+        with self._condition:
+            if queue_name is None:
+                return self._used
+            return self._queue_used.get(queue_name, 0)
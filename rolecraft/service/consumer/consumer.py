@@ -24,8 +24,11 @@ class Consumer(abc.ABC, Iterator):
         raise NotImplementedError
 
     @abc.abstractmethod
-    def consume(self, max_num=1) -> list[Message]:
-        """The method is thread safe.
+    def consume(
+        self, max_num=1, timeout: float | None = None
+    ) -> list[Message]:
+        """The method is thread safe. It returns an empty list if no message
+        arrives in `timeout` seconds.
 
         Raises:
             ConsumerStoppedError: when call this method after stop() method is called. If the stop() is called during the process of this method, then it will return empty or partial result.
@@ -43,6 +46,11 @@ class Consumer(abc.ABC, Iterator):
         super().__next__
         raise NotImplementedError
 
+    @property
+    def buffered_num(self) -> int:
+        """The number of messages prefetched and not consumed yet"""
+        return 0
+
     @abc.abstractmethod
     def start(self):
         raise NotImplementedError
@@ -14,10 +14,12 @@ class ConsumerBase(Consumer):
         self.queues = queues
         self._stopped = False
 
-    def consume(self, max_num=1) -> list[Message]:
+    def consume(
+        self, max_num=1, timeout: float | None = None
+    ) -> list[Message]:
         if self._stopped:
             raise ConsumerStoppedError
-        msgs = self._fetch_from_queues(max_num)
+        msgs = self._fetch_from_queues(max_num, timeout)
         if self._stopped:
             # handle leftover messages. This can not be handled in the
             # Consumer's stop or join methods because they may end before the
@@ -49,17 +51,34 @@ class ConsumerBase(Consumer):
         pass
 
     @abc.abstractmethod
-    def _fetch_from_queues(self, max_num: int) -> list[Message]:
-        """It should be made thread-safe. It is necessary to check the stopped flag if it is expected to run for a prolonged period and return a partial result. The parant method consume() will requeue them if necessary."""
+    def _fetch_from_queues(
+        self, max_num: int, timeout: float | None = None
+    ) -> list[Message]:
+        """It should be made thread-safe. It returns an empty list after
+        `timeout` seconds without messages. It is necessary to check the stopped flag if it is expected to run for a prolonged period and return a partial result. The parant method consume() will requeue them if necessary."""
         raise NotImplementedError
 
-    def _requeue(self, *messages: Message):
+    def _requeue(self, *messages: Message) -> int:
+        """Requeues the messages in bulk per queue. Returns the number of
+        messages requeued."""
         assert self._stopped
+        queue_messages: dict[MessageQueue, list[Message]] = {}
         for message in messages:
-            logger.warning("Requeue the message %s after stopping", message.id)
+            queue_messages.setdefault(message.queue, []).append(message)
+
+        requeued = 0
+        for queue, msgs in queue_messages.items():
+            logger.warning(
+                "Requeue %i messages of %r after stopping", len(msgs), queue
+            )
             try:
-                message.requeue()
+                queue.requeue_many(msgs)
             except Exception as e:
                 logger.error(
-                    "Requeue message error: %s", message.id, exc_info=e
+                    "Requeue messages error: %s",
+                    [message.id for message in msgs],
+                    exc_info=e,
                 )
+            else:
+                requeued += len(msgs)
+        return requeued
@@ -3,6 +3,11 @@ from typing import Protocol, TypedDict
 
 from rolecraft.queue import MessageQueue
 
+from . import byte_budget as _byte_budget
+from . import direct_consumer as _direct_consumer
+from . import multiplex_consumer as _multiplex_consumer
+from . import prefetch_controller as _prefetch_controller
+from . import scheduling_policy as _scheduling_policy
 from . import threaded_consumer as _threaded_consumer
 from .consumer import Consumer
 
@@ -14,6 +19,22 @@ class NoPrefetch:
 class ConsumerOptions(TypedDict, total=False):
     no_prefetch: NoPrefetch
     prefetch_size: int
+    # Serve the queues with the number of poller threads instead of a thread
+    # per queue
+    poller_num: int
+    # Size the prefetching of each queue to buffer about the seconds of work,
+    # within the prefetch size
+    prefetch_target_seconds: float
+    # Bound the encoded bytes of the buffered messages, in total and per
+    # queue. The "prefetch_max_bytes" setting of a queue overrides the quota
+    # of the queue
+    prefetch_max_bytes: int
+    prefetch_queue_max_bytes: int
+    # Consume the prefetched messages of the queues in the order of the
+    # policy, weighted by the "weight" setting of the queues
+    scheduling_policy: _scheduling_policy.SchedulingPolicyName
+    # Requeue the prefetched messages for at most the seconds when stopping
+    drain_timeout_seconds: float
 
 
 class ConsumerFactory(Protocol):
@@ -22,8 +43,14 @@ class ConsumerFactory(Protocol):
         queues: Sequence[MessageQueue],
         no_prefetch: NoPrefetch | None = None,
         prefetch_size=0,
-    ) -> Consumer:
-        ...
+        poller_num=0,
+        prefetch_target_seconds=0.0,
+        prefetch_max_bytes=0,
+        prefetch_queue_max_bytes=0,
+        scheduling_policy: _scheduling_policy.SchedulingPolicyName
+        | None = None,
+        drain_timeout_seconds: float | None = None,
+    ) -> Consumer: ...
 
 
 class DefaultConsumerFactory(ConsumerFactory):
@@ -32,11 +59,62 @@ class DefaultConsumerFactory(ConsumerFactory):
         queues: Sequence[MessageQueue],
         no_prefetch: NoPrefetch | None = None,
         prefetch_size=0,
+        poller_num=0,
+        prefetch_target_seconds=0.0,
+        prefetch_max_bytes=0,
+        prefetch_queue_max_bytes=0,
+        scheduling_policy: _scheduling_policy.SchedulingPolicyName
+        | None = None,
+        drain_timeout_seconds: float | None = None,
     ) -> Consumer:
         if no_prefetch:
-            raise NotImplementedError
+            return _direct_consumer.DirectConsumer(queues=queues)
+
+        prefetch_controller = None
+        if prefetch_target_seconds:
+            prefetch_controller = _prefetch_controller.PrefetchController(
+                max_buffered=prefetch_size,
+                target_seconds=prefetch_target_seconds,
+            )
+        byte_budget = None
+        if prefetch_max_bytes:
+            byte_budget = _byte_budget.ByteBudget(
+                max_bytes=prefetch_max_bytes,
+                queue_max_bytes=prefetch_queue_max_bytes or None,
+                queue_quotas={
+                    queue.name: queue.settings[_byte_budget.QUOTA_SETTING]
+                    for queue in queues
+                    if queue.settings.get(_byte_budget.QUOTA_SETTING)
+                },
+            )
+        policy = None
+        if scheduling_policy:
+            policy = _scheduling_policy.create_scheduling_policy(
+                scheduling_policy,
+                weights={
+                    queue.name: queue.settings.get(
+                        _scheduling_policy.WEIGHT_SETTING, 1
+                    )
+                    for queue in queues
+                },
+            )
+        if poller_num:
+            return _multiplex_consumer.MultiplexConsumer(
+                queues=queues,
+                prefetch_size=prefetch_size,
+                poller_num=poller_num,
+                prefetch_controller=prefetch_controller,
+                byte_budget=byte_budget,
+                scheduling_policy=policy,
+                drain_timeout_seconds=drain_timeout_seconds,
+            )
         return _threaded_consumer.ThreadedConsumer(
-            queues=queues, prefetch_size=prefetch_size
+            queues=queues,
+            prefetch_size=prefetch_size,
+            prefetch_controller=prefetch_controller,
+            byte_budget=byte_budget,
+            scheduling_policy=policy,
+            drain_timeout_seconds=drain_timeout_seconds,
         )
 
     __call__ = create
@@ -0,0 +1,175 @@
+import dataclasses
+import itertools
+import logging
+import threading
+import time
+from collections.abc import Sequence
+
+from rolecraft.broker import ReceiveFuture, wait_any
+from rolecraft.queue import Message, MessageQueue
+
+from .consumer_base import ConsumerBase
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class _WorkerState:
+    # The index of the queue to start the next fetch from
+    offset: int
+
+
+class DirectConsumer(ConsumerBase):
+    """Receives messages from the broker in the worker threads, only when
+    they ask for messages, so that no message is prefetched and held by a
+    busy worker.
+
+    A worker first tries the queues without waiting, in turn starting after
+    the queue it was last served by. If they are all empty, it waits on a
+    window of at most `waiting_queue_num` queues, so many queues are served
+    by a few workers without a thread per queue; the windows of the workers
+    are spread across the queues. The queues are tried again every
+    `rescan_seconds` for messages outside the window.
+
+    Messages received beyond the number asked for, when several queues
+    deliver at once, are requeued immediately.
+    """
+
+    def __init__(
+        self,
+        queues: Sequence[MessageQueue],
+        *,
+        waiting_queue_num: int = 8,
+        rescan_seconds: float = 1.0,
+    ) -> None:
+        if waiting_queue_num < 1:
+            raise ValueError("waiting queue number should be greater than 0")
+        if rescan_seconds <= 0:
+            raise ValueError("rescan seconds should be greater than 0")
+
+        super().__init__(queues=queues)
+        self.waiting_queue_num = waiting_queue_num
+        self.rescan_seconds = rescan_seconds
+
+        self._lock = threading.Lock()
+        self._worker_counter = itertools.count()
+        self._local = threading.local()
+        self._result_futures_set: set[ReceiveFuture] = set()
+
+    def stop(self):
+        super().stop()
+
+        # Cancel blocking receiving of the worker threads
+        with self._lock:
+            futures = list(self._result_futures_set)
+        for future in futures:
+            logger.debug("Cancel result future %r", future)
+            future.cancel()
+
+    def _worker_state(self) -> _WorkerState:
+        state = getattr(self._local, "state", None)
+        if state is None:
+            index = next(self._worker_counter)
+            state = _WorkerState(
+                offset=index * self.waiting_queue_num % len(self.queues)
+            )
+            self._local.state = state
+        return state
+
+    def _fetch_from_queues(
+        self, max_num: int, timeout: float | None = None
+    ) -> list[Message]:
+        """It is called by the worker threads"""
+        if not self.queues:
+            return []
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        state = self._worker_state()
+        queue_num = len(self.queues)
+        while not self._stopped:
+            ordered = self.queues[state.offset :] + self.queues[: state.offset]
+            for i, queue in enumerate(ordered):
+                msgs = queue.receive(max_number=max_num)
+                if msgs:
+                    state.offset = (state.offset + i + 1) % queue_num
+                    return msgs
+                if self._stopped:
+                    return []
+
+            wait_seconds = self.rescan_seconds
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                wait_seconds = min(wait_seconds, remaining)
+
+            window = ordered[: self.waiting_queue_num]
+            msgs, i = self._wait(window, max_num, wait_seconds)
+            if msgs:
+                state.offset = (state.offset + i + 1) % queue_num
+                return msgs
+            # Wait on the next queues next time
+            state.offset = (state.offset + len(window)) % queue_num
+        return []
+
+    def _wait(
+        self,
+        queues: Sequence[MessageQueue],
+        max_num: int,
+        wait_seconds: float,
+    ) -> tuple[list[Message], int]:
+        """Waits for messages from any of the queues for at most
+        `wait_seconds`. Returns at most `max_num` messages and the index of
+        the first queue delivering them."""
+        futures = [
+            queue.block_receive(
+                max_number=max_num, wait_time_seconds=wait_seconds
+            )
+            for queue in queues
+        ]
+        with self._lock:
+            self._result_futures_set.update(futures)
+        # Hook the futures with the stop event
+        if self._stopped:
+            for future in futures:
+                future.cancel()
+
+        try:
+            if len(futures) == 1:
+                (future,) = futures
+                done = {future: future.result()}
+            else:
+                done = wait_any(futures)
+        finally:
+            with self._lock:
+                self._result_futures_set.difference_update(futures)
+
+        msgs: list[Message] = []
+        first_index = -1
+        for i, (queue, future) in enumerate(zip(queues, futures)):
+            if future in done:
+                received = done[future]
+            else:
+                # Messages may have been received before the cancellation
+                future.cancel()
+                received = future.result()
+            if not received:
+                continue
+
+            if msgs:
+                self._requeue_surplus(queue, received)
+            else:
+                msgs = received
+                first_index = i
+        return msgs, first_index
+
+    def _requeue_surplus(self, queue: MessageQueue, msgs: list[Message]):
+        logger.debug("Requeue %i surplus messages of %r", len(msgs), queue)
+        try:
+            queue.requeue_many(msgs)
+        except Exception as e:
+            logger.error(
+                "Requeue messages error: %s",
+                [message.id for message in msgs],
+                exc_info=e,
+            )
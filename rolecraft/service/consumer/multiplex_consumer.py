@@ -0,0 +1,201 @@
+import dataclasses
+import logging
+import math
+import threading
+import time
+from collections import deque
+from collections.abc import Sequence
+
+from rolecraft.queue import Message, MessageQueue
+
+from .byte_budget import ByteBudget
+from .prefetch_controller import PrefetchController
+from .scheduling_policy import SchedulingPolicy
+from .threaded_consumer import ThreadedConsumer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass(eq=False)
+class _QueueState:
+    queue: MessageQueue
+    # seconds to wait before polling the queue again after an empty receive
+    backoff: float = 0.0
+    next_poll_at: float = 0.0
+    # the number of messages received by the last poll
+    last_received: int = 0
+    # received messages waiting for the byte budget
+    pending: deque[Message] = dataclasses.field(default_factory=deque)
+
+
+def _due_states(
+    states: Sequence[_QueueState], now: float
+) -> list[_QueueState]:
+    """Returns the queues due for polling, the ones with the largest backlog
+    first."""
+    due_states = [s for s in states if s.next_poll_at <= now]
+    due_states.sort(key=lambda s: s.last_received, reverse=True)
+    return due_states
+
+
+class MultiplexConsumer(ThreadedConsumer):
+    """Serves many queues with a fixed number of poller threads, instead of a
+    thread per queue.
+
+    Queues are distributed among the pollers. A poller receives from its
+    queues without blocking: a queue that returned no messages is polled
+    again after a backoff, which doubles up to `max_backoff_seconds` while
+    the queue stays idle and is reset once messages are received. The queues
+    that returned messages last time are polled first, those with the
+    largest backlog ahead of the others. With a prefetch controller or a
+    byte budget, a queue whose buffered messages have reached its target or
+    byte quota is skipped. Received messages which don't fit into the byte
+    budget are held by the poller until they do, so that a queue of large
+    messages can't block the other queues of the poller.
+    """
+
+    def __init__(
+        self,
+        queues: Sequence[MessageQueue],
+        prefetch_size: int,
+        poller_num: int = 1,
+        prefetch_controller: PrefetchController | None = None,
+        byte_budget: ByteBudget | None = None,
+        scheduling_policy: SchedulingPolicy | None = None,
+        drain_timeout_seconds: float | None = None,
+        *,
+        min_backoff_seconds: float = 0.01,
+        max_backoff_seconds: float = 1.0,
+    ) -> None:
+        if poller_num < 1:
+            raise ValueError("poller number should be greater than 0")
+        if not 0 < min_backoff_seconds <= max_backoff_seconds:
+            raise ValueError("invalid backoff seconds")
+
+        super().__init__(
+            queues=queues,
+            prefetch_size=prefetch_size,
+            prefetch_controller=prefetch_controller,
+            byte_budget=byte_budget,
+            scheduling_policy=scheduling_policy,
+            drain_timeout_seconds=drain_timeout_seconds,
+        )
+        self.poller_num = min(poller_num, len(queues)) or 1
+        self.min_backoff_seconds = min_backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        super().stop()
+        # Wake up the pollers waiting for the next poll
+        self._stop_event.set()
+
+    def _start_consumer_threads(self):
+        """It should be thread-safe"""
+        with self._lock:
+            if self._consumer_threads:
+                return
+
+            for i in range(self.poller_num):
+                queues = self.queues[i :: self.poller_num]
+                thread = threading.Thread(
+                    target=self._poll,
+                    args=(queues,),
+                    name=f"{self.__class__.__name__}_poller_{i}",
+                )
+                self._consumer_threads.append(thread)
+                thread.start()
+
+    def _poll(self, queues: Sequence[MessageQueue]):
+        thread_name = threading.current_thread().name
+        logger.info(
+            "Poller thread '%s' started for %i queues.",
+            thread_name,
+            len(queues),
+        )
+
+        local_queue = self._local_queue
+        assert local_queue.maxsize > 0
+        batch_size = math.ceil(local_queue.maxsize / self.poller_num)
+        states = [_QueueState(queue) for queue in queues]
+        if not states:
+            return
+
+        while not self._stopped:
+            now = time.monotonic()
+            due_states = _due_states(states, now)
+            if not due_states:
+                next_poll_at = min(s.next_poll_at for s in states)
+                self._stop_event.wait(next_poll_at - now)
+                continue
+
+            for state in due_states:
+                if self._stopped:
+                    break
+                self._poll_queue(state, batch_size)
+
+        for state in states:
+            self._requeue(*state.pending)
+        logger.info("Poller thread '%s' stopped.", thread_name)
+
+    def _poll_queue(self, state: _QueueState, batch_size: int):
+        queue = state.queue
+        byte_budget = self.byte_budget
+        if not self._put_pending(state) or (
+            byte_budget and not byte_budget.has_room(queue.name)
+        ):
+            self._skip_queue(state)
+            return
+        controller = self.prefetch_controller
+        if controller:
+            batch_size = controller.reserve(queue.name, timeout=0)
+            if not batch_size:
+                self._skip_queue(state)
+                return
+
+        try:
+            msgs = queue.block_receive(
+                max_number=batch_size, wait_time_seconds=0
+            ).result()
+        except Exception as e:
+            logger.error("Receive error from %r", queue, exc_info=e)
+            msgs = []
+        if controller:
+            controller.release(queue.name, batch_size - len(msgs))
+
+        state.last_received = len(msgs)
+        if msgs:
+            state.backoff = 0
+            state.next_poll_at = 0
+        else:
+            state.backoff = min(
+                max(state.backoff * 2, self.min_backoff_seconds),
+                self.max_backoff_seconds,
+            )
+            state.next_poll_at = time.monotonic() + state.backoff
+
+        for msg in msgs:
+            logger.debug("Message %s received from %r", msg.id, queue)
+        state.pending.extend(msgs)
+        self._put_pending(state)
+
+    def _skip_queue(self, state: _QueueState):
+        """The queue can't buffer more messages now, check it later."""
+        state.last_received = 0
+        state.next_poll_at = time.monotonic() + self.min_backoff_seconds
+
+    def _put_pending(self, state: _QueueState) -> bool:
+        """Puts the pending messages into the local queue as the byte budget
+        allows. Returns whether all of them are put."""
+        pending = state.pending
+        byte_budget = self.byte_budget
+        while pending:
+            msg = pending[0]
+            if byte_budget and not byte_budget.acquire(
+                state.queue.name, msg.encoded_size, timeout=0
+            ):
+                return False
+            pending.popleft()
+            # block when the local queue is full
+            self._local_queue.put(msg)
+        return True
@@ -1,66 +1,151 @@
-from collections.abc import Iterator
-import queue
 import threading
+import time
+from collections import deque
+from collections.abc import Iterator, Sequence
 
 
 class NotifyQueue[Item](Iterator):
-    def __init__(self, maxsize: int = 0) -> None:
-        self._queue = queue.Queue[Item](maxsize=maxsize)
-        self._condition = threading.Condition()
-        self._all_notfied = False
+    """A bounded FIFO buffer between the consumer threads and the workers.
+
+    Items are put and got in batches under a single lock. A getter finding
+    the buffer empty spins for `spin_seconds` before blocking, as an item
+    is often put within microseconds while the consumers are busy.
+    """
+
+    def __init__(self, maxsize: int = 0, spin_seconds: float = 50e-6) -> None:
+        self.maxsize = maxsize
+        self.spin_seconds = spin_seconds
+
+        self._items = deque[Item]()
+        lock = threading.Lock()
+        self._condition = threading.Condition(lock)
+        self._not_full = threading.Condition(lock)
+        self._all_notified = False
+        self._closed = False
+
+    def __len__(self) -> int:
+        return len(self._items)
 
     @property
-    def maxsize(self):
-        return self._queue.maxsize
+    def closed(self) -> bool:
+        return self._closed
+
+    def _spin(self):
+        deadline = time.perf_counter() + self.spin_seconds
+        # Sleeping 0 seconds releases the GIL to the putting threads
+        while not self._items and time.perf_counter() < deadline:
+            time.sleep(0)
+
+    def _take(self, max_num: int) -> list[Item]:
+        items = self._items
+        taken = [items.popleft() for _ in range(min(max_num, len(items)))]
+        if self.maxsize > 0:
+            self._not_full.notify(len(taken))
+        return taken
 
     def get_nowait(self) -> Item | None:
-        try:
-            return self._queue.get_nowait()
-        except queue.Empty:
-            return None
+        with self._condition:
+            if not self._items:
+                return None
+            return self._take(1)[0]
 
-    def get(self, wakeup_until_notify_all=False) -> Item | None:
+    def get(
+        self, wakeup_until_notify_all=False, timeout: float | None = None
+    ) -> Item | None:
         """Blocking get an item from the queue"""
-        item = self.get_nowait()
-        if item is not None:
-            return item
+        items = self.get_many(1, wakeup_until_notify_all, timeout)
+        return items[0] if items else None
+
+    def get_many(
+        self,
+        max_num: int,
+        wakeup_until_notify_all=False,
+        timeout: float | None = None,
+    ) -> list[Item]:
+        """Blocking get at most `max_num` items from the queue.
+
+        It returns an empty list when woken up without items, which is only
+        by `notify_all()` if `wakeup_until_notify_all` is set, when it has
+        timed out, or when the queue is closed.
+        """
+        if not self._items and self.spin_seconds > 0:
+            self._spin()
 
         with self._condition:
-            # avoid dead-lock: wait only when queue is empty
-            if not self._queue.empty():
-                item = self.get_nowait()
-                if item is not None:
-                    return item
+            if self._items:
+                return self._take(max_num)
 
             # avoid dead-lock: don't wait if all notified
-            if wakeup_until_notify_all and self._all_notfied:
-                return
+            if self._closed or (
+                wakeup_until_notify_all and self._all_notified
+            ):
+                return []
 
+            # The timeout is for the whole call, not for each wakeup
+            if timeout is not None:
+                deadline = time.monotonic() + timeout
             while True:
-                self._condition.wait()
+                if timeout is None:
+                    notified = self._condition.wait()
+                else:
+                    notified = self._condition.wait(
+                        deadline - time.monotonic()
+                    )
 
-                item = self.get_nowait()
-                if item is not None:
-                    return item
+                if self._items:
+                    return self._take(max_num)
 
-                if not wakeup_until_notify_all or self._all_notfied:
-                    return
+                if (
+                    not notified
+                    or not wakeup_until_notify_all
+                    or self._all_notified
+                    or self._closed
+                ):
+                    return []
 
-    def put(self, item: Item):
-        """Blocking put"""
-        self._queue.put(item)
+    def _full(self) -> bool:
+        return 0 < self.maxsize <= len(self._items) and not self._closed
 
-        with self._condition:
+    def put(self, item: Item):
+        """Blocking put, which doesn't block once the queue is closed"""
+        with self._not_full:
+            while self._full():
+                self._not_full.wait()
+            self._items.append(item)
             self._condition.notify()
 
+    def put_many(self, items: Sequence[Item]):
+        """Blocking put the items, in parts as the room is freed up"""
+        maxsize = self.maxsize
+        start = 0
+        with self._not_full:
+            while start < len(items):
+                while self._full():
+                    self._not_full.wait()
+                if maxsize > 0 and not self._closed:
+                    end = min(start + maxsize - len(self._items), len(items))
+                else:
+                    end = len(items)
+                self._items.extend(items[start:end])
+                self._condition.notify(end - start)
+                start = end
+
     def notify_all(self):
         with self._condition:
-            self._all_notfied = True
+            self._all_notified = True
             self._condition.notify_all()
 
+    def close(self):
+        """No more items are expected. Getters don't wait for items and
+        putters don't wait for room any longer."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            self._not_full.notify_all()
+
     # Iterator method
     def __next__(self) -> Item:
-        try:
-            return self._queue.get_nowait()
-        except queue.Empty:
+        item = self.get_nowait()
+        if item is None:
             raise StopIteration
+        return item
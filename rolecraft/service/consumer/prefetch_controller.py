@@ -0,0 +1,158 @@
+import dataclasses
+import math
+import threading
+import time
+from collections.abc import Iterable
+
+
+@dataclasses.dataclass(frozen=True)
+class PrefetchDecision:
+    queue_name: str
+    # The average seconds to handle a message of the queue, None if unknown
+    handling_seconds: float | None
+    # The number of messages to keep buffered
+    target: int
+    # The number of messages buffered or being received
+    buffered: int
+
+
+@dataclasses.dataclass
+class _QueueStats:
+    handling_seconds: float | None = None
+    buffered: int = 0
+
+
+class PrefetchController:
+    """Sizes the prefetching of each queue to keep about `target_seconds` of
+    work buffered for it, based on how long its messages take to handle.
+    The number of buffered messages of all queues never exceeds
+    `max_buffered`. This memory ceiling is a message count, not bytes, as
+    the size of a message is only known once it is received; a ByteBudget,
+    e.g. from `prefetch_max_bytes`, bounds the buffered bytes as well.
+
+    The handling time of messages is observed from the worker threads: the
+    time between a thread taking messages from the buffer and coming back
+    for more is attributed to the messages it took. It is smoothed with an
+    exponential moving average.
+
+    If `max_buffered` can't cover the targets of all queues, the buffer is
+    shared on a first-come basis, and each queue can still get one message
+    buffered whenever there is room.
+    """
+
+    def __init__(
+        self,
+        max_buffered: int,
+        target_seconds: float = 1.0,
+        *,
+        smoothing: float = 0.2,
+    ) -> None:
+        if max_buffered < 1:
+            raise ValueError("max buffered should be greater than 0")
+        if target_seconds <= 0:
+            raise ValueError("target seconds should be greater than 0")
+        if not 0 < smoothing <= 1:
+            raise ValueError("smoothing should be in (0, 1]")
+
+        self.max_buffered = max_buffered
+        self.target_seconds = target_seconds
+        self.smoothing = smoothing
+
+        self._condition = threading.Condition()
+        self._stats: dict[str, _QueueStats] = {}
+        self._buffered = 0
+        self._closed = False
+        # (queue names of the taken messages, the time they were taken)
+        self._taken = threading.local()
+
+    def _target(self, stats: _QueueStats) -> int:
+        if not stats.handling_seconds:
+            return 1
+        target = math.ceil(self.target_seconds / stats.handling_seconds)
+        return max(1, min(target, self.max_buffered))
+
+    def _available(self, stats: _QueueStats) -> int:
+        return min(
+            self._target(stats) - stats.buffered,
+            self.max_buffered - self._buffered,
+        )
+
+    def reserve(self, queue_name: str, timeout: float | None = None) -> int:
+        """Waits until the queue can buffer more messages and reserves the
+        room for them. Returns the number of messages to receive, which is 0
+        if it has timed out or the controller is closed.
+
+        The room not taken by received messages should be released.
+        """
+        with self._condition:
+            stats = self._stats.setdefault(queue_name, _QueueStats())
+            self._condition.wait_for(
+                lambda: self._closed or self._available(stats) > 0, timeout
+            )
+            if self._closed:
+                return 0
+            num = max(self._available(stats), 0)
+            stats.buffered += num
+            self._buffered += num
+            return num
+
+    def release(self, queue_name: str, num: int):
+        """Releases the reserved room of messages which are not buffered."""
+        if num <= 0:
+            return
+        with self._condition:
+            self._stats[queue_name].buffered -= num
+            self._buffered -= num
+            self._condition.notify_all()
+
+    def taken(self, queue_names: Iterable[str]):
+        """The current worker thread has taken messages of the queues from
+        the buffer."""
+        queue_names = list(queue_names)
+        with self._condition:
+            for queue_name in queue_names:
+                self._stats[queue_name].buffered -= 1
+            self._buffered -= len(queue_names)
+            self._condition.notify_all()
+        self._taken.value = (queue_names, time.monotonic())
+
+    def handled(self):
+        """The current worker thread has handled the messages it took."""
+        taken = getattr(self._taken, "value", None)
+        if not taken:
+            return
+        self._taken.value = None
+
+        queue_names, taken_at = taken
+        seconds = (time.monotonic() - taken_at) / len(queue_names)
+        alpha = self.smoothing
+        with self._condition:
+            for queue_name in queue_names:
+                stats = self._stats[queue_name]
+                if stats.handling_seconds is None:
+                    stats.handling_seconds = seconds
+                else:
+                    stats.handling_seconds = (
+                        alpha * seconds + (1 - alpha) * stats.handling_seconds
+                    )
+            # targets may have grown
+            self._condition.notify_all()
+
+    def close(self):
+        """Wakes up and stops all reservations."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def decisions(self) -> dict[str, PrefetchDecision]:
+        """Returns the current decisions of the queues for inspection."""
+        with self._condition:
+            return {
+                queue_name: PrefetchDecision(
+                    queue_name=queue_name,
+                    handling_seconds=stats.handling_seconds,
+                    target=self._target(stats),
+                    buffered=stats.buffered,
+                )
+                for queue_name, stats in self._stats.items()
+            }
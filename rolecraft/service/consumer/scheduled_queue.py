@@ -0,0 +1,136 @@
+import threading
+from collections import deque
+from collections.abc import Callable, Iterator, Sequence
+
+from .scheduling_policy import SchedulingPolicy
+
+
+class ScheduledQueue[Item](Iterator):
+    """A buffer of items from several queues, taken in the order decided by
+    the scheduling policy. It has the same interface as the NotifyQueue.
+
+    Each queue is bounded by `queue_maxsize` on its own, so that a bulk
+    queue filling its part of the buffer doesn't block the other queues
+    from buffering.
+    """
+
+    def __init__(
+        self,
+        policy: SchedulingPolicy,
+        key: Callable[[Item], str],
+        maxsize: int,
+        queue_maxsize: int,
+    ) -> None:
+        if queue_maxsize < 1:
+            raise ValueError("queue maxsize should be greater than 0")
+
+        self.policy = policy
+        self.key = key
+        # The total size is informational, the queues are bounded separately
+        self.maxsize = maxsize
+        self.queue_maxsize = queue_maxsize
+
+        lock = threading.Lock()
+        self._condition = threading.Condition(lock)
+        self._queue_not_full = threading.Condition(lock)
+        self._queues: dict[str, deque[Item]] = {}
+        # The numbers of items of the non-empty queues
+        self._backlogs: dict[str, int] = {}
+        self._all_notified = False
+        self._closed = False
+
+    def __len__(self) -> int:
+        return sum(self._backlogs.values())
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def _get(self) -> Item | None:
+        if not self._backlogs:
+            return None
+        queue_name = self.policy.select(self._backlogs)
+        item = self._queues[queue_name].popleft()
+        backlog = self._backlogs[queue_name] - 1
+        if backlog:
+            self._backlogs[queue_name] = backlog
+        else:
+            del self._backlogs[queue_name]
+        self._queue_not_full.notify_all()
+        return item
+
+    def get_nowait(self) -> Item | None:
+        with self._condition:
+            return self._get()
+
+    def get(
+        self, wakeup_until_notify_all=False, timeout: float | None = None
+    ) -> Item | None:
+        """Blocking get an item from the queue"""
+        items = self.get_many(1, wakeup_until_notify_all, timeout)
+        return items[0] if items else None
+
+    def get_many(
+        self,
+        max_num: int,
+        wakeup_until_notify_all=False,
+        timeout: float | None = None,
+    ) -> list[Item]:
+        """Blocking get at most `max_num` items from the queue"""
+        with self._condition:
+            while True:
+                if self._backlogs:
+                    items = []
+                    while len(items) < max_num:
+                        item = self._get()
+                        if item is None:
+                            break
+                        items.append(item)
+                    return items
+                if self._closed or (
+                    wakeup_until_notify_all and self._all_notified
+                ):
+                    return []
+                notified = self._condition.wait(timeout)
+                if not self._backlogs and (
+                    not notified or not wakeup_until_notify_all
+                ):
+                    return []
+
+    def put(self, item: Item):
+        """Blocking put until the queue of the item has room, which doesn't
+        block once the queue is closed"""
+        queue_name = self.key(item)
+        with self._condition:
+            items = self._queues.setdefault(queue_name, deque())
+            self._queue_not_full.wait_for(
+                lambda: self._closed or len(items) < self.queue_maxsize
+            )
+            items.append(item)
+            self._backlogs[queue_name] = len(items)
+            self.policy.enqueued(queue_name)
+            self._condition.notify()
+
+    def put_many(self, items: Sequence[Item]):
+        for item in items:
+            self.put(item)
+
+    def notify_all(self):
+        with self._condition:
+            self._all_notified = True
+            self._condition.notify_all()
+
+    def close(self):
+        """No more items are expected. Getters don't wait for items and
+        putters don't wait for room any longer."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            self._queue_not_full.notify_all()
+
+    # Iterator method
+    def __next__(self) -> Item:
+        item = self.get_nowait()
+        if item is None:
+            raise StopIteration
+        return item
@@ -0,0 +1,136 @@
+import abc
+from collections import deque
+from collections.abc import Mapping
+from typing import Literal
+
+# The key of the queue settings for the weight of the queue
+WEIGHT_SETTING = "weight"
+
+SchedulingPolicyName = Literal[
+    "strict_priority",
+    "weighted_fair",
+    "deficit_round_robin",
+    "shortest_backlog",
+]
+
+
+class SchedulingPolicy(abc.ABC):
+    """Decides the queue whose buffered message is handed to the workers
+    next.
+
+    The methods are called under the lock of the buffer, they don't need to
+    be thread-safe.
+    """
+
+    def __init__(self, weights: Mapping[str, float] | None = None) -> None:
+        """Queues without a weight have the weight 1."""
+        if any(weight <= 0 for weight in (weights or {}).values()):
+            raise ValueError("weights should be greater than 0")
+        self.weights = dict(weights or {})
+
+    def weight(self, queue_name: str) -> float:
+        return self.weights.get(queue_name, 1)
+
+    def enqueued(self, queue_name: str):
+        """A message of the queue is buffered."""
+
+    @abc.abstractmethod
+    def select(self, backlogs: Mapping[str, int]) -> str:
+        """Returns the queue to take a message from, among the queues with
+        buffered messages and their numbers."""
+        raise NotImplementedError
+
+
+class StrictPriorityPolicy(SchedulingPolicy):
+    """Always serves the queue with the largest weight first."""
+
+    def select(self, backlogs: Mapping[str, int]) -> str:
+        return max(backlogs, key=self.weight)
+
+
+class WeightedFairPolicy(SchedulingPolicy):
+    """Weighted fair queuing: serves the queues in proportion to their
+    weights.
+
+    Each message is tagged with its virtual finish time when buffered, and
+    the message with the smallest tag is served first. The virtual time is
+    the tag of the last served message (self-clocked fair queuing).
+    """
+
+    def __init__(self, weights: Mapping[str, float] | None = None) -> None:
+        super().__init__(weights)
+        self._virtual_time = 0.0
+        self._last_finish: dict[str, float] = {}
+        self._finish_tags: dict[str, deque[float]] = {}
+
+    def enqueued(self, queue_name: str):
+        start = max(self._virtual_time, self._last_finish.get(queue_name, 0.0))
+        finish = start + 1 / self.weight(queue_name)
+        self._last_finish[queue_name] = finish
+        self._finish_tags.setdefault(queue_name, deque()).append(finish)
+
+    def select(self, backlogs: Mapping[str, int]) -> str:
+        tags = self._finish_tags
+        queue_name = min(backlogs, key=lambda name: tags[name][0])
+        self._virtual_time = tags[queue_name].popleft()
+        return queue_name
+
+
+class DeficitRoundRobinPolicy(SchedulingPolicy):
+    """Deficit round robin: visits the queues in turn, each turn crediting
+    the queue with its weight and serving a message per credit."""
+
+    def __init__(self, weights: Mapping[str, float] | None = None) -> None:
+        super().__init__(weights)
+        self._ring: list[str] = []
+        self._deficits: dict[str, float] = {}
+        self._index = 0
+        self._credited = False
+
+    def enqueued(self, queue_name: str):
+        if queue_name not in self._deficits:
+            self._ring.append(queue_name)
+            self._deficits[queue_name] = 0.0
+
+    def select(self, backlogs: Mapping[str, int]) -> str:
+        deficits = self._deficits
+        while True:
+            queue_name = self._ring[self._index]
+            if queue_name in backlogs:
+                if not self._credited:
+                    deficits[queue_name] += self.weight(queue_name)
+                    self._credited = True
+                if deficits[queue_name] >= 1:
+                    deficits[queue_name] -= 1
+                    return queue_name
+            else:
+                # An idle queue doesn't save up its credits
+                deficits[queue_name] = 0.0
+            self._index = (self._index + 1) % len(self._ring)
+            self._credited = False
+
+
+class ShortestBacklogPolicy(SchedulingPolicy):
+    """Serves the queue with the fewest buffered messages first, so that a
+    queue with occasional messages isn't queued behind a bulk queue."""
+
+    def select(self, backlogs: Mapping[str, int]) -> str:
+        return min(backlogs, key=backlogs.__getitem__)
+
+
+_POLICIES: dict[SchedulingPolicyName, type[SchedulingPolicy]] = {
+    "strict_priority": StrictPriorityPolicy,
+    "weighted_fair": WeightedFairPolicy,
+    "deficit_round_robin": DeficitRoundRobinPolicy,
+    "shortest_backlog": ShortestBacklogPolicy,
+}
+
+
+def create_scheduling_policy(
+    name: SchedulingPolicyName, weights: Mapping[str, float] | None = None
+) -> SchedulingPolicy:
+    try:
+        policy_cls = _POLICIES[name]
+    except KeyError:
+        raise ValueError(f"Unknown scheduling policy: {name}") from None
+    return policy_cls(weights)
@@ -1,4 +1,5 @@
 import contextlib
+import dataclasses
 import logging
 import math
 import threading
@@ -8,35 +9,101 @@ from collections.abc import Sequence
 from rolecraft.queue import Message, MessageQueue
 
 from . import notify_queue as _notify_queue
+from . import scheduled_queue as _scheduled_queue
+from .byte_budget import ByteBudget
 from .consumer_base import ConsumerBase
+from .prefetch_controller import PrefetchController
+from .scheduling_policy import SchedulingPolicy
 
 logger = logging.getLogger(__name__)
 
 
+@dataclasses.dataclass(frozen=True)
+class DrainResult:
+    # The number of messages requeued from the local queue
+    returned: int
+    # The number of messages left by the deadline or failed to be requeued
+    abandoned: int
+
+
+def _remaining(deadline: float | None) -> float | None:
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
 class ThreadedConsumer(ConsumerBase):
     def __init__(
         self,
         queues: Sequence[MessageQueue],
         prefetch_size: int,
+        prefetch_controller: PrefetchController | None = None,
+        byte_budget: ByteBudget | None = None,
+        scheduling_policy: SchedulingPolicy | None = None,
+        drain_timeout_seconds: float | None = None,
     ) -> None:
+        """If the prefetch controller is provided, it decides the number of
+        messages to receive from each queue. Otherwise the prefetch size is
+        split evenly among the queues.
+
+        If the byte budget is provided, the buffered messages are also
+        bounded by their encoded bytes.
+
+        If the scheduling policy is provided, it decides the order in which
+        the buffered messages of the queues are consumed, instead of the
+        order they are received in. Each queue then has an even part of the
+        buffer.
+
+        Messages left in the buffer are requeued when joining, for at most
+        `drain_timeout_seconds` if set. The messages left after that are
+        abandoned to the broker, e.g. to its visibility timeout."""
         if prefetch_size < 1:
             raise ValueError("prefetch size should be greater than 0")
+        if prefetch_controller and (
+            prefetch_controller.max_buffered > prefetch_size
+        ):
+            raise ValueError("prefetch controller exceeds the prefetch size")
 
         super().__init__(queues=queues)
         self.prefetch_size = prefetch_size
+        self.prefetch_controller = prefetch_controller
+        self.byte_budget = byte_budget
+        self.drain_timeout_seconds = drain_timeout_seconds
+        # The result of draining the local queue, set by join()
+        self.drain_result: DrainResult | None = None
 
         self._consumer_threads: list[threading.Thread] = []
         self._lock = threading.Lock()
-        self._local_queue = _notify_queue.NotifyQueue[Message](
-            maxsize=self.prefetch_size
+        self._local_queue: (
+            _notify_queue.NotifyQueue[Message]
+            | _scheduled_queue.ScheduledQueue[Message]
         )
+        if scheduling_policy:
+            self._local_queue = _scheduled_queue.ScheduledQueue[Message](
+                scheduling_policy,
+                key=lambda msg: msg.queue.name,
+                maxsize=self.prefetch_size,
+                queue_maxsize=math.ceil(
+                    self.prefetch_size / max(len(queues), 1)
+                ),
+            )
+        else:
+            self._local_queue = _notify_queue.NotifyQueue[Message](
+                maxsize=self.prefetch_size
+            )
         self._result_futures_set = set()
 
     def stop(self):
         super().stop()
 
+        if self.prefetch_controller:
+            self.prefetch_controller.close()
+        if self.byte_budget:
+            self.byte_budget.close()
+
         # Cancel blocking receiving to stop consumer threads
-        for future in self._result_futures_set:
+        # copy the set as the consumer threads are changing it
+        for future in list(self._result_futures_set):
             logger.debug("Cancel result future %r", future)
             future.cancel()
 
@@ -47,62 +114,95 @@ class ThreadedConsumer(ConsumerBase):
     def join(self):
         super().join()
 
+        deadline = None
+        if self.drain_timeout_seconds is not None:
+            deadline = time.monotonic() + self.drain_timeout_seconds
+
         # Handle leftover messages
-        # Using a requeuing thread to fetch messages from the local queue to
+        # Using a draining thread to fetch messages from the local queue to
         # unblock consumer threads
         logger.debug("Requeue messages from the local queue")
-        t, ev = self._requeue_local_queue_messages()
+        drained: list[int] = []
+        drainer = threading.Thread(
+            target=lambda: drained.extend(self._drain_local_queue(deadline)),
+            name=f"{self.__class__.__name__}-Drain",
+        )
+        drainer.start()
 
         # Join consumer threads
         # it is possible that a consumer thread is blocked by the put method.
+        for thread in self._consumer_threads:
+            thread.join(_remaining(deadline))
+
+        # Unblock the consumer threads still putting by the deadline, their
+        # messages are left in the local queue
+        self._local_queue.close()
         for thread in self._consumer_threads:
             thread.join()
+        drainer.join()
 
-        ev.set()
-        t.join()
+        returned, failed = drained
+        self.drain_result = DrainResult(
+            returned=returned, abandoned=failed + len(self._local_queue)
+        )
+        logger.info(
+            "Consumer stopped, %i messages returned, %i abandoned",
+            self.drain_result.returned,
+            self.drain_result.abandoned,
+        )
 
-        logger.debug("Consumer stopped")
+    def _drain_local_queue(self, deadline: float | None) -> tuple[int, int]:
+        """Requeues the messages from the local queue until it is closed and
+        empty, or by the deadline. Returns the numbers of messages requeued
+        and failed to be requeued."""
+        local_queue = self._local_queue
+        returned = failed = 0
+        while True:
+            timeout = _remaining(deadline)
+            if timeout == 0:
+                break
+            # wakes up on puts and on closing
+            msgs = local_queue.get_many(self.prefetch_size, timeout=timeout)
+            if msgs:
+                requeued = self._requeue(*msgs)
+                returned += requeued
+                failed += len(msgs) - requeued
+            elif local_queue.closed:
+                break
+        return returned, failed
 
-    def _requeue_local_queue_messages(
-        self,
-    ) -> tuple[threading.Thread, threading.Event]:
-        consumer_stopped = threading.Event()
-
-        def requeue():
-            while not consumer_stopped.is_set():
-                msg = self._local_queue.get_nowait()
-                if msg:
-                    self._requeue(msg)
-                else:
-                    time.sleep(0.1)
-            self._requeue(*self._local_queue)
-
-        t = threading.Thread(
-            target=requeue, name=f"{self.__class__.__name__}-Requeue"
-        )
-        t.start()
-        return t, consumer_stopped
+    @property
+    def buffered_num(self) -> int:
+        return len(self._local_queue)
 
-    def _fetch_from_queues(self, max_num: int) -> list[Message]:
+    def _fetch_from_queues(
+        self, max_num: int, timeout: float | None = None
+    ) -> list[Message]:
         if not self._consumer_threads:
             self._start_consumer_threads()
-        return self._fetch_from_local_queue(max_num)
+        return self._fetch_from_local_queue(max_num, timeout)
 
-    def _fetch_from_local_queue(self, max_num: int) -> list[Message]:
+    def _fetch_from_local_queue(
+        self, max_num: int, timeout: float | None = None
+    ) -> list[Message]:
         """should be thread-safe"""
-        msg = self._local_queue.get(wakeup_until_notify_all=True)
-        if not msg:
-            assert self._stopped
-            return []
-
-        msgs = [msg]
+        controller = self.prefetch_controller
+        if controller:
+            # The messages taken last time by the thread have been handled
+            controller.handled()
 
-        while len(msgs) < max_num:
-            msg = self._local_queue.get_nowait()
-            if not msg:
-                break
-            msgs.append(msg)
+        msgs = self._local_queue.get_many(
+            max_num, wakeup_until_notify_all=True, timeout=timeout
+        )
+        if not msgs:
+            assert self._stopped or timeout is not None
+            return []
 
+        if controller:
+            controller.taken(msg.queue.name for msg in msgs)
+        if self.byte_budget:
+            for msg in msgs:
+                self.byte_budget.release(msg.queue.name, msg.encoded_size)
         return msgs
 
     def _start_consumer_threads(self):
@@ -129,21 +229,54 @@ class ThreadedConsumer(ConsumerBase):
         assert local_queue.maxsize > 0
         batch_size = math.ceil(local_queue.maxsize / consumer_num)
 
+        controller = self.prefetch_controller
+        byte_budget = self.byte_budget
+        # The average encoded size of the last received messages
+        msg_size: int | None = None
         while not self._stopped:
-            future = queue.block_receive(max_number=batch_size)
+            # Don't receive messages which couldn't be buffered
+            if byte_budget and not byte_budget.wait_for_room(queue.name):
+                continue
+            if controller:
+                batch_size = controller.reserve(queue.name)
+                if not batch_size:
+                    continue
+
+            receive_num = batch_size
+            if byte_budget:
+                if msg_size is None:
+                    # A single message until their size is known
+                    receive_num = 1
+                elif msg_size:
+                    # About as many messages as the room left can take
+                    room_num = byte_budget.room(queue.name) // msg_size
+                    receive_num = min(receive_num, max(room_num, 1))
+
+            future = queue.block_receive(max_number=receive_num)
             with self._hook_stop_event(future) as hooked:
                 if not hooked:
                     future.cancel()
-                for msg in future.result():
-                    logger.debug(
-                        "Message %s received in %s", msg.id, thread_name
+                msgs = future.result()
+                if controller:
+                    controller.release(queue.name, batch_size - len(msgs))
+                if byte_budget and msgs:
+                    msg_size = math.ceil(
+                        sum(msg.encoded_size for msg in msgs) / len(msgs)
                     )
-                    local_queue.put(msg)
+                for msg in msgs:
                     logger.debug(
-                        "Message %s put into the local queue in %s",
-                        msg.id,
-                        thread_name,
+                        "Message %s received in %s", msg.id, thread_name
                     )
+                    if byte_budget:
+                        byte_budget.acquire(queue.name, msg.encoded_size)
+                        local_queue.put(msg)
+                if not byte_budget:
+                    local_queue.put_many(msgs)
+                logger.debug(
+                    "%i messages put into the local queue in %s",
+                    len(msgs),
+                    thread_name,
+                )
 
         logger.info("Consumer thread '%s' stopped.", thread_name)
 
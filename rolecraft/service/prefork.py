@@ -0,0 +1,191 @@
+import gc
+import logging
+import os
+import resource
+import signal
+import sys
+import threading
+import time
+from collections.abc import Callable
+
+from .service import Service
+
+logger = logging.getLogger(__name__)
+
+
+class PreforkSupervisor:
+    """Forks the worker processes, each of which creates and runs its own
+    service, and supervises them.
+
+    The user modules should be imported before running, so the children
+    share their memory with the parent. The garbage collector is frozen
+    before forking, so it doesn't copy the shared pages by touching the
+    objects.
+
+    A child exiting is restarted, for example when it crashes or when it is
+    recycled after handling `max_tasks_per_process` messages or after its RSS
+    exceeds `max_rss_bytes`. A SIGTERM or SIGINT stops the supervisor, which
+    forwards SIGTERM to the children to stop their services gracefully.
+    """
+
+    def __init__(
+        self,
+        create_service: Callable[[], Service],
+        process_num: int,
+        *,
+        thread_num: int | None = None,
+        max_tasks_per_process: int | None = None,
+        max_rss_bytes: int | None = None,
+        check_interval_seconds: float = 1.0,
+        restart_delay_seconds: float = 1.0,
+    ) -> None:
+        if process_num < 1:
+            raise ValueError("process number should be greater than 0")
+
+        self.create_service = create_service
+        self.process_num = process_num
+        self.thread_num = thread_num
+        self.max_tasks_per_process = max_tasks_per_process
+        self.max_rss_bytes = max_rss_bytes
+        self.check_interval_seconds = check_interval_seconds
+        # A child crashing sooner than that after starting is restarted
+        # after the delay, to avoid restarting it in a tight loop
+        self.restart_delay_seconds = restart_delay_seconds
+
+        self._stopping = False
+        # pid to the index of the child
+        self._pids: dict[int, int] = {}
+        self._started_at: dict[int, float] = {}
+
+    def run(self) -> int:
+        """Runs the children until the supervisor is stopped and all of them
+        have exited. It must be called in the main thread."""
+        previous_handlers = {
+            signum: signal.signal(signum, self._handle_signal)
+            for signum in (signal.SIGINT, signal.SIGTERM)
+        }
+        gc.freeze()
+        try:
+            for index in range(self.process_num):
+                self._spawn(index)
+
+            while self._pids:
+                pid, status = os.wait()
+                index = self._pids.pop(pid, None)
+                if index is not None:
+                    self._handle_exit(index, pid, status)
+        finally:
+            gc.unfreeze()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        return 0
+
+    def stop(self):
+        self._stopping = True
+
+        for pid in list(self._pids):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def _handle_signal(self, signum, frame):
+        logger.info(f"Signal {signal.Signals(signum).name} received.")
+        self.stop()
+
+    def _handle_exit(self, index: int, pid: int, status: int):
+        exit_code = os.waitstatus_to_exitcode(status)
+        if self._stopping:
+            logger.info("Worker process %i exited: %i", pid, exit_code)
+            return
+
+        if exit_code == 0:
+            logger.info("Worker process %i is recycled", pid)
+        else:
+            logger.error(
+                "Worker process %i exited unexpectedly: %i", pid, exit_code
+            )
+            lifetime = time.monotonic() - self._started_at[index]
+            if lifetime < self.restart_delay_seconds:
+                time.sleep(self.restart_delay_seconds)
+                if self._stopping:
+                    return
+        self._spawn(index)
+
+    def _spawn(self, index: int):
+        pid = os.fork()
+        if pid == 0:
+            # The supervisor's handlers and siblings aren't the child's
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self._pids.clear()
+            exit_code = 1
+            try:
+                exit_code = self._run_child()
+            except BaseException:
+                logger.exception("Worker process %i failed", os.getpid())
+            finally:
+                os._exit(exit_code)
+
+        logger.info("Worker process %i started", pid)
+        self._pids[pid] = index
+        self._started_at[index] = time.monotonic()
+        if self._stopping:
+            os.kill(pid, signal.SIGTERM)
+
+    def _run_child(self) -> int:
+        service = self.create_service()
+
+        stop_lock = threading.Lock()
+
+        def stop():
+            # The service is stopped once, by a signal or by recycling
+            if stop_lock.acquire(blocking=False):
+                service.stop()
+
+        def handle_signal(signum, frame):
+            logger.info(f"Signal {signal.Signals(signum).name} received.")
+            stop()
+
+        signal.signal(signal.SIGINT, handle_signal)
+        signal.signal(signal.SIGTERM, handle_signal)
+
+        if self.max_tasks_per_process or self.max_rss_bytes:
+            threading.Thread(
+                target=self._check_recycle,
+                args=(service, stop),
+                name="RecycleChecker",
+                daemon=True,
+            ).start()
+
+        service.start(thread_num=self.thread_num, ignore_signal=True)
+        service.join()
+        return 0
+
+    def _check_recycle(self, service: Service, stop: Callable[[], None]):
+        while True:
+            time.sleep(self.check_interval_seconds)
+
+            handled_num = service.worker.handled_num
+            if (
+                self.max_tasks_per_process
+                and handled_num >= self.max_tasks_per_process
+            ):
+                logger.info("Recycling after %i messages", handled_num)
+                break
+
+            rss = _rss_bytes()
+            if self.max_rss_bytes and rss > self.max_rss_bytes:
+                logger.info("Recycling after RSS reached %i bytes", rss)
+                break
+        stop()
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        # The peak RSS, which is in kilobytes except on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
@@ -5,7 +5,11 @@ from rolecraft.queue import MessageQueue
 
 from .consumer import Consumer
 from .worker import Worker
-from .worker_pool import ThreadWorkerPool, WorkerPool
+from .worker_pool import (
+    AutoscalingThreadWorkerPool,
+    ThreadWorkerPool,
+    WorkerPool,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +34,11 @@ class Service:
         thread_num: int | None = None,
         ignore_signal: bool = False,
     ):
-        if isinstance(self.worker_pool, ThreadWorkerPool):
+        if isinstance(self.worker_pool, AutoscalingThreadWorkerPool):
+            if thread_num:
+                raise ValueError("The threads are scaled by the worker pool")
+            self.worker_pool.backlog = self._backlog
+        elif isinstance(self.worker_pool, ThreadWorkerPool):
             self.worker_pool.thread_num = thread_num or 1
         elif thread_num:
             raise NotImplementedError("Unsupported worker pool")
@@ -56,6 +64,12 @@ class Service:
         self.worker.join()
         self.consumer.join()
 
+    def _backlog(self) -> int:
+        """The number of messages prefetched and left in the queues"""
+        return self.consumer.buffered_num + sum(
+            queue.qsize() for queue in self.queues
+        )
+
     def _register_signal(self):
         def handle_signal(signum, frame):
             logger.info(f"Signal {signal.Signals(signum).name} received.")
@@ -17,12 +17,15 @@ from . import worker_pool as _worker_pool
 from .consumer import ConsumerFactory, ConsumerOptions
 from .queue_discovery import QueueDiscovery
 from .service import Service
+from .worker import WorkerOptions
 from .worker_pool import WorkerPool
 
 logger = logging.getLogger(__name__)
 
 
-class ServiceCreateOptions(BatchBuildOptions, ConsumerOptions, total=False):
+class ServiceCreateOptions(
+    BatchBuildOptions, ConsumerOptions, WorkerOptions, total=False
+):
     ...
 
 
@@ -66,6 +69,7 @@ class ServiceFactory:
 
         queue_options = _typed_dict.subset_dict(options, BatchBuildOptions)
         consumer_options = _typed_dict.subset_dict(options, ConsumerOptions)
+        worker_options = _typed_dict.subset_dict(options, WorkerOptions)
 
         if not queue_options:
             assert self.queue_discovery
@@ -81,6 +85,7 @@ class ServiceFactory:
             worker_pool=worker_pool,
             consumer=consumer,
             role_hanger=self.role_hanger,
+            **worker_options,
         )
         return Service(
             queues=queues,
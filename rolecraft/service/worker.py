@@ -1,11 +1,16 @@
+import importlib
 import logging
+import pickle
 import threading
+from typing import TypedDict, Unpack
 
 from rolecraft.queue import Message
-from rolecraft.role_lib import InterruptError, RoleHanger
+from rolecraft.role_lib import InterruptError, Role, RoleHanger
+from rolecraft.role_lib.role_hanger import SimpleRoleHanger
 
-from .consumer import Consumer
-from .worker_pool import ThreadWorkerPool, WorkerPool
+from . import ack_batcher as _ack_batcher
+from .consumer import Consumer, ConsumerStoppedError
+from .worker_pool import ProcessWorkerPool, ThreadWorkerPool, WorkerPool
 
 logger = logging.getLogger(__name__)
 
@@ -16,50 +21,176 @@ class RoleMissingError(Exception):
         super().__init__(*args)
 
 
+class _RoleCrafter:
+    """Crafts the messages with the roles of the role hanger.
+
+    The roles hold their queue factories, which can't be pickled, so the
+    crafter is pickled with the import locations of the roles instead, for
+    the worker processes which aren't forked. Such a process imports the
+    modules of the roles, which must be defined at their module level.
+    """
+
+    def __init__(self, role_hanger: RoleHanger) -> None:
+        self.role_hanger = role_hanger
+
+    def __call__(self, message: Message):
+        role = self.role_hanger.pick(message.role_name)
+        if not role:
+            raise RoleMissingError(message=message)
+        return role.craft(message)
+
+    def __reduce__(self):
+        locations = []
+        for role in self.role_hanger:
+            fn = role.fn
+            if "<locals>" in fn.__qualname__:
+                raise pickle.PicklingError(
+                    f"Role {role.name!r} is not defined at module level"
+                )
+            locations.append((fn.__module__, fn.__qualname__))
+        return _load_role_crafter, (locations,)
+
+
+def _load_role_crafter(locations: list[tuple[str, str]]) -> _RoleCrafter:
+    role_hanger = SimpleRoleHanger()
+    for module_name, qualname in locations:
+        role = importlib.import_module(module_name)
+        for name in qualname.split("."):
+            role = getattr(role, name)
+        if not isinstance(role, Role):
+            raise pickle.UnpicklingError(
+                f"{module_name}.{qualname} is not a role"
+            )
+        role_hanger.put(role)
+    return _RoleCrafter(role_hanger)
+
+
+class WorkerOptions(TypedDict, total=False):
+    # Acks of finished messages are sent in bulk if it is greater than 1
+    ack_batch_size: int
+    # The longest time that an ack can be held for a batch
+    ack_flush_interval_seconds: float
+
+
 class Worker:
     def __init__(
         self,
         worker_pool: WorkerPool,
         consumer: Consumer,
         role_hanger: RoleHanger,
+        **options: Unpack[WorkerOptions],
     ) -> None:
         self.worker_pool = worker_pool
         self.consumer = consumer
         self.role_hanger = role_hanger
+        self._craft = _RoleCrafter(role_hanger)
 
+        # The number of messages handled. It is not synchronized among the
+        # threads, so it is approximate.
+        self.handled_num = 0
         self._stopped = False
 
+        ack_batch_size = options.get("ack_batch_size", 1)
+        self._ack_batcher = (
+            _ack_batcher.AckBatcher(
+                batch_size=ack_batch_size,
+                flush_interval_seconds=options.get(
+                    "ack_flush_interval_seconds", 0.1
+                ),
+            )
+            if ack_batch_size > 1
+            else None
+        )
+
     def start(self):
         worker_pool = self.worker_pool
-        if not isinstance(worker_pool, ThreadWorkerPool):
-            # if the worker thread is not in the current process, it has no
-            # access to the Queue objects, so it cannot finish the ack
-            # operations.
+        if isinstance(worker_pool, ProcessWorkerPool):
+            # The worker processes have no access to the Queue objects, so
+            # they only craft the messages and the ack operations are
+            # finished in the current process.
+            worker_pool.craft = self._craft
+            run = self._run_remote
+        elif isinstance(worker_pool, ThreadWorkerPool):
+            run = self._run
+        else:
             raise NotImplementedError
 
+        # The worker processes are forked before starting the threads
         worker_pool.start()
 
+        if self._ack_batcher:
+            self._ack_batcher.start()
+
         for i in range(worker_pool.worker_num):
-            worker_pool.submit(self._run, identity=i)
+            worker_pool.submit(run, identity=i)
 
     def stop(self):
         self._stopped = True
         self.worker_pool.stop()
 
+        # Flush pending acks before the queues are closed. Messages finished
+        # later are acked immediately.
+        if self._ack_batcher:
+            self._ack_batcher.close()
+
     def join(self):
         self.worker_pool.join()
 
     def _run(self, identity: int):
         """long running method"""
+        worker_pool = self.worker_pool
+        thread_name = threading.current_thread().name
+        logger.info("Worker thread '%s' started.", thread_name)
+
+        # The thread may retire between messages
+        while not worker_pool.should_retire():
+            try:
+                messages = self.consumer.consume(
+                    timeout=worker_pool.idle_check_seconds
+                )
+            except ConsumerStoppedError:
+                break
+            for message in messages:
+                if self._stopped:
+                    self._handle_leftover(message)
+                    return
+                with worker_pool.handling(message):
+                    self._handle(message)
+
+        logger.info("Worker thread '%s' stopped.", thread_name)
+
+    def _run_remote(self, identity: int):
+        """long running method, which crafts the messages in batches in the
+        worker process of the thread"""
+        worker_pool = self.worker_pool
+        assert isinstance(worker_pool, ProcessWorkerPool)
         thread_name = threading.current_thread().name
         logger.info("Worker thread '%s' started.", thread_name)
 
-        # consumer will raise StopIteration when stopped
-        for message in self.consumer:
+        while True:
+            try:
+                messages = self.consumer.consume(
+                    max_num=worker_pool.batch_size
+                )
+            except ConsumerStoppedError:
+                break
             if self._stopped:
-                self._handle_leftover(message)
-                return
-            self._handle(message)
+                for message in messages:
+                    self._handle_leftover(message)
+                break
+            if not messages:
+                continue
+
+            outcomes = worker_pool.craft_many(messages)
+            for message, (result, exception) in zip(messages, outcomes):
+                if exception is None:
+                    logger.debug("Finished processing message %s", message.id)
+                    self._handle_result(message, result)
+                elif isinstance(exception, InterruptError):
+                    self._handle_interrupt(message)
+                else:
+                    self._handle_error(message, exception)
+                self.handled_num += 1
 
         logger.info("Worker thread '%s' stopped.", thread_name)
 
@@ -75,12 +206,7 @@ class Worker:
         else:
             logger.debug("Finished processing message %s", message.id)
             self._handle_result(message, result)
-
-    def _craft(self, message: Message):
-        role = self.role_hanger.pick(message.role_name)
-        if not role:
-            raise RoleMissingError(message=message)
-        return role.craft(message)
+        self.handled_num += 1
 
     def _handle_leftover(self, message: Message):
         self._requeue(
@@ -127,6 +253,10 @@ class Worker:
         message: Message,
         result,
     ):
+        if self._ack_batcher:
+            self._ack_batcher.ack(message, result)
+            return
+
         try:
             message.ack(result=result)
         except Exception as e:
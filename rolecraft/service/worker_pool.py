@@ -1,13 +1,37 @@
 import abc
-import concurrent.futures
+import contextlib
+import dataclasses
+import itertools
+import logging
+import math
+import multiprocessing
+import multiprocessing.process
+import os
+import pickle
+import signal
+import sys
 import threading
-from collections.abc import Callable
+import time
+import traceback
+from collections.abc import Callable, Iterator, Sequence
+from multiprocessing.connection import Connection
+from multiprocessing.context import BaseContext
 from typing import Any
 
+from rolecraft.broker import BrokerError, RecoverableError
+from rolecraft.queue import Message
+from rolecraft.role_lib import InterruptError
+
 from . import thread_local as _local
 
+logger = logging.getLogger(__name__)
+
 
 class WorkerPool(abc.ABC):
+    # The longest time that a worker thread waits for messages before checking
+    # whether it should retire. None means waiting without a limit.
+    idle_check_seconds: float | None = None
+
     @abc.abstractmethod
     def submit[**P](
         self, fn: Callable[P, Any], *args: P.args, **kwargs: P.kwargs
@@ -31,15 +55,57 @@ class WorkerPool(abc.ABC):
     def join(self):
         raise NotImplementedError
 
+    def should_retire(self) -> bool:
+        """Whether the calling worker thread should leave. It is checked
+        between messages."""
+        return False
+
+    @contextlib.contextmanager
+    def handling(self, message: Message) -> Iterator[None]:
+        """Wraps the handling of a message in a worker thread"""
+        yield
+
+
+@dataclasses.dataclass
+class ThreadStats:
+    name: str
+    # The time spent handling messages
+    busy_seconds: float = 0.0
+    # The CPU time of the thread spent handling messages
+    cpu_seconds: float = 0.0
+    handled_num: int = 0
+    # The message being handled or handled last
+    last_message_id: str | None = None
+    # When the current message started being handled, None if idle
+    handling_since: float | None = None
+
 
 class ThreadWorkerPool(WorkerPool):
+    """Runs the submitted functions, the long running worker loops, in
+    dedicated threads named after their identities. If the thread number is
+    1, the function is run in the calling thread instead.
+
+    The number of threads can be changed at runtime by `resize`. New threads
+    run the first submitted function, with a new `identity` keyword argument
+    if it has one, and the threads beyond the number retire between messages
+    by `should_retire`.
+    """
+
     def __init__(self, thread_num=1) -> None:
         self.thread_num = thread_num
         self._stopped = False
-        self._executor: concurrent.futures.Executor | None = None
-        self._futures: list[concurrent.futures.Future] = []
         self._stop_event = threading.Event()
 
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._task: tuple[Callable, tuple, dict] | None = None
+        self._identities = itertools.count()
+        self._threads: list[threading.Thread] = []
+        self._submitted_num = 0
+        # The number of threads running and not retiring
+        self._running_num = 0
+        self._stats: dict[threading.Thread, ThreadStats] = {}
+
     def submit[**P](
         self, fn: Callable[P, Any], *args: P.args, **kwargs: P.kwargs
     ):
@@ -47,55 +113,751 @@ class ThreadWorkerPool(WorkerPool):
         if self._stopped:
             raise RuntimeError(f"{self.__class__.__name__} has stopped!")
 
-        if self.thread_num == 1:
-            self._execute_fn(fn, args, kwargs)
-            return
+        with self._lock:
+            if self._task is None:
+                self._task = (fn, args, kwargs)
 
-        assert self._executor
+            if not self._runs_inline():
+                if self._submitted_num >= self.thread_num:
+                    raise RuntimeError("Worker pool is full!")
+                self._submitted_num += 1
+                self._start_thread(next(self._identities), fn, args, kwargs)
+                return
+            self._running_num += 1
 
-        if len(self._futures) >= self.thread_num:
-            raise RuntimeError("Worker pool is full!")
-
-        self._futures.append(
-            self._executor.submit(self._execute_fn, fn, args, kwargs)
-        )
+        self._execute_fn(fn, args, kwargs)
 
     @property
     def worker_num(self) -> int:
         return self.thread_num
 
+    @property
+    def running_num(self) -> int:
+        """The number of threads running and not retiring"""
+        return self._running_num
+
     def start(self):
         if self._stopped:
             raise RuntimeError(f"{self.__class__.__name__} has stopped!")
 
-        # Executor must be initialized in he start method so that the thread
-        # number can be updated after the class initialization and before
-        # starting
-        if self.thread_num == 1:
+    def stop(self):
+        self._stopped = True
+
+        # Notify the thread that it shoule be stopped
+        self._stop_event.set()
+
+    def join(self, timeout: float | None = None) -> list[ThreadStats]:
+        """Joins the threads started by the pool. Returns the stats of the
+        threads still running after `timeout` seconds, whose stacks are
+        logged."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in list(self._threads):
+            remaining = None
+            if deadline is not None:
+                remaining = max(deadline - time.monotonic(), 0)
+            thread.join(remaining)
+
+        stuck = [thread for thread in self._threads if thread.is_alive()]
+        if stuck:
+            self._report_stuck(stuck)
+        with self._lock:
+            return [
+                dataclasses.replace(self._stats[thread])
+                for thread in stuck
+                if thread in self._stats
+            ]
+
+    def stats(self) -> list[ThreadStats]:
+        """The stats of the running threads"""
+        with self._lock:
+            return [
+                dataclasses.replace(stats) for stats in self._stats.values()
+            ]
+
+    def resize(self, thread_num: int):
+        """Changes the number of threads at runtime"""
+        if thread_num < 1:
+            raise ValueError("thread number should be greater than 0")
+
+        with self._lock:
+            self.thread_num = thread_num
+            # Threads beyond the number retire by themselves
+            if self._stopped or self._task is None:
+                return
+
+            self._threads = [t for t in self._threads if t.is_alive()]
+            fn, args, kwargs = self._task
+            while self._running_num < thread_num:
+                identity = next(self._identities)
+                if "identity" in kwargs:
+                    kwargs = {**kwargs, "identity": identity}
+                self._start_thread(identity, fn, args, kwargs)
+
+    def should_retire(self) -> bool:
+        # Checked without the lock first, as it is called between messages
+        if self._stopped or self._running_num <= self.thread_num:
+            return False
+        with self._lock:
+            if self._running_num <= self.thread_num:
+                return False
+            self._running_num -= 1
+        self._local.retired = True
+        logger.info(
+            "Worker thread '%s' retired.", threading.current_thread().name
+        )
+        return True
+
+    @contextlib.contextmanager
+    def handling(self, message: Message) -> Iterator[None]:
+        stats: ThreadStats | None = getattr(self._local, "stats", None)
+        if stats is None:
+            # not in a thread of the pool
+            yield
             return
 
-        # TODO: replace ThreadPoolExecutor with using threading.Thread
-        self._executor = concurrent.futures.ThreadPoolExecutor(
-            max_workers=self.thread_num,
-            thread_name_prefix=self.__class__.__name__,
+        start = time.monotonic()
+        cpu_start = time.thread_time()
+        stats.last_message_id = message.id
+        stats.handling_since = start
+        try:
+            yield
+        finally:
+            stats.cpu_seconds += time.thread_time() - cpu_start
+            stats.busy_seconds += time.monotonic() - start
+            stats.handled_num += 1
+            stats.handling_since = None
+
+    def _runs_inline(self) -> bool:
+        return self.thread_num == 1
+
+    def _start_thread(self, identity: int, fn: Callable, args, kwargs):
+        """It is called with the lock held"""
+        thread = threading.Thread(
+            target=self._execute_fn,
+            args=(fn, args, kwargs),
+            name=f"{self.__class__.__name__}-{identity}",
+        )
+        self._threads.append(thread)
+        self._running_num += 1
+        thread.start()
+
+    def _execute_fn(self, fn: Callable, args, kwargs):
+        _local.thread_local.stop_event = self._stop_event
+
+        thread = threading.current_thread()
+        self._local.stats = stats = ThreadStats(name=thread.name)
+        self._local.retired = False
+        with self._lock:
+            self._stats[thread] = stats
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                del self._stats[thread]
+                if not self._local.retired:
+                    self._running_num -= 1
+
+    def _report_stuck(self, threads: list[threading.Thread]):
+        frames = sys._current_frames()
+        now = time.monotonic()
+        for thread in threads:
+            stats = self._stats.get(thread)
+            frame = frames.get(thread.ident or 0)
+            stack = "".join(traceback.format_stack(frame)) if frame else ""
+            if stats and stats.handling_since is not None:
+                logger.warning(
+                    "Worker thread '%s' is stuck, handling message %s for "
+                    "%.1f seconds:\n%s",
+                    thread.name,
+                    stats.last_message_id,
+                    now - stats.handling_since,
+                    stack,
+                )
+            else:
+                logger.warning(
+                    "Worker thread '%s' is stuck:\n%s", thread.name, stack
+                )
+
+
+@dataclasses.dataclass(frozen=True)
+class ScalingDecision:
+    # The number of worker threads running and not retiring
+    thread_num: int
+    target: int
+    # The share of time the threads spent handling messages
+    utilization: float
+    # The share of the handling time not spent on the CPU of the threads, or
+    # None if no message was handled
+    io_share: float | None
+    # The number of messages waiting, or None if unknown
+    backlog: int | None
+
+
+# The errors of measuring the backlog of the queues
+_BACKLOG_ERRORS = (BrokerError, RecoverableError, NotImplementedError)
+
+
+class AutoscalingThreadWorkerPool(ThreadWorkerPool):
+    """Grows and shrinks the worker threads between `min_threads` and
+    `max_threads`.
+
+    Every `interval_seconds` the pool measures the utilization of the
+    threads, and the I/O share of their handling time, which is the time not
+    spent on their CPU. It grows when the utilization reaches
+    `scale_up_utilization` while messages are waiting and the roles are
+    blocked in I/O for at least `min_io_share`, as more threads don't help
+    CPU-bound roles under the GIL. It shrinks when the utilization falls to
+    `scale_down_utilization`. The number of threads is kept in between, and
+    each direction waits for its cooldown since the last scaling.
+
+    The waiting messages are counted by the `backlog` function, which the
+    service sets to the messages prefetched and left in the queues. Without
+    it, messages are assumed to be waiting.
+    """
+
+    def __init__(
+        self,
+        min_threads=1,
+        max_threads=16,
+        *,
+        interval_seconds: float = 1.0,
+        scale_up_utilization: float = 0.8,
+        scale_down_utilization: float = 0.3,
+        min_io_share: float = 0.5,
+        scale_up_cooldown_seconds: float = 2.0,
+        scale_down_cooldown_seconds: float = 30.0,
+        idle_check_seconds: float = 1.0,
+    ) -> None:
+        if min_threads < 1:
+            raise ValueError("min threads should be greater than 0")
+        if max_threads < min_threads:
+            raise ValueError("max threads should not be less than min threads")
+        if not 0 <= scale_down_utilization < scale_up_utilization <= 1:
+            raise ValueError(
+                "scale down utilization should be less than scale up "
+                "utilization"
+            )
+
+        super().__init__(thread_num=min_threads)
+        self.min_threads = min_threads
+        self.max_threads = max_threads
+        self.interval_seconds = interval_seconds
+        self.scale_up_utilization = scale_up_utilization
+        self.scale_down_utilization = scale_down_utilization
+        self.min_io_share = min_io_share
+        self.scale_up_cooldown_seconds = scale_up_cooldown_seconds
+        self.scale_down_cooldown_seconds = scale_down_cooldown_seconds
+        self.idle_check_seconds = idle_check_seconds
+        self.backlog: Callable[[], int] | None = None
+        self.last_decision: ScalingDecision | None = None
+
+        self._scaler: threading.Thread | None = None
+        self._last_scaled_at = -math.inf
+
+        # The measurements of the current interval
+        self._window_start = time.monotonic()
+        self._busy_seconds = 0.0
+        self._handled_seconds = 0.0
+        self._cpu_seconds = 0.0
+        self._handling_since: dict[int, float] = {}
+
+    def start(self):
+        super().start()
+
+        self._window_start = time.monotonic()
+        self._scaler = threading.Thread(
+            target=self._scale_periodically,
+            name=f"{self.__class__.__name__}-Scaler",
+        )
+        self._scaler.start()
+
+    def join(self, timeout: float | None = None) -> list[ThreadStats]:
+        # No thread is started after the scaler ends
+        if self._scaler:
+            self._scaler.join()
+        return super().join(timeout)
+
+    @contextlib.contextmanager
+    def handling(self, message: Message) -> Iterator[None]:
+        ident = threading.get_ident()
+        start = time.monotonic()
+        cpu_start = time.thread_time()
+        with self._lock:
+            self._handling_since[ident] = start
+        try:
+            with super().handling(message):
+                yield
+        finally:
+            cpu_seconds = time.thread_time() - cpu_start
+            end = time.monotonic()
+            with self._lock:
+                # The time before it is counted in the previous intervals
+                self._busy_seconds += end - self._handling_since.pop(ident)
+                self._handled_seconds += end - start
+                self._cpu_seconds += cpu_seconds
+
+    def _runs_inline(self) -> bool:
+        return False
+
+    def _scale_periodically(self):
+        while not self._stop_event.wait(self.interval_seconds):
+            try:
+                self._autoscale()
+            except _BACKLOG_ERRORS as e:
+                logger.warning("Autoscaling error", exc_info=e)
+
+    def _autoscale(self) -> ScalingDecision:
+        now = time.monotonic()
+        with self._lock:
+            busy_seconds = self._busy_seconds
+            for ident, since in self._handling_since.items():
+                busy_seconds += now - since
+                self._handling_since[ident] = now
+            handled_seconds = self._handled_seconds
+            cpu_seconds = self._cpu_seconds
+            elapsed = now - self._window_start
+            thread_num = self._running_num
+
+            self._window_start = now
+            self._busy_seconds = self._handled_seconds = 0.0
+            self._cpu_seconds = 0.0
+
+        utilization = 0.0
+        if thread_num and elapsed > 0:
+            utilization = min(busy_seconds / (elapsed * thread_num), 1.0)
+        io_share = None
+        if handled_seconds > 0:
+            io_share = max(1 - cpu_seconds / handled_seconds, 0.0)
+        backlog = self._measure_backlog()
+
+        decision = ScalingDecision(
+            thread_num=thread_num,
+            target=self._decide(
+                thread_num, utilization, io_share, backlog, now
+            ),
+            utilization=utilization,
+            io_share=io_share,
+            backlog=backlog,
+        )
+        self.last_decision = decision
+        logger.debug("Scaling decision: %s", decision)
+
+        if decision.target != thread_num and not self._stopped:
+            logger.info(
+                "Scale worker threads from %i to %i",
+                thread_num,
+                decision.target,
+            )
+            self._last_scaled_at = now
+            self.resize(decision.target)
+        return decision
+
+    def _measure_backlog(self) -> int | None:
+        if self.backlog is None:
+            return None
+        try:
+            return self.backlog()
+        except _BACKLOG_ERRORS as e:
+            logger.warning("Failed to measure the backlog", exc_info=e)
+            return None
+
+    def _decide(
+        self,
+        thread_num: int,
+        utilization: float,
+        io_share: float | None,
+        backlog: int | None,
+        now: float,
+    ) -> int:
+        since_scaled = now - self._last_scaled_at
+        if (
+            utilization >= self.scale_up_utilization
+            and backlog != 0
+            and (io_share is None or io_share >= self.min_io_share)
+            and since_scaled >= self.scale_up_cooldown_seconds
+        ):
+            # At most double the threads, and no more than the messages
+            step = max(thread_num, 1)
+            if backlog is not None:
+                step = min(step, backlog)
+            return min(thread_num + step, self.max_threads)
+
+        if (
+            utilization <= self.scale_down_utilization
+            and since_scaled >= self.scale_down_cooldown_seconds
+        ):
+            # Keep the threads needed at the scale up utilization, and
+            # retire half of the rest
+            needed = math.ceil(
+                thread_num * utilization / self.scale_up_utilization
+            )
+            return max(
+                thread_num - math.ceil((thread_num - needed) / 2),
+                self.min_threads,
+            )
+        return thread_num
+
+
+class WorkerProcessError(Exception):
+    """The worker process exited while crafting the message"""
+
+
+class RemoteError(Exception):
+    """Stands for an exception raised in a worker process which cannot be
+    sent back to the parent process"""
+
+
+@dataclasses.dataclass(frozen=True)
+class _QueueRef:
+    """Stands for the queue of a message in the worker processes. The queue
+    operations are only available in the parent process."""
+
+    name: str
+
+
+# The errors of pickling or unpickling an object of an unsupported class,
+# such as an exception whose constructor takes other arguments
+_PICKLE_ERRORS = (pickle.PickleError, AttributeError, TypeError)
+# The errors of starting a worker process, e.g. out of file descriptors or
+# with an unpicklable craft function
+_SPAWN_ERRORS = (OSError, RuntimeError, *_PICKLE_ERRORS)
+
+
+@dataclasses.dataclass
+class _Child:
+    process: multiprocessing.process.BaseProcess
+    conn: Connection
+    # A child which failed to restart isn't restarted again
+    alive: bool = True
+
+
+class ProcessWorkerPool(WorkerPool):
+    """Crafts the messages in child processes, so that CPU-bound roles are
+    not serialized by the GIL.
+
+    The parent process owns the Queue objects. A thread is submitted per
+    child process, which ships the messages to its child in batches over a
+    pipe by `craft_many` and gets the outcomes back, to ack, nack or requeue
+    the messages. The `craft` function must be set before starting, and it
+    is inherited by the forked children.
+
+    The stop event is shared with the children, so `StopEvent` interrupts
+    the running roles, and the messages of a batch not crafted yet are
+    returned as interrupted. A child exiting unexpectedly is restarted.
+
+    A child is restarted with `restart_method`, the start method by default.
+    Unlike starting, restarting forks the parent while its other threads are
+    running, so a lock held by any of them stays locked in the child. The
+    child only uses its pipe and the `craft` function, and the logging locks
+    are reinitialized after forking, but a lock taken by `craft` may
+    deadlock the restarted child. Use "forkserver" or "spawn" for restarting
+    if such a lock can't be ruled out, which requires a picklable `craft`,
+    e.g. the one of a Worker whose roles are defined at module level. If a
+    child fails to restart, the later messages for it fail at once.
+    """
+
+    def __init__(
+        self,
+        process_num=1,
+        *,
+        batch_size=10,
+        start_method: str = "fork",
+        restart_method: str | None = None,
+    ) -> None:
+        self.process_num = process_num
+        self.batch_size = batch_size
+        self.craft: Callable[[Message], Any] | None = None
+
+        self._context = multiprocessing.get_context(start_method)
+        self._restart_context = multiprocessing.get_context(
+            restart_method or start_method
         )
+        # The event is shared with the restarted children as well
+        self._stop_event = self._restart_context.Event()
+        self._stopped = False
+        self._children: list[_Child] = []
+        self._threads: list[threading.Thread] = []
+        self._local = threading.local()
+
+    def submit[**P](
+        self, fn: Callable[P, Any], *args: P.args, **kwargs: P.kwargs
+    ):
+        """Runs the function in a thread bound to a child process, where
+        `craft_many` can be called. This method is not thread-safe."""
+        if self._stopped:
+            raise RuntimeError(f"{self.__class__.__name__} has stopped!")
+
+        index = len(self._threads)
+        if index >= len(self._children):
+            raise RuntimeError("Worker pool is full!")
+
+        thread = threading.Thread(
+            target=self._execute_fn,
+            args=(index, fn, args, kwargs),
+            name=f"{self.__class__.__name__}-{index}",
+        )
+        self._threads.append(thread)
+        thread.start()
+
+    @property
+    def worker_num(self) -> int:
+        return self.process_num
+
+    def start(self):
+        if self._stopped:
+            raise RuntimeError(f"{self.__class__.__name__} has stopped!")
+        if self.craft is None:
+            raise RuntimeError("The craft function is not set")
+
+        for index in range(self.process_num):
+            self._children.append(self._spawn(index, self._context))
 
     def stop(self):
         self._stopped = True
 
-        # Notify the thread that it shoule be stopped
+        # Notify the child processes that they should be stopped
         self._stop_event.set()
 
-        if self._executor:
-            self._executor.shutdown(wait=False, cancel_futures=True)
-
     def join(self):
-        concurrent.futures.wait(self._futures)
+        for thread in self._threads:
+            thread.join()
 
-        for fs in self._futures:
-            assert fs.done()
+        # The children are idle once the threads have ended
+        for child in self._children:
+            try:
+                child.conn.send(None)
+            except OSError:
+                pass
+            child.process.join(timeout=1)
+            if child.process.is_alive():
+                child.process.kill()
+                child.process.join()
+            child.conn.close()
 
-    def _execute_fn(self, fn: Callable, args, kwargs):
-        _local.thread_local.stop_event = self._stop_event
+    def craft_many(
+        self, messages: Sequence[Message]
+    ) -> list[tuple[Any, Exception | None]]:
+        """Crafts the messages in the child process of the calling thread.
+        Returns the result and the exception of each message in order.
+
+        It is called in the threads of the submitted functions.
+        """
+        index: int = self._local.index
+        child = self._children[index]
+        if not child.alive:
+            return [
+                (
+                    None,
+                    WorkerProcessError(
+                        f"Worker process {child.process.name} is dead"
+                    ),
+                )
+                for _ in messages
+            ]
+        conn = child.conn
+
+        outcomes: list[tuple[Any, Exception | None]] = []
+        sent = False
+        try:
+            conn.send([_to_payload(message) for message in messages])
+            sent = True
+            for _ in messages:
+                outcomes.append(_load_outcome(conn.recv_bytes()))
+            return outcomes
+        except (EOFError, OSError):
+            pass
+
+        process = self._children[index].process
+        process.join(timeout=1)
+        logger.error(
+            "Worker process %s exited with code %s",
+            process.name,
+            process.exitcode,
+        )
+        if sent and not self._stopped:
+            # The message being crafted may have caused the exit
+            outcomes.append(
+                (
+                    None,
+                    WorkerProcessError(
+                        f"Worker process exited with code {process.exitcode}"
+                    ),
+                )
+            )
+        outcomes.extend(
+            (None, InterruptError()) for _ in messages[len(outcomes) :]
+        )
+
+        if not self._stopped:
+            self._restart(index)
+        return outcomes
+
+    def _spawn(self, index: int, context: BaseContext) -> _Child:
+        parent_conn, child_conn = context.Pipe()
+        try:
+            process = self._start_process(
+                index, context, parent_conn, child_conn
+            )
+        except BaseException:
+            parent_conn.close()
+            raise
+        finally:
+            child_conn.close()
+        logger.info("Worker process %s started", process.name)
+        return _Child(process=process, conn=parent_conn)
+
+    def _start_process(
+        self,
+        index: int,
+        context: BaseContext,
+        parent_conn: Connection,
+        child_conn: Connection,
+    ) -> multiprocessing.process.BaseProcess:
+        # The parent ends of the pipes are closed in the child, so the child
+        # ends as the pipe is broken if the parent dies. Only a forked child
+        # inherits them.
+        inherited_conns = []
+        if context.get_start_method() == "fork":
+            inherited_conns = [
+                child.conn
+                for i, child in enumerate(self._children)
+                if i != index
+            ]
+            inherited_conns.append(parent_conn)
+
+        process = context.Process(
+            target=_serve,
+            args=(child_conn, self.craft, self._stop_event, inherited_conns),
+            name=f"{self.__class__.__name__}-{index}",
+            daemon=True,
+        )
+        process.start()
+        return process
+
+    def _restart(self, index: int):
+        child = self._children[index]
+        if child.process.is_alive():
+            child.process.kill()
+            child.process.join()
+        child.conn.close()
+        try:
+            self._children[index] = self._spawn(index, self._restart_context)
+        except _SPAWN_ERRORS as e:
+            # The messages sent to the child later fail at once
+            child.alive = False
+            logger.error(
+                "Failed to restart worker process %s",
+                child.process.name,
+                exc_info=e,
+            )
+
+    def _execute_fn(self, index: int, fn: Callable, args, kwargs):
+        self._local.index = index
 
         return fn(*args, **kwargs)
+
+
+def _to_payload(message: Message) -> tuple:
+    role_data = message.role_data
+    # A memoryview can't be pickled
+    if isinstance(role_data, memoryview):
+        role_data = bytes(role_data)
+    return (
+        message.id,
+        message.meta,
+        message.role_name,
+        role_data,
+        message.queue.name,
+    )
+
+
+def _from_payload(payload: tuple) -> Message:
+    id, meta, role_name, role_data, queue_name = payload
+    return Message(
+        id=id,
+        meta=meta,
+        role_name=role_name,
+        role_data=role_data,
+        queue=_QueueRef(name=queue_name),  # type: ignore
+    )
+
+
+def _serve(
+    conn: Connection,
+    craft: Callable[[Message], Any],
+    stop_event: threading.Event,
+    inherited_conns: list[Connection],
+):
+    """The main function of the worker processes"""
+    for inherited_conn in inherited_conns:
+        inherited_conn.close()
+    # The parent process handles the signals and stops the children
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    _local.thread_local.stop_event = stop_event
+
+    while True:
+        try:
+            payloads = conn.recv()
+        except EOFError:
+            return
+        if payloads is None:
+            return
+
+        for payload in payloads:
+            message = _from_payload(payload)
+            if stop_event.is_set():
+                outcome = (None, InterruptError())
+            else:
+                outcome = _craft(craft, message)
+            conn.send_bytes(_dump_outcome(outcome))
+
+
+def _craft(craft: Callable[[Message], Any], message: Message):
+    try:
+        return craft(message), None
+    except Exception as e:  # noqa: BLE001 - the errors of any role
+        return None, e
+
+
+def _dump_outcome(outcome: tuple[Any, Exception | None]) -> bytes:
+    result, exception = outcome
+    if exception is None:
+        try:
+            return pickle.dumps((result, None, None))
+        except _PICKLE_ERRORS as e:
+            exception = RemoteError(f"Unpicklable result: {e!r}")
+
+    # The cause is not pickled with the exception
+    exception.add_note(
+        f"Traceback in worker process {os.getpid()}:\n"
+        + "".join(traceback.format_exception(exception))
+    )
+    cause = exception.__cause__
+    return pickle.dumps(
+        (
+            None,
+            _portable_exception(exception),
+            cause and _portable_exception(cause),
+        )
+    )
+
+
+def _portable_exception(exception: BaseException) -> BaseException:
+    try:
+        pickle.loads(pickle.dumps(exception))
+    except _PICKLE_ERRORS:
+        portable = RemoteError(repr(exception))
+        portable.__notes__ = getattr(exception, "__notes__", [])
+        return portable
+    return exception
+
+
+def _load_outcome(data: bytes) -> tuple[Any, Exception | None]:
+    try:
+        result, exception, cause = pickle.loads(data)
+    except _PICKLE_ERRORS as e:
+        return None, RemoteError(f"Unloadable outcome: {e!r}")
+    if exception is not None:
+        exception.__cause__ = cause
+    return result, exception
@@ -0,0 +1,249 @@
+import mmap
+import os
+import threading
+import time
+
+import pytest
+
+from rolecraft.broker import (
+    BrokerError,
+    HeaderBytesRawMessage,
+    MessageNotFound,
+)
+from rolecraft.broker import log_broker as log_broker_mod
+
+
+@pytest.fixture()
+def directory(tmp_path):
+    return str(tmp_path / "log")
+
+
+@pytest.fixture()
+def broker(directory):
+    broker = log_broker_mod.LogBroker(directory)
+    yield broker
+    broker.close()
+
+
+@pytest.fixture()
+def queue_name():
+    return "log_queue"
+
+
+def new_message(data: bytes = b"data", **headers):
+    return HeaderBytesRawMessage(data=data, headers=headers)
+
+
+def segment_files(directory, queue_name):
+    return sorted(
+        name
+        for name in os.listdir(os.path.join(directory, queue_name))
+        if name.endswith(".log")
+    )
+
+
+def test_enqueue_and_receive(broker, queue_name):
+    msg = new_message(k="v")
+    msg_id = broker.enqueue(queue_name, msg)
+    assert msg_id and msg.id == msg_id
+    assert broker.qsize(queue_name) == 1
+
+    (received,) = broker.receive(queue_name)
+    assert received == msg
+    assert isinstance(received.data, memoryview)
+    assert received.data.readonly
+    assert broker.receive(queue_name) == []
+
+    broker.ack(received, queue_name)
+    assert broker.qsize(queue_name) == 0
+    with pytest.raises(MessageNotFound):
+        broker.ack(received, queue_name)
+
+
+def test_priority_and_delay(broker, queue_name):
+    broker.enqueue(queue_name, new_message(b"low"), priority=10)
+    broker.enqueue(queue_name, new_message(b"delayed"), delay_millis=50)
+    broker.enqueue(queue_name, new_message(b"high"), priority=90)
+
+    msgs = broker.receive(queue_name, max_number=3)
+    assert [bytes(msg.data) for msg in msgs] == [b"high", b"low"]
+
+    future = broker.block_receive(queue_name, wait_time_seconds=1)
+    assert [bytes(msg.data) for msg in future.result()] == [b"delayed"]
+
+
+def test_retry_keeps_priority(broker, queue_name):
+    broker.enqueue(queue_name, new_message(b"high"), priority=90)
+    (received,) = broker.receive(queue_name)
+    broker.enqueue(queue_name, new_message(b"other"), priority=60)
+
+    broker.retry(received, queue_name)
+    msgs = broker.receive(queue_name, max_number=2)
+    assert [bytes(msg.data) for msg in msgs] == [b"high", b"other"]
+    assert msgs[0].headers == {"retries": 1}
+
+
+def test_block_receive_wakes_on_enqueue(broker, queue_name):
+    rv = []
+
+    def receive():
+        future = broker.block_receive(queue_name, wait_time_seconds=5)
+        rv.append(future.result())
+
+    t = threading.Thread(target=receive)
+    t.start()
+    time.sleep(0.05)
+    broker.enqueue(queue_name, new_message())
+    t.join(1)
+    assert not t.is_alive()
+    assert [bytes(msg.data) for msg in rv[0]] == [b"data"]
+
+
+def test_recover(directory, queue_name):
+    broker = log_broker_mod.LogBroker(directory)
+    msgs = [new_message(str(i).encode(), i=i) for i in range(4)]
+    broker.enqueue_many(queue_name, msgs[:3])
+    broker.enqueue(queue_name, msgs[3], priority=70, delay_millis=50)
+    received = broker.receive(queue_name, max_number=2)
+    broker.ack(received[0], queue_name)
+    broker.requeue(received[1], queue_name)
+    broker.close()
+
+    with pytest.raises(BrokerError):
+        broker.enqueue(queue_name, new_message())
+
+    broker = log_broker_mod.LogBroker(directory)
+    assert broker.qsize(queue_name) == 3
+    recovered = broker.receive(queue_name, max_number=3)
+    assert recovered == msgs[1:3]
+
+    time.sleep(0.06)
+    (delayed,) = broker.receive(queue_name)
+    assert delayed == msgs[3]
+    assert delayed.headers == {"i": 3}
+
+    broker.ack_many(recovered + [delayed], queue_name)
+    broker.close()
+
+    broker = log_broker_mod.LogBroker(directory)
+    assert broker.qsize(queue_name) == 0
+    broker.close()
+
+
+def test_compact_acked_segments(directory, queue_name):
+    broker = log_broker_mod.LogBroker(directory, segment_size_bytes=256)
+    msgs = [new_message(b"x" * 100) for _ in range(6)]
+    broker.enqueue_many(queue_name, msgs)
+    assert len(segment_files(directory, queue_name)) == 6
+
+    received = broker.receive(queue_name, max_number=6)
+    broker.ack_many(received[:4], queue_name)
+    # The fully acked segments are deleted
+    assert segment_files(directory, queue_name) == [
+        f"{4:020d}.log",
+        f"{5:020d}.log",
+    ]
+    broker.close()
+
+    broker = log_broker_mod.LogBroker(directory, segment_size_bytes=256)
+    assert broker.receive(queue_name, max_number=6) == msgs[4:]
+    broker.close()
+
+
+def test_oversize_message(directory, queue_name):
+    broker = log_broker_mod.LogBroker(directory, segment_size_bytes=64)
+    msg = new_message(b"x" * 1000)
+    broker.enqueue(queue_name, msg)
+    assert broker.receive(queue_name) == [msg]
+    broker.close()
+
+
+def test_torn_record_is_ignored(directory, queue_name):
+    broker = log_broker_mod.LogBroker(directory)
+    broker.enqueue_many(queue_name, [new_message(b"a"), new_message(b"b")])
+    broker.close()
+
+    # corrupt the header of the second record
+    path = os.path.join(directory, queue_name, "0" * 20 + ".log")
+    with open(path, "r+b") as f:
+        header = log_broker_mod._RECORD_HEADER
+        _, id_len, headers_len, data_len, _, _ = header.unpack(
+            f.read(header.size)
+        )
+        f.seek(header.size + id_len + headers_len + data_len)
+        f.write(b"\0")
+
+    broker = log_broker_mod.LogBroker(directory)
+    msgs = broker.receive(queue_name, max_number=2)
+    assert [bytes(msg.data) for msg in msgs] == [b"a"]
+    broker.close()
+
+
+def test_interrupted_segment_creation(directory, queue_name):
+    broker = log_broker_mod.LogBroker(directory)
+    broker.enqueue(queue_name, new_message(b"a"))
+    broker.close()
+
+    # The process crashed before the new segment was preallocated
+    tmp_path = os.path.join(directory, queue_name, f"{1:020d}.log.tmp")
+    open(tmp_path, "xb").close()
+
+    broker = log_broker_mod.LogBroker(directory)
+    msgs = broker.receive(queue_name)
+    assert [bytes(msg.data) for msg in msgs] == [b"a"]
+    assert not os.path.exists(tmp_path)
+    broker.close()
+
+
+def test_retried_message_survives_crash(directory, queue_name, monkeypatch):
+    broker = log_broker_mod.LogBroker(directory)
+    broker.enqueue(queue_name, new_message(b"a"))
+    (received,) = broker.receive(queue_name)
+
+    # The process crashes before the original message is acked
+    def crash(*args, **kwds):
+        raise SystemExit
+
+    monkeypatch.setattr(broker, "ack", crash)
+    with pytest.raises(SystemExit):
+        broker.retry(received, queue_name)
+    broker.close()
+
+    broker = log_broker_mod.LogBroker(directory)
+    msgs = broker.receive(queue_name, max_number=2)
+    assert [msg.headers for msg in msgs] == [{}, {"retries": 1}]
+    broker.close()
+
+
+def test_segment_unmapped_on_error(tmp_path, monkeypatch):
+    maps = []
+    original_mmap = mmap.mmap
+
+    def new_mmap(*args, **kwds):
+        maps.append(original_mmap(*args, **kwds))
+        return maps[-1]
+
+    monkeypatch.setattr(log_broker_mod.mmap, "mmap", new_mmap)
+    path = str(tmp_path / "segment.log")
+    # The ack file can't be opened
+    os.mkdir(str(tmp_path / "segment.ack"))
+    with pytest.raises(OSError):
+        log_broker_mod._Segment.create(path, 64)
+    assert maps[0].closed
+
+
+def test_invalid_queue_name(broker):
+    with pytest.raises(ValueError):
+        broker.qsize("..")
+
+
+def test_receive_header_keys(broker, queue_name):
+    broker.enqueue(queue_name, new_message(b"data", k="v", retries=1))
+    (received,) = broker.receive(queue_name, header_keys=["retries", "x"])
+    assert received.headers == {"retries": 1}
+    assert received.data == b"data"
+
+    # The headers not received are kept by retrying
+    broker.retry(received, queue_name)
+    (retried,) = broker.receive(queue_name)
+    assert retried.headers == {"k": "v", "retries": 2}
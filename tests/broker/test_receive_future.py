@@ -0,0 +1,151 @@
+import threading
+import time
+
+import pytest
+
+from rolecraft.broker import (
+    HeaderBytesRawMessage,
+    ProvidedReceiveFuture,
+    ReceiveFuture,
+    StubBroker,
+    as_completed,
+    wait_any,
+)
+
+
+class BlockingFuture(ReceiveFuture[list[str]]):
+    """A future without notifier support."""
+
+    def __init__(self, rv: list[str], delay: float | None) -> None:
+        self.rv = rv
+        self.delay = delay
+        self.cancelled = threading.Event()
+
+    def result(self) -> list[str]:
+        if self.cancelled.wait(self.delay):
+            return []
+        return self.rv
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+@pytest.fixture()
+def broker():
+    return StubBroker()
+
+
+def new_message(data: bytes = b"data"):
+    return HeaderBytesRawMessage(data=data)
+
+
+def test_wait_any(broker):
+    futures = [
+        broker.block_receive(f"queue{i}", wait_time_seconds=5)
+        for i in range(3)
+    ]
+
+    def enqueue():
+        time.sleep(0.05)
+        broker.enqueue("queue1", msg)
+
+    msg = new_message()
+    t = threading.Thread(target=enqueue)
+    t.start()
+    start = time.monotonic()
+    assert wait_any(futures, timeout=2) == {futures[1]: [msg]}
+    assert time.monotonic() - start < 1
+    t.join()
+
+    # The pending futures can be waited again
+    broker.enqueue("queue2", msg)
+    assert wait_any(futures[0::2], timeout=2) == {futures[2]: [msg]}
+
+
+def test_wait_any_timeout(broker):
+    future = broker.block_receive("queue", wait_time_seconds=5)
+    start = time.monotonic()
+    assert wait_any([future], timeout=0.05) == {}
+    assert time.monotonic() - start >= 0.05
+
+    # The future times out by itself
+    future = broker.block_receive("queue", wait_time_seconds=0.05)
+    assert wait_any([future], timeout=2) == {future: []}
+
+
+def test_wait_any_wakes_up_for_delayed_message(broker):
+    msg = new_message()
+    broker.enqueue("queue", msg, delay_millis=50)
+    future = broker.block_receive("queue", wait_time_seconds=5)
+    start = time.monotonic()
+    assert wait_any([future], timeout=2) == {future: [msg]}
+    assert time.monotonic() - start < 1
+
+
+def test_wait_any_with_transformer(broker):
+    msg = new_message(b"1")
+    future = broker.block_receive("queue", wait_time_seconds=5).transform(
+        lambda msgs: [int(msg.data) for msg in msgs]
+    )
+    broker.enqueue("queue", msg)
+    assert wait_any([future]) == {future: [1]}
+
+
+def test_wait_any_with_blocking_futures(broker):
+    provided = ProvidedReceiveFuture(["provided"])
+    slow = BlockingFuture(["slow"], delay=5)
+    assert wait_any([provided, slow]) == {provided: ["provided"], slow: []}
+    assert slow.cancelled.is_set()
+
+    fast = BlockingFuture(["fast"], delay=0.01)
+    stub = broker.block_receive("queue", wait_time_seconds=5)
+    assert wait_any([stub, fast]) == {fast: ["fast"]}
+
+
+def test_cancel_loser_keeps_messages(broker):
+    futures = [
+        broker.block_receive(f"queue{i}", wait_time_seconds=5)
+        for i in range(2)
+    ]
+    msgs = [new_message(), new_message()]
+    broker.enqueue("queue0", msgs[0])
+    done = wait_any(futures)
+    assert done == {futures[0]: [msgs[0]]}
+
+    # The message is handed off to the loser after wait_any returned
+    broker.enqueue("queue1", msgs[1])
+    futures[1].cancel()
+    assert futures[1].result() == [msgs[1]]
+
+
+def test_as_completed(broker):
+    futures = [
+        broker.block_receive(f"queue{i}", wait_time_seconds=5)
+        for i in range(3)
+    ]
+    msgs = [new_message(str(i).encode()) for i in range(3)]
+
+    def enqueue():
+        for i in (2, 0, 1):
+            time.sleep(0.02)
+            broker.enqueue(f"queue{i}", msgs[i])
+
+    t = threading.Thread(target=enqueue)
+    t.start()
+    rv = list(as_completed(futures, timeout=2))
+    t.join()
+    assert rv == [
+        (futures[2], [msgs[2]]),
+        (futures[0], [msgs[0]]),
+        (futures[1], [msgs[1]]),
+    ]
+
+
+def test_as_completed_timeout(broker):
+    futures = [
+        broker.block_receive(f"queue{i}", wait_time_seconds=5)
+        for i in range(2)
+    ]
+    broker.enqueue("queue0", new_message())
+    rv = list(as_completed(futures, timeout=0.05))
+    assert [future for future, _ in rv] == [futures[0]]
@@ -0,0 +1,258 @@
+import threading
+import time
+
+import pytest
+
+from rolecraft.broker import (
+    BrokerError,
+    HeaderBytesRawMessage,
+    MessageNotFound,
+)
+from rolecraft.broker import sqlite_broker as sqlite_broker_mod
+
+
+@pytest.fixture()
+def db_path(tmp_path):
+    return str(tmp_path / "broker.db")
+
+
+@pytest.fixture()
+def broker(db_path):
+    broker = sqlite_broker_mod.SqliteBroker(db_path)
+    yield broker
+    broker.close()
+
+
+@pytest.fixture()
+def queue_name():
+    return "sqlite_queue"
+
+
+def new_message(data: bytes = b"data", **headers):
+    return HeaderBytesRawMessage(data=data, headers=headers)
+
+
+def test_enqueue_and_receive(broker, queue_name):
+    msg = new_message(k="v")
+    msg_id = broker.enqueue(queue_name, msg)
+    assert msg_id and msg.id == msg_id
+    assert broker.qsize(queue_name) == 1
+
+    msgs = broker.receive(queue_name)
+    assert msgs == [msg]
+    assert broker.receive(queue_name) == []
+    assert broker.qsize(queue_name) == 1
+
+    broker.ack(msg, queue_name)
+    assert broker.qsize(queue_name) == 0
+    with pytest.raises(MessageNotFound):
+        broker.ack(msg, queue_name)
+
+
+def test_enqueue_many(broker, queue_name):
+    msgs = [new_message(str(i).encode()) for i in range(10)]
+    ids = broker.enqueue_many(queue_name, msgs)
+    assert ids == [msg.id for msg in msgs]
+    assert len(set(ids)) == 10
+    assert broker.qsize(queue_name) == 10
+    assert broker.qsize("other") == 0
+
+    assert broker.receive(queue_name, max_number=4) == msgs[:4]
+    assert broker.receive(queue_name, max_number=10) == msgs[4:]
+
+
+def test_priority(broker, queue_name):
+    low = new_message(b"low")
+    high = new_message(b"high")
+    broker.enqueue(queue_name, low, priority=10)
+    broker.enqueue(queue_name, new_message(b"default"))
+    broker.enqueue(queue_name, high, priority=90)
+
+    msgs = broker.receive(queue_name, max_number=3)
+    assert [msg.data for msg in msgs] == [b"high", b"default", b"low"]
+
+
+def test_delay(broker, queue_name):
+    msg = new_message()
+    broker.enqueue(queue_name, msg, delay_millis=100)
+    assert broker.qsize(queue_name) == 1
+    assert broker.receive(queue_name) == []
+
+    start = time.monotonic()
+    future = broker.block_receive(queue_name, wait_time_seconds=2)
+    assert future.result() == [msg]
+    assert time.monotonic() - start < 1
+
+
+def test_block_receive_wakes_on_enqueue(db_path, queue_name):
+    # Disable polling to make sure the waiter is woken up by the enqueue
+    broker = sqlite_broker_mod.SqliteBroker(
+        db_path, poll_interval_seconds=None
+    )
+    rv = []
+
+    def receive():
+        future = broker.block_receive(queue_name, wait_time_seconds=5)
+        rv.append(future.result())
+
+    t = threading.Thread(target=receive)
+    t.start()
+    time.sleep(0.05)
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    t.join(1)
+    assert not t.is_alive()
+    assert rv == [[msg]]
+    broker.close()
+
+
+def test_block_receive_timeout_and_cancel(broker, queue_name):
+    future = broker.block_receive(queue_name, wait_time_seconds=0.05)
+    assert future.result() == []
+
+    future = broker.block_receive(queue_name, wait_time_seconds=5)
+    rv = []
+    t = threading.Thread(target=lambda: rv.append(future.result()))
+    t.start()
+    time.sleep(0.05)
+    future.cancel()
+    t.join(1)
+    assert not t.is_alive()
+    assert rv == [[]]
+
+
+def test_requeue_and_nack(broker, queue_name):
+    msgs = [new_message(str(i).encode()) for i in range(3)]
+    broker.enqueue_many(queue_name, msgs)
+    received = broker.receive(queue_name, max_number=3)
+
+    broker.requeue_many(received[:2], queue_name)
+    broker.nack(received[2], queue_name, exception=ValueError())
+    assert broker.qsize(queue_name) == 2
+    assert broker.receive(queue_name, max_number=3) == msgs[:2]
+
+    with pytest.raises(MessageNotFound):
+        broker.requeue(received[2], queue_name)
+
+
+def test_ack_many_is_atomic(broker, queue_name):
+    msgs = [new_message(str(i).encode()) for i in range(2)]
+    broker.enqueue_many(queue_name, msgs)
+    received = broker.receive(queue_name, max_number=2)
+    broker.ack(received[0], queue_name)
+
+    with pytest.raises(MessageNotFound):
+        broker.ack_many(received, queue_name)
+    assert broker.qsize(queue_name) == 1
+
+    broker.ack_many(received[1:], queue_name)
+    assert broker.qsize(queue_name) == 0
+
+
+def test_retry(broker, queue_name):
+    msg = new_message(b"data", k="v")
+    broker.enqueue(queue_name, msg, priority=70)
+    (received,) = broker.receive(queue_name)
+
+    new_id = broker.retry(received, queue_name, delay_millis=50)
+    assert new_id != msg.id
+    assert broker.qsize(queue_name) == 1
+    with pytest.raises(MessageNotFound):
+        broker.ack(received, queue_name)
+
+    broker.enqueue(queue_name, new_message(b"other"), priority=60)
+    time.sleep(0.06)
+    msgs = broker.receive(queue_name, max_number=2)
+    assert msgs[0].id == new_id
+    assert msgs[0].headers == {"k": "v", "retries": 1}
+    assert msgs[1].data == b"other"
+
+
+def test_persistence(db_path, queue_name):
+    broker = sqlite_broker_mod.SqliteBroker(db_path)
+    msgs = [new_message(str(i).encode()) for i in range(3)]
+    broker.enqueue_many(queue_name, msgs)
+    broker.close()
+
+    broker = sqlite_broker_mod.SqliteBroker(db_path)
+    assert broker.qsize(queue_name) == 3
+    assert broker.receive(queue_name, max_number=3) == msgs
+    broker.close()
+
+    with pytest.raises(BrokerError):
+        broker.qsize(queue_name)
+
+
+def test_crash_recovery(db_path, queue_name):
+    broker = sqlite_broker_mod.SqliteBroker(db_path)
+    msg = new_message(k="v")
+    broker.enqueue(queue_name, msg)
+    assert broker.receive(queue_name) == [msg]
+    # Closed without acking, as if the process crashed
+    broker.close()
+
+    broker = sqlite_broker_mod.SqliteBroker(
+        db_path, recover_processing=False
+    )
+    assert broker.receive(queue_name) == []
+    broker.close()
+
+    broker = sqlite_broker_mod.SqliteBroker(db_path)
+    assert broker.qsize(queue_name) == 1
+    assert broker.receive(queue_name) == [msg]
+    broker.ack(msg, queue_name)
+    broker.close()
+
+
+def test_enqueue_duplicate_id(broker, queue_name):
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    with pytest.raises(BrokerError, match="Duplicate message id"):
+        broker.enqueue(
+            queue_name,
+            HeaderBytesRawMessage(id=msg.id, data=b"other", headers={}),
+        )
+    assert broker.qsize(queue_name) == 1
+
+
+def test_group_commit(broker, queue_name):
+    thread_num, msg_num = 8, 50
+
+    def enqueue(i):
+        for j in range(msg_num):
+            broker.enqueue(queue_name, new_message(f"{i}-{j}".encode()))
+
+    threads = [
+        threading.Thread(target=enqueue, args=(i,)) for i in range(thread_num)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert broker.qsize(queue_name) == thread_num * msg_num
+    msgs = broker.receive(queue_name, max_number=thread_num * msg_num)
+    assert len({msg.id for msg in msgs}) == thread_num * msg_num
+
+
+def test_receive_uses_indexes(broker):
+    conn = broker._conn
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT seq FROM rolecraft_messages"
+        " WHERE queue = ? AND state = ? ORDER BY priority DESC, seq LIMIT 1",
+        ("q", 0),
+    ).fetchall()
+    assert "rolecraft_messages_priority" in str(plan)
+    assert "TEMP B-TREE" not in str(plan)
+
+
+def test_receive_header_keys(broker, queue_name):
+    broker.enqueue(queue_name, new_message(b"data", k="v", retries=1))
+    (received,) = broker.receive(queue_name, header_keys=["retries", "x"])
+    assert received.headers == {"retries": 1}
+    assert received.data == b"data"
+
+    # The headers not received are kept by retrying
+    broker.retry(received, queue_name)
+    (retried,) = broker.receive(queue_name)
+    assert retried.headers == {"k": "v", "retries": 2}
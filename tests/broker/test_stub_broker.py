@@ -0,0 +1,398 @@
+import threading
+import time
+
+import pytest
+
+from rolecraft.broker import HeaderBytesRawMessage, MessageNotFound
+from rolecraft.broker import stub_broker as stub_broker_mod
+
+
+@pytest.fixture()
+def broker():
+    return stub_broker_mod.StubBroker()
+
+
+@pytest.fixture()
+def queue_name():
+    return "stub_queue"
+
+
+def new_message(data: bytes = b"data"):
+    return HeaderBytesRawMessage(data=data)
+
+
+def test_enqueue_and_receive(broker, queue_name):
+    msg = new_message()
+    msg_id = broker.enqueue(queue_name, msg)
+    assert msg_id and msg.id == msg_id
+    assert broker.qsize(queue_name) == 1
+
+    msgs = broker.receive(queue_name)
+    assert msgs == [msg]
+    assert broker.receive(queue_name) == []
+
+    broker.ack(msg, queue_name)
+    assert broker.qsize(queue_name) == 0
+
+
+def test_enqueue_many(broker, queue_name):
+    msgs = [new_message(str(i).encode()) for i in range(10)]
+    ids = broker.enqueue_many(queue_name, msgs)
+    assert ids == [msg.id for msg in msgs]
+    assert len(set(ids)) == 10
+    assert broker.qsize(queue_name) == 10
+
+    assert broker.receive(queue_name, max_number=4) == msgs[:4]
+    assert broker.receive(queue_name, max_number=10) == msgs[4:]
+
+
+def test_enqueue_many_wakes_waiters(broker, queue_name):
+    rv = []
+
+    def receive():
+        future = broker.block_receive(
+            queue_name, max_number=2, wait_time_seconds=10
+        )
+        rv.append(future.result())
+
+    threads = [threading.Thread(target=receive) for _ in range(3)]
+    for t in threads:
+        t.start()
+    time.sleep(0.1)
+
+    msgs = [new_message() for _ in range(5)]
+    broker.enqueue_many(queue_name, msgs)
+
+    for t in threads:
+        t.join(timeout=1)
+        assert not t.is_alive()
+
+    assert sorted(map(len, rv)) == [1, 2, 2]
+    received = [msg for batch in rv for msg in batch]
+    assert sorted(m.id for m in received) == sorted(m.id for m in msgs)
+
+
+def test_block_receive_timeout(broker, queue_name):
+    future = broker.block_receive(queue_name, wait_time_seconds=0.1)
+    start = time.monotonic()
+    assert future.result() == []
+    assert time.monotonic() - start >= 0.1
+
+
+def test_block_receive_cancel(broker, queue_name):
+    future = broker.block_receive(queue_name)
+    t = threading.Timer(0.1, future.cancel)
+    t.start()
+    assert future.result() == []
+    t.join()
+
+    broker.enqueue(queue_name, new_message())
+    assert len(broker.receive(queue_name)) == 1
+
+
+def test_requeue(broker, queue_name):
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    [received] = broker.receive(queue_name)
+    broker.requeue(received, queue_name)
+    assert broker.qsize(queue_name) == 1
+    assert broker.receive(queue_name) == [msg]
+
+
+def test_ack_many(broker, queue_name):
+    msgs = [new_message() for _ in range(3)]
+    broker.enqueue_many(queue_name, msgs)
+    received = broker.receive(queue_name, max_number=3)
+
+    broker.ack_many(received[:2], queue_name)
+    assert broker.qsize(queue_name) == 1
+
+    # all or none
+    with pytest.raises(MessageNotFound):
+        broker.ack_many(received, queue_name)
+    assert broker.qsize(queue_name) == 1
+
+    broker.nack_many(received[2:], queue_name, exceptions=[Exception()])
+    assert broker.qsize(queue_name) == 0
+
+
+def test_requeue_many(broker, queue_name):
+    msgs = [new_message() for _ in range(3)]
+    broker.enqueue_many(queue_name, msgs)
+    received = broker.receive(queue_name, max_number=3)
+
+    broker.requeue_many(received, queue_name)
+    assert broker.qsize(queue_name) == 3
+    assert broker.receive(queue_name, max_number=3) == msgs
+
+
+def test_delayed_message(broker, queue_name):
+    msg = new_message()
+    broker.enqueue(queue_name, msg, delay_millis=100)
+    assert broker.qsize(queue_name) == 1
+    assert broker.receive(queue_name) == []
+
+    time.sleep(0.1)
+    assert broker.receive(queue_name) == [msg]
+
+
+def test_delayed_messages_in_due_order(broker, queue_name):
+    msgs = [new_message(str(i).encode()) for i in range(3)]
+    broker.enqueue(queue_name, msgs[0], delay_millis=150)
+    broker.enqueue(queue_name, msgs[1], delay_millis=50)
+    broker.enqueue(queue_name, msgs[2], delay_millis=100)
+
+    time.sleep(0.2)
+    assert broker.receive(queue_name, max_number=3) == [
+        msgs[1],
+        msgs[2],
+        msgs[0],
+    ]
+
+
+def test_block_receive_wakes_up_for_delayed_message(broker, queue_name):
+    future = broker.block_receive(queue_name, wait_time_seconds=10)
+    msg = new_message()
+
+    def enqueue():
+        time.sleep(0.05)
+        broker.enqueue(queue_name, msg, delay_millis=100)
+
+    t = threading.Thread(target=enqueue)
+    t.start()
+    start = time.monotonic()
+    assert future.result() == [msg]
+    elapsed = time.monotonic() - start
+    assert 0.15 <= elapsed < 1
+    t.join()
+
+
+def test_block_receive_wakes_up_for_earlier_delayed_message(
+    broker, queue_name
+):
+    later, earlier = new_message(), new_message()
+    broker.enqueue(queue_name, later, delay_millis=5000)
+    future = broker.block_receive(queue_name, wait_time_seconds=10)
+
+    def enqueue():
+        time.sleep(0.05)
+        broker.enqueue(queue_name, earlier, delay_millis=100)
+
+    t = threading.Thread(target=enqueue)
+    t.start()
+    start = time.monotonic()
+    assert future.result() == [earlier]
+    assert time.monotonic() - start < 1
+    assert broker.qsize(queue_name) == 2
+    t.join()
+
+
+def test_retry_with_delay(broker, queue_name):
+    broker.enqueue(queue_name, new_message())
+    [msg] = broker.receive(queue_name)
+
+    broker.retry(msg, queue_name, delay_millis=50)
+    assert broker.qsize(queue_name) == 1
+    assert broker.receive(queue_name) == []
+
+    time.sleep(0.05)
+    [retried] = broker.receive(queue_name)
+    assert retried.headers["retries"] == 1
+
+
+def test_priority(broker, queue_name):
+    low, default, high, high2 = (new_message() for _ in range(4))
+    broker.enqueue(queue_name, low, priority=10)
+    broker.enqueue(queue_name, default)
+    broker.enqueue(queue_name, high, priority=90)
+    broker.enqueue_many(queue_name, [high2], priority=90)
+
+    assert broker.receive(queue_name, max_number=4) == [
+        high,
+        high2,
+        default,
+        low,
+    ]
+
+
+def test_requeue_keeps_priority(broker, queue_name):
+    low, high = new_message(), new_message()
+    broker.enqueue(queue_name, high, priority=90)
+    [received] = broker.receive(queue_name)
+    broker.enqueue(queue_name, low, priority=10)
+
+    broker.requeue(received, queue_name)
+    assert broker.receive(queue_name, max_number=2) == [high, low]
+
+
+def test_retry_keeps_priority(broker, queue_name):
+    other, high = new_message(), new_message()
+    broker.enqueue(queue_name, high, priority=90)
+    [received] = broker.receive(queue_name)
+    broker.enqueue(queue_name, other, priority=60)
+
+    new_id = broker.retry(received, queue_name)
+    assert [msg.id for msg in broker.receive(queue_name, max_number=2)] == [
+        new_id,
+        other.id,
+    ]
+
+
+def test_delayed_message_with_priority(broker, queue_name):
+    low, high = new_message(), new_message()
+    broker.enqueue(queue_name, low, priority=10)
+    broker.enqueue(queue_name, high, priority=90, delay_millis=50)
+
+    time.sleep(0.05)
+    assert broker.receive(queue_name, max_number=2) == [high, low]
+
+
+def test_visibility_timeout(broker, queue_name):
+    broker.prepare_queue(queue_name, visibility_timeout_seconds=0.05)
+    msgs = [new_message(str(i).encode()) for i in range(3)]
+    broker.enqueue_many(queue_name, msgs)
+
+    received = broker.receive(queue_name, max_number=2)
+    assert received == msgs[:2]
+    broker.ack(received[1], queue_name)
+
+    time.sleep(0.06)
+    # The expired message is redelivered at the head of the queue
+    assert broker.receive(queue_name, max_number=3) == [msgs[0], msgs[2]]
+    assert broker.qsize(queue_name) == 2
+
+
+def test_ack_after_visibility_timeout(broker, queue_name):
+    broker.prepare_queue(queue_name, visibility_timeout_seconds=0.05)
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    broker.receive(queue_name)
+
+    time.sleep(0.06)
+    with pytest.raises(MessageNotFound):
+        broker.extend_visibility(msg, queue_name, seconds=1)
+    with pytest.raises(MessageNotFound):
+        broker.ack(msg, queue_name)
+
+
+def test_extend_visibility(broker, queue_name):
+    broker.prepare_queue(queue_name, visibility_timeout_seconds=0.05)
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    broker.receive(queue_name)
+
+    broker.extend_visibility(msg, queue_name, seconds=1)
+    time.sleep(0.06)
+    assert broker.receive(queue_name) == []
+    broker.ack(msg, queue_name)
+    assert broker.qsize(queue_name) == 0
+
+
+def test_extend_visibility_without_timeout(broker, queue_name):
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    broker.receive(queue_name)
+
+    broker.extend_visibility(msg, queue_name, seconds=0.01)
+    time.sleep(0.02)
+    assert broker.receive(queue_name) == []
+    broker.ack(msg, queue_name)
+    with pytest.raises(MessageNotFound):
+        broker.extend_visibility(msg, queue_name, seconds=0.01)
+
+
+def test_block_receive_wakes_up_for_expired_lease(broker, queue_name):
+    broker.prepare_queue(queue_name, visibility_timeout_seconds=0.05)
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    broker.receive(queue_name)
+
+    start = time.monotonic()
+    future = broker.block_receive(queue_name, wait_time_seconds=2)
+    assert future.result() == [msg]
+    assert time.monotonic() - start < 1
+
+
+def start_waiters(broker, queue_name, num, rv, wait_time_seconds=5):
+    """Starts waiters one by one, so they wait in order."""
+
+    def receive(i):
+        future = broker.block_receive(
+            queue_name, wait_time_seconds=wait_time_seconds
+        )
+        rv[i] = future.result()
+
+    threads = []
+    queue = broker._queues[queue_name]
+    for i in range(num):
+        t = threading.Thread(target=receive, args=(i,))
+        t.start()
+        threads.append(t)
+        while len(queue._waiting_queue) < i + 1:
+            time.sleep(0.001)
+    return threads
+
+
+def test_waiters_are_served_in_order(broker, queue_name):
+    rv = {}
+    threads = start_waiters(broker, queue_name, 3, rv)
+
+    msgs = [new_message(str(i).encode()) for i in range(3)]
+    for msg in msgs:
+        broker.enqueue(queue_name, msg)
+        # a new receiver doesn't take the messages ahead of the waiters
+        assert broker.receive(queue_name) == []
+
+    for t in threads:
+        t.join(1)
+    assert rv == {0: [msgs[0]], 1: [msgs[1]], 2: [msgs[2]]}
+
+
+def test_handoff_wakes_up_only_the_served_waiters(broker, queue_name):
+    rv = {}
+    threads = start_waiters(broker, queue_name, 2, rv, wait_time_seconds=0.2)
+
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    threads[0].join(1)
+    assert rv == {0: [msg]}
+    assert threads[1].is_alive()
+
+    threads[1].join(1)
+    assert rv == {0: [msg], 1: []}
+
+
+def test_cancel_after_handoff_keeps_messages(broker, queue_name):
+    future = broker.block_receive(queue_name, wait_time_seconds=5)
+    proxy = future._proxy
+    queue = broker._queues[queue_name]
+    rv = []
+    t = threading.Thread(target=lambda: rv.append(future.result()))
+    t.start()
+    while not queue._waiting_queue:
+        time.sleep(0.001)
+
+    # The message is handed off to the waiter at the enqueue, and the waiter
+    # is likely cancelled before it wakes up.
+    msg = new_message()
+    broker.enqueue(queue_name, msg)
+    future.cancel()
+    t.join(1)
+    assert proxy.cancelled
+    assert rv == [[msg]]
+
+
+def test_receive_header_keys(broker, queue_name):
+    msg = HeaderBytesRawMessage(data=b"data", headers={"k": "v", "x": 1})
+    broker.enqueue(queue_name, msg)
+    (received,) = broker.receive(queue_name, header_keys=["x"])
+    assert received.headers == {"x": 1}
+    assert msg.headers == {"k": "v", "x": 1}
+
+    received.headers["x"] = 2
+    broker.retry(received, queue_name)
+    (retried,) = broker.block_receive(queue_name, header_keys=[]).result()
+    assert retried.headers == {}
+    broker.requeue(retried, queue_name)
+    (retried,) = broker.receive(queue_name)
+    assert retried.headers == {"k": "v", "x": 2, "retries": 1}
@@ -0,0 +1,233 @@
+import threading
+import time
+
+import pytest
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import (
+    HeaderBytesEncoder,
+    Message,
+    MessageQueue,
+    QueueConfig,
+)
+from rolecraft.queue_factory import QueueFactory
+from rolecraft.service.consumer import ByteBudget, DefaultConsumerFactory
+
+
+def test_total_limit():
+    budget = ByteBudget(max_bytes=100)
+    assert budget.acquire("queue1", 60)
+    assert not budget.acquire("queue2", 60, timeout=0.01)
+    assert budget.acquire("queue2", 40, timeout=0.01)
+    assert budget.used() == 100
+    assert not budget.has_room("queue1")
+
+    budget.release("queue1", 60)
+    assert budget.used() == 40
+    assert budget.used("queue1") == 0
+    assert budget.has_room("queue1")
+
+
+def test_queue_quota():
+    budget = ByteBudget(
+        max_bytes=100, queue_max_bytes=50, queue_quotas={"big": 80}
+    )
+    assert budget.quota("small") == 50
+    assert budget.quota("big") == 80
+
+    assert budget.acquire("small", 30)
+    assert budget.room("small") == 20
+    assert budget.room("big") == 70
+    assert not budget.acquire("small", 30, timeout=0.01)
+    assert budget.has_room("big")
+    assert budget.acquire("big", 60, timeout=0.01)
+    assert budget.used() == 90
+    assert budget.room("big") == 10
+
+
+def test_oversized_message_admitted_alone():
+    budget = ByteBudget(max_bytes=100, queue_max_bytes=10)
+    assert budget.acquire("queue1", 50)
+    assert not budget.acquire("queue1", 1, timeout=0.01)
+    # Other queues keep flowing within the total
+    assert budget.acquire("queue2", 10, timeout=0.01)
+
+    budget.release("queue2", 10)
+    budget.release("queue1", 50)
+    assert budget.acquire("queue1", 1000, timeout=0.01)
+    assert not budget.acquire("queue2", 1, timeout=0.01)
+
+
+def test_acquire_waits_for_release():
+    budget = ByteBudget(max_bytes=10)
+    assert budget.acquire("queue", 10)
+
+    t = threading.Timer(0.05, budget.release, args=("queue", 10))
+    t.start()
+    start = time.monotonic()
+    assert budget.acquire("queue", 10, timeout=2)
+    assert time.monotonic() - start < 1
+    t.join()
+
+
+def test_close():
+    budget = ByteBudget(max_bytes=10)
+    assert budget.acquire("queue", 10)
+    t = threading.Timer(0.05, budget.close)
+    t.start()
+    assert budget.acquire("queue", 10)
+    t.join()
+    assert budget.has_room("queue")
+
+
+def test_wait_for_room():
+    budget = ByteBudget(max_bytes=10)
+    assert budget.acquire("queue", 10)
+    assert not budget.wait_for_room("queue", timeout=0.01)
+
+    t = threading.Timer(0.05, budget.release, args=("queue", 10))
+    t.start()
+    assert budget.wait_for_room("queue", timeout=2)
+    t.join()
+
+
+def test_invalid_max_bytes():
+    with pytest.raises(ValueError):
+        ByteBudget(max_bytes=0)
+
+
+@pytest.mark.parametrize("poller_num", [0, 1])
+def test_consumer_bounded_by_bytes(poller_num):
+    broker = StubBroker()
+    queues = [
+        MessageQueue(name=name, broker=broker, encoder=HeaderBytesEncoder())
+        for name in ("big", "small")
+    ]
+    queues[0].enqueue_many(
+        [
+            Message(role_name="role", role_data="x" * 1000, queue=queues[0])
+            for _ in range(5)
+        ]
+    )
+    queues[1].enqueue_many(
+        [Message(role_name="role", queue=queues[1]) for _ in range(5)]
+    )
+    consumer = DefaultConsumerFactory()(
+        queues=queues,
+        prefetch_size=20,
+        poller_num=poller_num,
+        prefetch_max_bytes=2000,
+        prefetch_queue_max_bytes=1500,
+    )
+    budget = consumer.byte_budget
+    assert isinstance(budget, ByteBudget)
+
+    consumer.start()
+    msgs = consumer.consume()
+    deadline = time.monotonic() + 2
+    while budget.used("small") + len(msgs) < 5:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    # A single big message is buffered at a time within the queue quota,
+    # while the small messages are all buffered
+    assert budget.used("big") <= 1500
+    assert budget.used() <= 2000
+
+    while len(msgs) < 10 and time.monotonic() < deadline:
+        msgs.extend(consumer.consume(max_num=10))
+    consumer.stop()
+    consumer.join()
+    assert len(msgs) == 10
+    assert budget.used("big") == 0
+
+
+def test_consumer_receives_within_room():
+    broker = StubBroker()
+    queue = MessageQueue(
+        name="big", broker=broker, encoder=HeaderBytesEncoder()
+    )
+    queue.enqueue_many(
+        [
+            Message(role_name="role", role_data="x" * 1000, queue=queue)
+            for _ in range(10)
+        ]
+    )
+    consumer = DefaultConsumerFactory()(
+        queues=[queue], prefetch_size=20, prefetch_max_bytes=2500
+    )
+    budget = consumer.byte_budget
+    assert isinstance(budget, ByteBudget)
+
+    consumer.start()
+    consumer._start_consumer_threads()
+    try:
+        deadline = time.monotonic() + 2
+        while budget.used() < 2000:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        time.sleep(0.05)
+        # Two messages are buffered and one waits for the room, while the
+        # others are left in the broker
+        assert len(broker._queues["big"]._msg_queue) == 7
+
+        msgs = []
+        while len(msgs) < 10 and time.monotonic() < deadline:
+            msgs.extend(consumer.consume(max_num=10))
+    finally:
+        consumer.stop()
+        consumer.join()
+    assert len(msgs) == 10
+
+
+def test_consumer_with_quotas_from_settings():
+    broker = StubBroker()
+    configs = {
+        "big": QueueConfig(
+            broker=broker,
+            encoder=HeaderBytesEncoder(),
+            settings={"prefetch_max_bytes": 1000},
+        ),
+        "small": QueueConfig(broker=broker, encoder=HeaderBytesEncoder()),
+    }
+    queue_factory = QueueFactory(
+        config_fetcher=lambda queue_name, **kwds: configs[queue_name]
+    )
+    queues = [queue_factory.build_queue(queue_name=name) for name in configs]
+    queues[0].enqueue_many(
+        [
+            Message(role_name="role", role_data="x" * 1000, queue=queues[0])
+            for _ in range(3)
+        ]
+    )
+    queues[1].enqueue_many(
+        [Message(role_name="role", queue=queues[1]) for _ in range(3)]
+    )
+    consumer = DefaultConsumerFactory()(
+        queues=queues,
+        prefetch_size=2,
+        prefetch_max_bytes=10_000,
+    )
+    budget = consumer.byte_budget
+    assert isinstance(budget, ByteBudget)
+    assert budget.queue_quotas == {"big": 1000}
+
+    consumer.start()
+    consumer._start_consumer_threads()
+    try:
+        deadline = time.monotonic() + 2
+        while not budget.used("big"):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        time.sleep(0.05)
+        # The big queue doesn't receive more messages once its quota is
+        # used up
+        assert not budget.has_room("big")
+        assert len(broker._queues["big"]._msg_queue) == 2
+
+        msgs = []
+        while len(msgs) < 6 and time.monotonic() < deadline:
+            msgs.extend(consumer.consume(max_num=6))
+    finally:
+        consumer.stop()
+        consumer.join()
+    assert len(msgs) == 6
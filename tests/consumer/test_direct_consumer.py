@@ -0,0 +1,138 @@
+import threading
+import time
+
+import pytest
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+from rolecraft.service.consumer import (
+    DefaultConsumerFactory,
+    DirectConsumer,
+    NoPrefetch,
+)
+
+
+@pytest.fixture()
+def broker():
+    return StubBroker()
+
+
+@pytest.fixture()
+def queues(broker):
+    return [
+        MessageQueue(
+            name=f"queue{i}", broker=broker, encoder=HeaderBytesEncoder()
+        )
+        for i in range(20)
+    ]
+
+
+@pytest.fixture()
+def consumer(queues):
+    c = DirectConsumer(queues=queues, waiting_queue_num=4)
+    c.start()
+    yield c
+    c.stop()
+    c.join()
+
+
+def enqueue(queue: MessageQueue, num: int = 1):
+    return queue.enqueue_many(
+        [Message(role_name="role", queue=queue) for _ in range(num)]
+    )
+
+
+def test_consume_from_many_queues(consumer, queues):
+    ids = set()
+    for queue in queues:
+        ids.update(enqueue(queue, 2))
+
+    received = []
+    lock = threading.Lock()
+    all_received = threading.Event()
+
+    def work():
+        while not all_received.is_set():
+            msgs = consumer.consume(max_num=3)
+            with lock:
+                received.extend(msg.id for msg in msgs)
+                if len(received) >= len(ids):
+                    all_received.set()
+
+    workers = [threading.Thread(target=work) for _ in range(3)]
+    for t in workers:
+        t.start()
+    assert all_received.wait(timeout=2)
+    consumer.stop()
+    for t in workers:
+        t.join()
+    assert sorted(received) == sorted(ids)
+
+
+def test_no_prefetch(consumer, queues):
+    enqueue(queues[0], 3)
+    assert len(consumer.consume()) == 1
+    # The other messages are left in the broker
+    assert len(queues[0].receive(max_number=3)) == 2
+
+
+def test_wait_for_message(consumer, queues):
+    rv = []
+    t = threading.Thread(target=lambda: rv.extend(consumer.consume()))
+    t.start()
+    time.sleep(0.05)
+
+    # The worker waits on the first queues
+    (msg_id,) = enqueue(queues[2])
+    t.join(timeout=1)
+    assert [msg.id for msg in rv] == [msg_id]
+
+
+def test_rescan_queues_outside_window(queues):
+    consumer = DirectConsumer(
+        queues=queues, waiting_queue_num=1, rescan_seconds=0.05
+    )
+    rv = []
+    t = threading.Thread(target=lambda: rv.extend(consumer.consume()))
+    t.start()
+    time.sleep(0.02)
+
+    (msg_id,) = enqueue(queues[-1])
+    t.join(timeout=1)
+    assert [msg.id for msg in rv] == [msg_id]
+    consumer.stop()
+
+
+def test_surplus_requeued(consumer, queues):
+    enqueue(queues[0])
+    enqueue(queues[1])
+    msgs, i = consumer._wait(queues[:2], max_num=1, wait_seconds=1)
+    assert i == 0
+    assert [msg.queue for msg in msgs] == [queues[0]]
+    assert len(queues[1].receive()) == 1
+
+
+def test_stop_cancels_waiting(consumer):
+    rv = []
+    t = threading.Thread(target=lambda: rv.append(consumer.consume()))
+    t.start()
+    time.sleep(0.05)
+
+    start = time.monotonic()
+    consumer.stop()
+    t.join(timeout=1)
+    assert rv == [[]]
+    assert time.monotonic() - start < 0.5
+
+
+def test_factory(queues):
+    consumer = DefaultConsumerFactory()(
+        queues=queues, no_prefetch=NoPrefetch()
+    )
+    assert isinstance(consumer, DirectConsumer)
+
+
+def test_consume_timeout(consumer):
+    start = time.monotonic()
+    assert consumer.consume(timeout=0.05) == []
+    assert 0.05 <= time.monotonic() - start < 0.5
@@ -0,0 +1,110 @@
+import time
+
+import pytest
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+from rolecraft.service.consumer import DefaultConsumerFactory
+from rolecraft.service.consumer import (
+    multiplex_consumer as multiplex_consumer_mod,
+)
+
+
+@pytest.fixture()
+def broker():
+    return StubBroker()
+
+
+@pytest.fixture()
+def queues(broker):
+    return [
+        MessageQueue(
+            name=f"queue{i}", broker=broker, encoder=HeaderBytesEncoder()
+        )
+        for i in range(10)
+    ]
+
+
+@pytest.fixture()
+def consumer(queues):
+    c = multiplex_consumer_mod.MultiplexConsumer(
+        queues=queues,
+        prefetch_size=4,
+        poller_num=2,
+        max_backoff_seconds=0.05,
+    )
+    c.start()
+    yield c
+    c.stop()
+    c.join()
+
+
+def enqueue(queue: MessageQueue, num: int = 1):
+    return queue.enqueue_many(
+        [Message(role_name="role", queue=queue) for _ in range(num)]
+    )
+
+
+def consume_all(consumer, num: int, timeout: float = 2) -> list[Message]:
+    msgs = []
+    deadline = time.monotonic() + timeout
+    while len(msgs) < num and time.monotonic() < deadline:
+        msgs.extend(consumer.consume(max_num=num - len(msgs)))
+    return msgs
+
+
+def test_consume_from_many_queues(consumer, queues):
+    ids = set()
+    for queue in queues:
+        ids.update(enqueue(queue, 3))
+
+    msgs = consume_all(consumer, 30)
+    assert {msg.id for msg in msgs} == ids
+    assert len(consumer._consumer_threads) == 2
+
+
+def test_idle_queue_is_polled_with_backoff(consumer, queues):
+    # let the queues back off to the maximum
+    (msg_id,) = enqueue(queues[3])
+    assert [msg.id for msg in consume_all(consumer, 1)] == [msg_id]
+    time.sleep(0.2)
+
+    start = time.monotonic()
+    (msg_id,) = enqueue(queues[7])
+    assert [msg.id for msg in consume_all(consumer, 1)] == [msg_id]
+    assert time.monotonic() - start < 0.5
+
+
+def test_backlog_first(queues):
+    states = [
+        multiplex_consumer_mod._QueueState(queue, last_received=received)
+        for queue, received in zip(queues, (0, 2, 5, 1))
+    ]
+    states[3].next_poll_at = 10
+
+    due_states = multiplex_consumer_mod._due_states(states, now=5)
+    assert [s.queue for s in due_states] == [queues[2], queues[1], queues[0]]
+
+
+def test_stop_requeues_prefetched_messages(queues):
+    consumer = multiplex_consumer_mod.MultiplexConsumer(
+        queues=queues, prefetch_size=1, poller_num=1
+    )
+    enqueue(queues[0], 3)
+    consumer.start()
+    assert len(consumer.consume()) == 1
+    # The poller is blocked by the full local queue
+    time.sleep(0.05)
+
+    consumer.stop()
+    consumer.join()
+    assert queues[0].qsize() == 3
+    assert len(queues[0].receive(max_number=3)) == 2
+
+
+def test_factory(queues):
+    consumer = DefaultConsumerFactory()(
+        queues=queues, prefetch_size=1, poller_num=3
+    )
+    assert isinstance(consumer, multiplex_consumer_mod.MultiplexConsumer)
+    assert consumer.poller_num == 3
@@ -0,0 +1,125 @@
+import threading
+import time
+
+import pytest
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+from rolecraft.service.consumer import (
+    DefaultConsumerFactory,
+    PrefetchController,
+    PrefetchDecision,
+)
+from rolecraft.service.consumer import (
+    threaded_consumer as threaded_consumer_mod,
+)
+
+
+def handle(controller: PrefetchController, queue_name: str, seconds: float):
+    controller.taken([queue_name])
+    time.sleep(seconds)
+    controller.handled()
+
+
+def test_target_follows_handling_time():
+    controller = PrefetchController(max_buffered=100, target_seconds=0.1)
+    # Unknown handling time
+    assert controller.reserve("queue") == 1
+
+    handle(controller, "queue", 0.01)
+    decision = controller.decisions()["queue"]
+    assert 0.01 <= decision.handling_seconds < 0.05
+    assert 2 <= decision.target <= 10
+    assert controller.reserve("queue") == decision.target
+    assert controller.decisions()["queue"].buffered == decision.target
+
+
+def test_global_ceiling():
+    controller = PrefetchController(
+        max_buffered=5, target_seconds=10, smoothing=1
+    )
+    controller.reserve("slow")
+    handle(controller, "slow", 0.01)
+    # The target is clamped by the ceiling
+    assert controller.decisions()["slow"].target == 5
+
+    assert controller.reserve("slow") == 5
+    assert controller.reserve("fast", timeout=0.01) == 0
+
+    controller.release("slow", 2)
+    assert controller.reserve("fast", timeout=0.01) == 1
+    assert controller.reserve("fast", timeout=0.01) == 0
+
+
+def test_reserve_waits_for_taken():
+    controller = PrefetchController(max_buffered=1)
+    assert controller.reserve("queue") == 1
+
+    t = threading.Timer(0.05, controller.taken, args=(["queue"],))
+    t.start()
+    start = time.monotonic()
+    assert controller.reserve("queue", timeout=2) == 1
+    assert time.monotonic() - start < 1
+    t.join()
+
+
+def test_close_wakes_up_reservations():
+    controller = PrefetchController(max_buffered=1)
+    assert controller.reserve("queue") == 1
+
+    t = threading.Timer(0.05, controller.close)
+    t.start()
+    assert controller.reserve("queue") == 0
+    t.join()
+
+
+def test_decisions():
+    controller = PrefetchController(max_buffered=3)
+    controller.reserve("queue")
+    assert controller.decisions() == {
+        "queue": PrefetchDecision(
+            queue_name="queue", handling_seconds=None, target=1, buffered=1
+        )
+    }
+
+
+def test_invalid_arguments():
+    with pytest.raises(ValueError):
+        PrefetchController(max_buffered=0)
+    with pytest.raises(ValueError):
+        PrefetchController(max_buffered=1, target_seconds=0)
+    with pytest.raises(ValueError):
+        threaded_consumer_mod.ThreadedConsumer(
+            queues=[],
+            prefetch_size=1,
+            prefetch_controller=PrefetchController(max_buffered=2),
+        )
+
+
+def test_threaded_consumer_with_controller():
+    broker = StubBroker()
+    queue = MessageQueue(
+        name="queue", broker=broker, encoder=HeaderBytesEncoder()
+    )
+    queue.enqueue_many(
+        [Message(role_name="role", queue=queue) for _ in range(20)]
+    )
+    consumer = DefaultConsumerFactory()(
+        queues=[queue], prefetch_size=10, prefetch_target_seconds=0.1
+    )
+    controller = consumer.prefetch_controller
+    assert isinstance(controller, PrefetchController)
+
+    consumer.start()
+    msgs = []
+    deadline = time.monotonic() + 2
+    while len(msgs) < 20 and time.monotonic() < deadline:
+        msgs.extend(consumer.consume())
+        time.sleep(0.01)
+    consumer.stop()
+    consumer.join()
+
+    assert len(msgs) == 20
+    decision = controller.decisions()["queue"]
+    assert decision.handling_seconds >= 0.01
+    assert 1 < decision.target <= 10
@@ -0,0 +1,166 @@
+import collections
+import itertools
+import threading
+import time
+
+import pytest
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+from rolecraft.service.consumer import (
+    DefaultConsumerFactory,
+    DeficitRoundRobinPolicy,
+    ShortestBacklogPolicy,
+    StrictPriorityPolicy,
+    WeightedFairPolicy,
+)
+from rolecraft.service.consumer import (
+    scheduled_queue as scheduled_queue_mod,
+)
+from rolecraft.service.consumer import (
+    scheduling_policy as scheduling_policy_mod,
+)
+
+
+def new_queue(policy, queue_maxsize=100):
+    return scheduled_queue_mod.ScheduledQueue[tuple[str, int]](
+        policy,
+        key=lambda item: item[0],
+        maxsize=queue_maxsize * 2,
+        queue_maxsize=queue_maxsize,
+    )
+
+
+def fill(queue, counts: dict[str, int]):
+    for name, count in counts.items():
+        for i in range(count):
+            queue.put((name, i))
+
+
+def drain(queue, num: int | None = None) -> list[str]:
+    return [name for name, _ in itertools.islice(queue, num)]
+
+
+def test_strict_priority():
+    queue = new_queue(StrictPriorityPolicy({"high": 10}))
+    fill(queue, {"low": 3, "high": 2})
+    assert drain(queue) == ["high", "high", "low", "low", "low"]
+
+
+@pytest.mark.parametrize(
+    "policy_cls", [WeightedFairPolicy, DeficitRoundRobinPolicy]
+)
+def test_weighted(policy_cls):
+    queue = new_queue(policy_cls({"a": 3, "b": 1}))
+    fill(queue, {"a": 60, "b": 60})
+    counts = collections.Counter(drain(queue, 40))
+    assert counts == {"a": 30, "b": 10}
+
+
+@pytest.mark.parametrize(
+    "policy_cls", [WeightedFairPolicy, DeficitRoundRobinPolicy]
+)
+def test_weighted_idle_queue_doesnt_save_up(policy_cls):
+    queue = new_queue(policy_cls())
+    fill(queue, {"a": 20})
+    assert drain(queue, 10) == ["a"] * 10
+
+    # "b" shares the buffer evenly with "a" from now on
+    fill(queue, {"b": 10})
+    counts = collections.Counter(drain(queue, 10))
+    assert counts == {"a": 5, "b": 5}
+
+
+def test_shortest_backlog():
+    queue = new_queue(ShortestBacklogPolicy())
+    fill(queue, {"bulk": 5, "light": 2})
+    assert drain(queue) == [
+        "light",
+        "light",
+        "bulk",
+        "bulk",
+        "bulk",
+        "bulk",
+        "bulk",
+    ]
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        WeightedFairPolicy({"a": 0})
+    with pytest.raises(ValueError):
+        scheduling_policy_mod.create_scheduling_policy("unknown")
+
+
+def test_queue_bounded_separately():
+    queue = new_queue(StrictPriorityPolicy(), queue_maxsize=1)
+    queue.put(("a", 0))
+    # another queue still has room
+    queue.put(("b", 0))
+
+    t = threading.Thread(target=queue.put, args=(("a", 1),))
+    t.start()
+    time.sleep(0.05)
+    assert t.is_alive()
+    assert queue.get() == ("a", 0)
+    t.join()
+    assert sorted(queue) == [("a", 1), ("b", 0)]
+
+
+def test_get_until_notify_all():
+    queue = new_queue(StrictPriorityPolicy())
+    rv = []
+    t = threading.Thread(
+        target=lambda: rv.append(queue.get(wakeup_until_notify_all=True))
+    )
+    t.start()
+    time.sleep(0.05)
+    queue.put(("a", 0))
+    t.join()
+    assert rv == [("a", 0)]
+
+    t = threading.Thread(
+        target=lambda: rv.append(queue.get(wakeup_until_notify_all=True))
+    )
+    t.start()
+    queue.notify_all()
+    t.join()
+    assert rv == [("a", 0), None]
+
+
+def test_consumer_with_weights_from_settings():
+    broker = StubBroker()
+    queues = [
+        MessageQueue(
+            name=name,
+            broker=broker,
+            encoder=HeaderBytesEncoder(),
+            settings={"weight": weight},
+        )
+        for name, weight in (("bulk", 1), ("urgent", 100))
+    ]
+    for queue in queues:
+        queue.enqueue_many(
+            [Message(role_name="role", queue=queue) for _ in range(10)]
+        )
+    consumer = DefaultConsumerFactory()(
+        queues=queues,
+        prefetch_size=20,
+        scheduling_policy="strict_priority",
+    )
+    assert consumer._local_queue.policy.weights == {"bulk": 1, "urgent": 100}
+
+    consumer.start()
+    consumer._start_consumer_threads()
+    # wait for both queues to be prefetched
+    deadline = time.monotonic() + 2
+    while len(consumer._local_queue._backlogs) < 2 or any(
+        n < 10 for n in consumer._local_queue._backlogs.values()
+    ):
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+    msgs = consumer.consume(max_num=20)
+    consumer.stop()
+    consumer.join()
+    assert [msg.queue.name for msg in msgs] == ["urgent"] * 10 + ["bulk"] * 10
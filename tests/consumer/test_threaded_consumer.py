@@ -1,10 +1,12 @@
 import dataclasses
 import threading
+import time
 from unittest import mock
 
 import pytest
 
-from rolecraft.queue import MessageQueue
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
 from rolecraft.service.consumer import (
     threaded_consumer as threaded_consumer_mod,
 )
@@ -34,6 +36,8 @@ class TestWithMockedQueue:
             def requeue(self, *args, **kwargs):
                 return queue.requeue(self, *args, **kwargs)
 
+        Message.queue = queue
+
         class ResultFuture:
             def __init__(self, *rv, timeout=0) -> None:
                 self.rv = list(rv)
@@ -95,4 +99,85 @@ class TestWithMockedQueue:
         consumer.stop()
         consumer.join()
         assert queue.block_receive.call_count >= 2
-        assert queue.requeue.call_count == queue.block_receive.call_count - 2
+        requeued = sum(
+            len(call.args[0]) for call in queue.requeue_many.call_args_list
+        )
+        assert requeued == queue.block_receive.call_count - 2
+
+
+class TestDrain:
+    @pytest.fixture()
+    def queue(self):
+        queue = MessageQueue(
+            name="queue", broker=StubBroker(), encoder=HeaderBytesEncoder()
+        )
+        queue.enqueue_many(
+            [Message(role_name="role", queue=queue) for _ in range(10)]
+        )
+        return queue
+
+    def start(self, queue, **kwargs):
+        consumer = ThreadedConsumer(queues=[queue], prefetch_size=5, **kwargs)
+        consumer._start_consumer_threads()
+        # The local queue is full and the consumer thread is blocked by
+        # putting the second batch
+        deadline = time.monotonic() + 2
+        while len(consumer._local_queue) < 5:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        time.sleep(0.05)
+        return consumer
+
+    def test_bulk_requeue(self, queue):
+        consumer = self.start(queue)
+        consumer.stop()
+        with mock.patch.object(
+            queue, "requeue_many", wraps=queue.requeue_many
+        ) as requeue_many:
+            start = time.monotonic()
+            consumer.join()
+        assert time.monotonic() - start < 0.1
+        assert requeue_many.call_count <= 2
+        assert consumer.drain_result == threaded_consumer_mod.DrainResult(
+            returned=10, abandoned=0
+        )
+        assert len(queue.receive(max_number=10)) == 10
+
+    def test_deadline(self, queue):
+        consumer = self.start(queue, drain_timeout_seconds=0)
+        consumer.stop()
+        consumer.join()
+        assert consumer.drain_result == threaded_consumer_mod.DrainResult(
+            returned=0, abandoned=10
+        )
+
+    def test_failed_requeue_is_abandoned(self, queue):
+        consumer = self.start(queue)
+        consumer.stop()
+        with mock.patch.object(
+            queue, "requeue_many", side_effect=RuntimeError
+        ):
+            consumer.join()
+        assert consumer.drain_result == threaded_consumer_mod.DrainResult(
+            returned=0, abandoned=10
+        )
+
+
+def test_consume_timeout():
+    queue = MessageQueue(
+        name="queue", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+    consumer = ThreadedConsumer(queues=[queue], prefetch_size=5)
+    try:
+        start = time.monotonic()
+        assert consumer.consume(timeout=0.05) == []
+        assert 0.05 <= time.monotonic() - start < 0.5
+
+        queue.enqueue_many(
+            [Message(role_name="role", queue=queue) for _ in range(3)]
+        )
+        assert len(consumer.consume(timeout=1)) == 1
+        assert consumer.buffered_num == 2
+    finally:
+        consumer.stop()
+        consumer.join()
@@ -68,3 +68,13 @@ def test_recoverable_error_exceeds_max_retries(queue, middleware, new_message):
     with pytest.raises(RecoverableError):
         middleware.receive()
     assert queue.receive.call_count == 3
+
+
+def test_recoverable_error_for_ack_many(queue, middleware, new_message):
+    queue.ack_many.__name__ = "ack_many"
+    queue.ack_many.side_effect = [RecoverableError, None]
+
+    msgs = [new_message(), new_message()]
+    middleware.ack_many(msgs, results=[1, 2])
+    assert queue.ack_many.call_count == 2
+    queue.ack_many.assert_called_with(msgs, results=[1, 2])
@@ -97,3 +97,40 @@ def test_raises(retryable, queue, message):
 
     retryable.nack(message=message, exception=OtherError())
     queue.retry.assert_called()
+
+
+def test_nack_many(retryable, queue, exc):
+    retry_msg = mock.MagicMock(message_mod.Message)
+    retry_msg.meta = {"retries": 0}
+    nack_msg = mock.MagicMock(message_mod.Message)
+    nack_msg.meta = {"retries": retryable.max_retries}
+    other_exc = RuntimeError()
+
+    retryable.nack_many([retry_msg, nack_msg], exceptions=[exc, other_exc])
+    queue.retry.assert_called_once_with(
+        retry_msg, delay_millis=retryable.base_backoff_millis, exception=exc
+    )
+    queue.nack_many.assert_called_once_with([nack_msg], exceptions=[other_exc])
+    queue.nack.assert_not_called()
+
+
+def test_nack_many_retry_failed(retryable, queue, exc):
+    msgs = [mock.MagicMock(message_mod.Message) for _ in range(3)]
+    msgs[0].meta = {"retries": 0}
+    msgs[1].meta = {"retries": 0}
+    msgs[2].meta = {"retries": retryable.max_retries}
+    error = RuntimeError()
+    queue.retry.side_effect = [error, True]
+
+    with pytest.raises(RuntimeError) as exc_info:
+        retryable.nack_many(msgs, exceptions=[exc, exc, exc])
+    assert exc_info.value is error
+    # The others are still retried or nacked
+    assert queue.retry.call_count == 2
+    queue.nack_many.assert_called_once_with([msgs[2]], exceptions=[exc])
+
+
+def test_nack_many_all_retried(retryable, queue, message, exc):
+    retryable.nack_many([message], exceptions=[exc])
+    queue.retry.assert_called_once()
+    queue.nack_many.assert_not_called()
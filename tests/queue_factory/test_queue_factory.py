@@ -46,6 +46,19 @@ def test_build_queue_with_middlewares(queue_factory, broker2, encoder2):
     assert queue.encoder is encoder2
 
 
+def test_build_queue_with_header_keys(queue_factory):
+    queue = queue_factory.build_queue(queue_name="queue1")
+    assert queue.header_keys is None
+
+    queue = queue_factory.build_queue(
+        queue_name="queue1",
+        header_keys=["trace"],
+        middlewares=[middlewares_mod.Retryable()],
+    )
+    # The headers required by the middlewares are received as well
+    assert queue.header_keys == ["trace", "retries"]
+
+
 def test_build_queues_empty(queue_factory, queue_config):
     assert not queue_factory.build_queues()
 
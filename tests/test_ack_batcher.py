@@ -0,0 +1,87 @@
+import time
+from unittest import mock
+
+import pytest
+
+from rolecraft.queue import MessageQueue
+from rolecraft.service import ack_batcher as ack_batcher_mod
+
+
+@pytest.fixture()
+def queue():
+    q = mock.MagicMock(MessageQueue)
+    q.name = "MockedQueue"
+    return q
+
+
+@pytest.fixture()
+def queue2():
+    q = mock.MagicMock(MessageQueue)
+    q.name = "MockedQueue2"
+    return q
+
+
+def new_message(queue):
+    msg = mock.MagicMock()
+    msg.queue = queue
+    return msg
+
+
+@pytest.fixture()
+def ack_batcher():
+    batcher = ack_batcher_mod.AckBatcher(
+        batch_size=3, flush_interval_seconds=3600
+    )
+    batcher.start()
+    yield batcher
+    batcher.close()
+
+
+def test_flush_by_count(ack_batcher, queue, queue2):
+    msgs = [new_message(queue) for _ in range(3)]
+    msg2 = new_message(queue2)
+
+    ack_batcher.ack(msgs[0], 0)
+    ack_batcher.ack(msg2, 1)
+    ack_batcher.ack(msgs[1], 2)
+    queue.ack_many.assert_not_called()
+
+    ack_batcher.ack(msgs[2], 3)
+    queue.ack_many.assert_called_once_with(msgs, results=[0, 2, 3])
+    queue2.ack_many.assert_not_called()
+
+
+def test_flush_by_time(queue):
+    batcher = ack_batcher_mod.AckBatcher(
+        batch_size=100, flush_interval_seconds=0.05
+    )
+    batcher.start()
+    msg = new_message(queue)
+    batcher.ack(msg)
+    time.sleep(0.2)
+    queue.ack_many.assert_called_once_with([msg], results=[None])
+    batcher.close()
+
+
+def test_close(ack_batcher, queue):
+    msg = new_message(queue)
+    ack_batcher.ack(msg)
+    ack_batcher.close()
+    queue.ack_many.assert_called_once_with([msg], results=[None])
+
+    # ack immediately after closed
+    msg2 = new_message(queue)
+    ack_batcher.ack(msg2)
+    queue.ack_many.assert_called_with([msg2], results=[None])
+
+
+def test_fallback_on_error(ack_batcher, queue):
+    queue.ack_many.side_effect = RuntimeError
+    msgs = [new_message(queue) for _ in range(3)]
+    msgs[1].ack.side_effect = RuntimeError
+
+    for msg in msgs:
+        ack_batcher.ack(msg)
+
+    for msg in msgs:
+        msg.ack.assert_called_once_with(result=None)
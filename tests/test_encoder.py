@@ -2,6 +2,7 @@ from unittest import mock
 
 import pytest
 
+from rolecraft.broker import BytesRawMessage
 from rolecraft.queue import encoder as _encoder
 from rolecraft.queue import message as _message
 
@@ -55,3 +56,244 @@ def test_meta_with_value(header_bytes_encoder, message, queue):
     msg = header_bytes_encoder.decode(raw_msg, queue=queue)
     assert msg.meta["retries"] == 1
     assert msg == message
+
+
+def test_decode_buffer(header_bytes_encoder, message, queue):
+    raw_msg = header_bytes_encoder.encode(message)
+    raw_msg.data = memoryview(raw_msg.data)
+
+    msg = header_bytes_encoder.decode(raw_msg, queue=queue)
+    assert msg == message
+
+
+@pytest.fixture()
+def binary_encoder():
+    return _encoder.BinaryEncoder()
+
+
+@pytest.mark.parametrize("role_data", [None, "role_data", b"\x00\xb7\xff"])
+def test_binary_encode(binary_encoder, message, queue, role_data):
+    message.role_data = role_data
+    message.meta.update(
+        {"retries": 3, "ratio": 0.5, "trace": "abc", "flag": True}
+    )
+
+    raw_msg = binary_encoder.encode(message)
+    assert raw_msg.id == message.id
+    assert raw_msg.data[0] == _encoder.BinaryEncoder.MAGIC
+
+    msg = binary_encoder.decode(raw_msg, queue=queue)
+    assert msg == message
+    assert msg.meta["flag"] is True
+
+
+def test_binary_smaller_than_bytes(binary_encoder, message):
+    message.meta["retries"] = 1
+    bytes_encoder = _encoder.BytesEncoder(_encoder.HeaderBytesEncoder())
+    assert len(binary_encoder.encode(message).data) < len(
+        bytes_encoder.encode(message).data
+    )
+
+
+def test_binary_decode_legacy(binary_encoder, message, queue):
+    message.meta["retries"] = 1
+    bytes_encoder = _encoder.BytesEncoder(_encoder.HeaderBytesEncoder())
+    raw_msg = bytes_encoder.encode(message)
+    assert bytes_encoder.decode(raw_msg, queue=queue) == message
+
+    msg = binary_encoder.decode(raw_msg, queue=queue)
+    assert msg == message
+
+
+@pytest.mark.parametrize("low_byte", [0x00, 0x01, 0xFF])
+def test_binary_decode_legacy_with_magic(
+    binary_encoder, message, queue, low_byte
+):
+    bytes_encoder = _encoder.BytesEncoder(_encoder.HeaderBytesEncoder())
+    message.meta["pad"] = ""
+    header_len = int.from_bytes(bytes_encoder.encode(message).data[:2])
+    # Pad the headers to 0xB7XX bytes, as long as the magic byte
+    message.meta["pad"] = "x" * (0xB700 + low_byte - header_len)
+    raw_msg = bytes_encoder.encode(message)
+    assert raw_msg.data[:2] == bytes([binary_encoder.MAGIC, low_byte])
+
+    msg = binary_encoder.decode(raw_msg, queue=queue)
+    assert msg == message
+
+
+def test_binary_unsupported_header_type(binary_encoder, message):
+    message.meta["retries"] = [1]
+    with pytest.raises(TypeError, match="retries"):
+        binary_encoder.encode(message)
+
+
+def test_binary_unknown_payload_type(binary_encoder, message, queue):
+    raw_msg = binary_encoder.encode(message)
+    raw_msg.data = raw_msg.data[:2] + b"\x09" + raw_msg.data[3:]
+
+    with pytest.raises(ValueError, match="payload type"):
+        binary_encoder.decode(raw_msg, queue=queue)
+
+
+def test_binary_decode_buffer(binary_encoder, message, queue):
+    raw_msg = binary_encoder.encode(message)
+    raw_msg.data = memoryview(raw_msg.data)
+
+    msg = binary_encoder.decode(raw_msg, queue=queue)
+    assert msg == message
+
+
+def test_binary_unsupported_version(binary_encoder, message, queue):
+    raw_msg = binary_encoder.encode(message)
+    raw_msg.data = raw_msg.data[:1] + b"\x09" + raw_msg.data[2:]
+
+    with pytest.raises(ValueError, match="version"):
+        binary_encoder.decode(raw_msg, queue=queue)
+
+
+@pytest.fixture()
+def bytes_encoder(header_bytes_encoder):
+    return _encoder.BytesEncoder(header_bytes_encoder)
+
+
+def test_bytes_decode_without_copy(bytes_encoder, message, queue):
+    message.meta["retries"] = 1
+    raw_msg = bytes_encoder.encode(message)
+    assert isinstance(raw_msg.data, bytes)
+    header_data, data = bytes_encoder._unpack(raw_msg.data)
+    assert header_data.obj is raw_msg.data
+    assert data.obj is raw_msg.data
+
+    msg = bytes_encoder.decode(raw_msg, queue=queue)
+    assert msg == message
+
+
+def test_bytes_wide_headers(bytes_encoder, message, queue):
+    message.meta["large"] = "x" * 0x10000
+    raw_msg = bytes_encoder.encode(message)
+    assert raw_msg.data[:2] == b"\xff\xff"
+
+    msg = bytes_encoder.decode(raw_msg, queue=queue)
+    assert msg == message
+
+
+def test_bytes_decode_narrow_frame(bytes_encoder, message, queue):
+    # A frame packed by concatenation, as before
+    header_data = b'{"retries": 1}'
+    data = bytes_encoder.encoder.encode(message).data
+    raw_msg = BytesRawMessage(
+        id=message.id,
+        data=len(header_data).to_bytes(2, "big") + header_data + data,
+    )
+
+    msg = bytes_encoder.decode(raw_msg, queue=queue)
+    assert msg.meta == {"retries": 1}
+    assert msg.role_data == message.role_data
+
+
+def test_binary_buffer_payload(message, queue):
+    binary_encoder = _encoder.BinaryEncoder(buffer_payload=True)
+    message.role_data = b"\x00" * 1024
+    raw_msg = binary_encoder.encode(message)
+
+    msg = binary_encoder.decode(raw_msg, queue=queue)
+    assert isinstance(msg.role_data, memoryview)
+    assert msg.role_data.obj is raw_msg.data
+    assert msg.role_data == message.role_data
+
+    # Encoded again from the buffer
+    assert binary_encoder.encode(msg).data == raw_msg.data
+
+
+@pytest.mark.parametrize("role_data", [None, "role_data", {"a": [1, 2]}])
+def test_lazy_decode(message, queue, role_data):
+    message.role_data = role_data
+    message.meta["retries"] = 1
+    encoder = _encoder.HeaderBytesEncoder(lazy=True)
+    raw_msg = encoder.encode(message)
+
+    msg = encoder.decode(raw_msg, queue=queue)
+    assert isinstance(msg, _message.LazyMessage)
+    assert msg.role_name == message.role_name
+    assert msg.meta == {"retries": 1}
+    assert not msg.role_data_loaded
+
+    assert msg.role_data == role_data
+    assert msg.role_data_loaded
+    # Encoded again from the loaded role data
+    assert encoder.encode(msg).data == raw_msg.data
+
+
+def test_lazy_decode_other_form(queue):
+    encoder = _encoder.HeaderBytesEncoder(lazy=True)
+    raw_msg = _encoder.HeaderBytesRawMessage(
+        id="1", data=b'{"role_data": "data", "role_name": "role"}'
+    )
+
+    msg = encoder.decode(raw_msg, queue=queue)
+    assert not isinstance(msg, _message.LazyMessage)
+    assert (msg.role_name, msg.role_data) == ("role", "data")
+
+
+def test_lazy_decode_error_on_access(queue):
+    encoder = _encoder.HeaderBytesEncoder(lazy=True)
+    raw_msg = _encoder.HeaderBytesRawMessage(
+        id="1", data=b'{"role_name": "role", "role_data": [1, }'
+    )
+
+    msg = encoder.decode(raw_msg, queue=queue)
+    assert msg.role_name == "role"
+    with pytest.raises(ValueError):
+        assert msg.role_data == [1]
+
+
+def test_lazy_decode_only_head(queue):
+    encoder = _encoder.HeaderBytesEncoder(lazy=True)
+    # The role data isn't decoded until it is accessed
+    raw_msg = _encoder.HeaderBytesRawMessage(
+        id="1", data=memoryview(b'{"role_name": "a\\"b", "role_data": "\xff"}')
+    )
+
+    msg = encoder.decode(raw_msg, queue=queue)
+    assert msg.role_name == 'a"b'
+    with pytest.raises(UnicodeDecodeError):
+        assert msg.role_data
+
+
+def test_lazy_set_role_data(queue):
+    load_role_data = mock.Mock()
+    msg = _message.LazyMessage(
+        role_name="role", queue=queue, load_role_data=load_role_data
+    )
+    msg.role_data = "data"
+    assert msg.role_data == "data"
+    assert msg.role_data_loaded
+    load_role_data.assert_not_called()
+
+
+@pytest.mark.parametrize("role_data", ["role_data", b"\x00\x01"])
+def test_binary_lazy_decode(message, queue, role_data):
+    message.role_data = role_data
+    encoder = _encoder.BinaryEncoder(lazy=True)
+    raw_msg = encoder.encode(message)
+
+    msg = encoder.decode(raw_msg, queue=queue)
+    assert isinstance(msg, _message.LazyMessage)
+    assert not msg.role_data_loaded
+    assert msg.role_data == role_data
+
+
+@pytest.mark.parametrize(
+    "encoder",
+    [
+        _encoder.BinaryEncoder(),
+        _encoder.BytesEncoder(_encoder.HeaderBytesEncoder()),
+    ],
+)
+def test_decode_header_keys(encoder, message, queue):
+    message.meta.update({"retries": 1, "trace": "abc", "ratio": 0.5})
+    raw_msg = encoder.encode(message)
+
+    msg = encoder.decode(raw_msg, queue=queue, header_keys=["trace", "x"])
+    assert msg.meta == {"trace": "abc"}
+    assert msg.role_data == message.role_data
@@ -118,3 +118,91 @@ def test_iterable(notify_queue):
     assert list(notify_queue) == []
     notify_queue.put(1)
     assert list(notify_queue) == [1]
+
+
+def test_get_many():
+    notify_queue = notify_queue_mod.NotifyQueue(maxsize=5)
+    notify_queue.put_many([1, 2, 3])
+    assert notify_queue.get_many(2) == [1, 2]
+    assert notify_queue.get_many(2) == [3]
+
+    rv = []
+    t = threading.Thread(
+        target=lambda: rv.append(
+            notify_queue.get_many(2, wakeup_until_notify_all=True)
+        )
+    )
+    t.start()
+    time.sleep(0.05)
+    notify_queue.notify_all()
+    t.join()
+    assert rv == [[]]
+
+
+def test_put_many_blocks_until_room(notify_queue):
+    t = threading.Thread(target=notify_queue.put_many, args=([1, 2, 3],))
+    t.start()
+    rv = []
+    while len(rv) < 3:
+        rv.extend(notify_queue.get_many(3))
+    t.join()
+    assert rv == [1, 2, 3]
+    assert notify_queue.get_nowait() is None
+
+
+def test_no_spin():
+    notify_queue = notify_queue_mod.NotifyQueue(spin_seconds=0)
+    t = threading.Timer(0.05, notify_queue.put, args=(1,))
+    t.start()
+    assert notify_queue.get() == 1
+    t.join()
+
+
+def test_get_timeout(notify_queue):
+    start = time.monotonic()
+    assert notify_queue.get_many(1, timeout=0.05) == []
+    assert time.monotonic() - start >= 0.05
+
+
+def test_get_timeout_with_wakeups(notify_queue):
+    stopped = threading.Event()
+
+    def wake_up():
+        # Woken up without items, as if they had been taken by others, for
+        # at most 1 second
+        for _ in range(100):
+            if stopped.wait(0.01):
+                return
+            with notify_queue._condition:
+                notify_queue._condition.notify()
+
+    t = threading.Thread(target=wake_up)
+    t.start()
+    try:
+        start = time.monotonic()
+        assert (
+            notify_queue.get_many(
+                1, wakeup_until_notify_all=True, timeout=0.05
+            )
+            == []
+        )
+        assert time.monotonic() - start < 0.5
+    finally:
+        stopped.set()
+        t.join()
+
+
+def test_close(notify_queue):
+    rv = []
+    t = threading.Thread(target=lambda: rv.append(notify_queue.get_many(1)))
+    t.start()
+    time.sleep(0.05)
+    notify_queue.close()
+    t.join()
+    assert rv == [[]]
+
+    # Putting doesn't block once closed
+    notify_queue.put_many([1, 2, 3])
+    assert len(notify_queue) == 3
+    assert notify_queue.get_many(5) == [1, 2, 3]
+    assert notify_queue.get_many(5) == []
@@ -0,0 +1,167 @@
+import concurrent.futures
+import os
+import signal
+import threading
+import time
+
+from rolecraft.service import PreforkSupervisor
+
+
+class FakeWorker:
+    def __init__(self, handled_per_second: int) -> None:
+        self.handled_per_second = handled_per_second
+        self.started_at = time.monotonic()
+
+    @property
+    def handled_num(self) -> int:
+        elapsed = time.monotonic() - self.started_at
+        return int(elapsed * self.handled_per_second)
+
+
+class FakeService:
+    """Records the pid of its process in the file when it starts and
+    stops"""
+
+    def __init__(self, path, handled_per_second: int = 0) -> None:
+        self.path = path
+        self.worker = FakeWorker(handled_per_second)
+        self._stopped = threading.Event()
+
+    def _record(self, event: str):
+        with open(self.path, "a") as f:
+            f.write(f"{event} {os.getpid()}\n")
+
+    def start(self, thread_num=None, ignore_signal=False):
+        self._record("start")
+
+    def stop(self):
+        self._record("stop")
+        self._stopped.set()
+
+    def join(self):
+        self._stopped.wait()
+
+
+def read_events(path) -> list[tuple[str, int]]:
+    if not path.exists():
+        return []
+    with open(path) as f:
+        return [
+            (event, int(pid)) for event, pid in map(str.split, f.readlines())
+        ]
+
+
+def wait_events(path, predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        events = read_events(path)
+        if predicate(events):
+            return events
+        time.sleep(0.01)
+    raise TimeoutError(read_events(path))
+
+
+def run_until(supervisor: PreforkSupervisor, fn):
+    """Runs the supervisor in the main thread until the function ends in
+    another thread, whose error is raised"""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fn)
+        future.add_done_callback(lambda _: supervisor.stop())
+        rv = supervisor.run()
+    future.result()
+    return rv
+
+
+def test_fork_and_stop(tmp_path):
+    path = tmp_path / "events"
+    supervisor = PreforkSupervisor(lambda: FakeService(path), 3)
+
+    rv = run_until(
+        supervisor, lambda: wait_events(path, lambda events: len(events) == 3)
+    )
+    assert rv == 0
+
+    events = read_events(path)
+    started = {pid for event, pid in events if event == "start"}
+    stopped = {pid for event, pid in events if event == "stop"}
+    assert len(started) == 3
+    assert os.getpid() not in started
+    # the services are stopped gracefully
+    assert started == stopped
+
+
+def test_restart_crashed(tmp_path):
+    path = tmp_path / "events"
+    supervisor = PreforkSupervisor(
+        lambda: FakeService(path), 1, restart_delay_seconds=0
+    )
+
+    def crash():
+        ((_, pid),) = wait_events(path, lambda events: len(events) == 1)
+        os.kill(pid, signal.SIGKILL)
+        wait_events(path, lambda events: len(events) == 2)
+
+    run_until(supervisor, crash)
+
+    events = read_events(path)
+    assert [event for event, _ in events] == ["start", "start", "stop"]
+    assert events[0][1] != events[1][1]
+
+
+def test_recycle_after_tasks(tmp_path):
+    path = tmp_path / "events"
+    supervisor = PreforkSupervisor(
+        lambda: FakeService(path, handled_per_second=1000),
+        1,
+        max_tasks_per_process=50,
+        check_interval_seconds=0.01,
+    )
+
+    run_until(
+        supervisor, lambda: wait_events(path, lambda events: len(events) >= 3)
+    )
+
+    events = read_events(path)
+    assert [event for event, _ in events[:3]] == ["start", "stop", "start"]
+    assert events[0][1] != events[2][1]
+
+
+def test_recycle_after_rss(tmp_path):
+    path = tmp_path / "events"
+    supervisor = PreforkSupervisor(
+        lambda: FakeService(path),
+        1,
+        max_rss_bytes=1,
+        check_interval_seconds=0.01,
+    )
+
+    run_until(
+        supervisor, lambda: wait_events(path, lambda events: len(events) >= 3)
+    )
+
+    events = read_events(path)
+    assert [event for event, _ in events[:3]] == ["start", "stop", "start"]
+
+
+def test_child_state_reset(tmp_path):
+    path = tmp_path / "events"
+    supervisor = None
+
+    def create_service():
+        # Checked before the child installs its own handlers
+        inherited = (
+            signal.getsignal(signal.SIGTERM) is not signal.SIG_DFL
+            or signal.getsignal(signal.SIGINT) is not signal.SIG_DFL
+            or supervisor._pids
+        )
+        with open(path, "a") as f:
+            f.write(f"{'inherited' if inherited else 'reset'} {os.getpid()}\n")
+        return FakeService(tmp_path / "services")
+
+    supervisor = PreforkSupervisor(create_service, 2)
+
+    run_until(
+        supervisor, lambda: wait_events(path, lambda events: len(events) == 2)
+    )
+
+    assert [event for event, _ in read_events(path)] == ["reset", "reset"]
@@ -0,0 +1,142 @@
+import dataclasses
+import time
+from unittest import mock
+
+import pytest
+
+from rolecraft.broker import StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+
+
+@pytest.fixture()
+def broker():
+    return StubBroker()
+
+
+@pytest.fixture()
+def queue(broker):
+    return MessageQueue(
+        name="queue", broker=broker, encoder=HeaderBytesEncoder()
+    )
+
+
+def new_messages(queue, num: int):
+    return [
+        Message(role_name="role", role_data=str(i), queue=queue)
+        for i in range(num)
+    ]
+
+
+def test_enqueue_many(queue, broker):
+    msgs = new_messages(queue, 3)
+    with mock.patch.object(
+        broker, "enqueue_many", wraps=broker.enqueue_many
+    ) as enqueue_many:
+        ids = queue.enqueue_many(msgs)
+    assert enqueue_many.call_count == 1
+    assert len(ids) == 3
+
+    received = queue.receive(max_number=3)
+    assert [msg.id for msg in received] == ids
+    assert [msg.role_data for msg in received] == ["0", "1", "2"]
+
+
+def test_enqueue_many_with_options(queue, broker):
+    msgs = new_messages(queue, 2)
+    with mock.patch.object(broker, "enqueue_many") as enqueue_many:
+        queue.enqueue_many(msgs, delay_millis=10)
+    args, kwargs = enqueue_many.call_args
+    assert args[0] == "queue"
+    assert len(args[1]) == 2
+    assert kwargs == {"delay_millis": 10}
+
+
+def test_extend_visibility_with_settings(broker):
+    queue = MessageQueue(
+        name="queue",
+        broker=broker,
+        encoder=HeaderBytesEncoder(),
+        settings={"visibility_timeout_seconds": 0.05},
+    )
+    queue.prepare()
+    queue.enqueue_many(new_messages(queue, 1))
+    (msg,) = queue.receive()
+
+    msg.extend_visibility(seconds=1)
+    time.sleep(0.06)
+    assert queue.receive() == []
+    msg.ack()
+
+
+def test_encoded_size(queue):
+    msg = Message(role_name="role", role_data="x" * 100, queue=queue)
+    queue.enqueue(msg)
+    (received,) = queue.receive()
+    assert received.encoded_size == len(queue.encoder.encode(msg).data)
+    # The size doesn't take part in comparison
+    assert dataclasses.replace(received, encoded_size=0) == received
+
+
+def test_lifecycle_reuses_raw_message(queue):
+    queue.enqueue_many(new_messages(queue, 3))
+    msgs = queue.receive(max_number=3)
+    assert all(msg.raw_message is not None for msg in msgs)
+
+    with mock.patch.object(
+        queue.encoder, "encode", wraps=queue.encoder.encode
+    ) as encode:
+        msgs[0].requeue()
+        msgs[1].extend_visibility(seconds=1)
+        queue.ack_many(msgs[1:])
+        (msg,) = queue.receive()
+        msg.nack(exception=ValueError())
+    assert encode.call_count == 0
+
+
+def test_retry_encodes_changed_meta(queue):
+    queue.enqueue_many(new_messages(queue, 2))
+    unchanged, changed = queue.receive(max_number=2)
+    changed.meta = {"key": "value"}
+
+    with mock.patch.object(
+        queue.encoder, "encode", wraps=queue.encoder.encode
+    ) as encode:
+        queue.retry(unchanged)
+        queue.retry(changed)
+    assert encode.call_count == 1
+
+    retried = queue.receive(max_number=2)
+    assert [msg.role_data for msg in retried] == ["0", "1"]
+    assert [msg.meta for msg in retried] == [
+        {"retries": 1},
+        {"key": "value", "retries": 1},
+    ]
+
+
+def test_requeue_lazy_message(broker):
+    queue = MessageQueue(
+        name="queue", broker=broker, encoder=HeaderBytesEncoder(lazy=True)
+    )
+    queue.enqueue_many(new_messages(queue, 1))
+    (msg,) = queue.receive()
+
+    msg.requeue()
+    assert not msg.role_data_loaded
+    (msg,) = queue.receive()
+    assert msg.role_data == "0"
+
+
+def test_receive_header_keys(broker):
+    queue = MessageQueue(
+        name="queue",
+        broker=broker,
+        encoder=HeaderBytesEncoder(),
+        header_keys=["retries"],
+    )
+    msg = Message(role_name="role", meta={"k": "v"}, queue=queue)
+    queue.enqueue_many([msg, dataclasses.replace(msg, id="")])
+
+    (received,) = queue.receive()
+    assert received.meta == {}
+    (received,) = queue.block_receive(header_keys=None).result()
+    assert received.meta == {"k": "v"}
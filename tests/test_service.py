@@ -1,4 +1,6 @@
 import contextlib
+import multiprocessing
+import os
 import threading
 import time
 from typing import Unpack
@@ -8,6 +10,19 @@ import pytest
 import rolecraft
 from rolecraft import broker as broker_mod
 from rolecraft import role
+from rolecraft.service import AutoscalingThreadWorkerPool, ProcessWorkerPool
+
+
+@role
+def crash_once(path: str):
+    """Exits the worker process the first time. A role run in the worker
+    processes which aren't forked is defined at module level."""
+    if not os.path.exists(path):
+        with open(path, "w") as f:
+            f.write("crashed")
+        os._exit(1)
+    with open(path, "a") as f:
+        f.write(f" {os.getpid()}")
 
 
 @pytest.fixture
@@ -195,3 +210,146 @@ def test_dispatch_messages_hard_fail(config, create_service):
         time.sleep(0.1)
     assert len(rv) == 1
     assert rv == [False]
+
+
+def test_dispatch_messages_with_ack_batch(broker, create_service):
+    rv = []
+
+    @role
+    def fn(first: int, *, second: int):
+        rv.append(first + second)
+
+    with create_service(ack_batch_size=1000):
+        for i in range(100):
+            fn.dispatch_message(i, second=i)
+        time.sleep(0.1)
+        assert len(rv) == 100
+
+    # pending acks are flushed after the service is stopped
+    assert broker.qsize("default") == 0
+
+
+@pytest.fixture()
+def create_process_service():
+    @contextlib.contextmanager
+    def _create_service(**service_opions):
+        service = rolecraft.ServiceFactory(
+            worker_pool_factory=lambda: ProcessWorkerPool(process_num=2)
+        ).create(prefetch_size=10, **service_opions)
+        service.start(ignore_signal=True)
+        yield service
+        service.stop()
+        service.join()
+
+    return _create_service
+
+
+def test_dispatch_messages_to_processes(broker, create_process_service):
+    rv = multiprocessing.SimpleQueue()
+
+    @role
+    def fn(first: int, *, second: int):
+        rv.put((os.getpid(), first + second))
+
+    with create_process_service():
+        for i in range(100):
+            fn.dispatch_message(i, second=i)
+        results = [rv.get() for _ in range(100)]
+        time.sleep(0.1)
+
+    assert {pid for pid, _ in results} != {os.getpid()}
+    assert {i * 2 for i in range(100)} == {r for _, r in results}
+    assert broker.qsize("default") == 0
+
+
+def test_dispatch_messages_to_processes_fail_retry(
+    config, create_process_service
+):
+    config.default.middlewares.retryable.max_backoff_millis = 0
+    config.inject()
+
+    rv = multiprocessing.SimpleQueue()
+
+    @role
+    def fn(first: int, *, second: int):
+        rv.put(False)
+        raise RuntimeError("fn fails")
+
+    with create_process_service():
+        fn.dispatch_message(0, second=1)
+        time.sleep(0.2)
+
+    results = []
+    while not rv.empty():
+        results.append(rv.get())
+    assert results == [False] * 4
+
+
+def test_dispatch_messages_with_autoscaling(broker):
+    rv = []
+
+    @role
+    def fn(first: int, *, second: int):
+        time.sleep(0.001)
+        rv.append(first + second)
+
+    service = rolecraft.ServiceFactory(
+        worker_pool_factory=lambda: AutoscalingThreadWorkerPool(
+            max_threads=8, interval_seconds=0.01, idle_check_seconds=0.01
+        )
+    ).create(prefetch_size=10)
+    service.start(ignore_signal=True)
+    try:
+        for i in range(200):
+            fn.dispatch_message(i, second=i)
+        deadline = time.monotonic() + 2
+        while len(rv) < 200 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert service.worker_pool.last_decision.thread_num > 1
+    finally:
+        service.stop()
+        service.join()
+
+    assert {i * 2 for i in range(200)} == set(rv)
+    assert broker.qsize("default") == 0
+
+
+@pytest.mark.parametrize("restart_method", [None, "forkserver"])
+def test_dispatch_messages_to_restarted_process(
+    broker, tmp_path, restart_method
+):
+    # It is registered once, when the module is imported
+    if role.role_hanger.pick("crash_once") is None:
+        role.role_hanger.put(crash_once)
+
+    service = rolecraft.ServiceFactory(
+        worker_pool_factory=lambda: ProcessWorkerPool(
+            process_num=1, restart_method=restart_method
+        )
+    ).create(prefetch_size=10)
+    service.start(ignore_signal=True)
+    path = str(tmp_path / "crash")
+    try:
+        crash_once.dispatch_message(path)
+        deadline = time.monotonic() + 10
+        while not read_words(path) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # The next message is crafted in the restarted process
+        crash_once.dispatch_message(path)
+        while len(read_words(path)) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        service.stop()
+        service.join()
+
+    event, pid = read_words(path)
+    assert event == "crashed"
+    assert int(pid) != os.getpid()
+    assert broker.qsize("default") == 0
+
+
+def read_words(path: str) -> list[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return f.read().split()
@@ -1,8 +1,13 @@
+import logging
+import os
 import threading
 import time
 
 import pytest
 
+from rolecraft.broker import BrokerError, StubBroker
+from rolecraft.queue import HeaderBytesEncoder, Message, MessageQueue
+from rolecraft.role_lib import InterruptError
 from rolecraft.service import thread_local as local_mod
 from rolecraft.service import worker_pool as worker_pool_mod
 
@@ -31,6 +36,13 @@ def worker_pool(thread_worker_pool):
     yield thread_worker_pool
 
 
+def wait_until(predicate, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
 def test_submit(worker_pool):
     data = set()
 
@@ -95,3 +107,354 @@ def test_single_thread_worker_pool(single_thread_worker_pool):
     t.join()
 
     assert data
+
+
+def test_thread_stats(worker_pool):
+    queue = MessageQueue(
+        name="queue", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+    handled = threading.Event()
+    names = []
+
+    def run(identity):
+        names.append(threading.current_thread().name)
+        for i in range(3):
+            with worker_pool.handling(
+                Message(id=str(i), role_name="role", queue=queue)
+            ):
+                time.sleep(0.01)
+        handled.set()
+        local_mod.thread_local.stop_event.wait(3600)
+
+    worker_pool.submit(run, identity=0)
+    assert handled.wait(1)
+
+    (stats,) = worker_pool.stats()
+    assert stats.name == names[0] == "ThreadWorkerPool-0"
+    assert stats.handled_num == 3
+    assert stats.last_message_id == "2"
+    assert stats.handling_since is None
+    assert stats.busy_seconds >= 0.03
+
+
+def test_resize(worker_pool):
+    identities = []
+
+    def run(identity):
+        identities.append(identity)
+        stop_event = local_mod.thread_local.stop_event
+        while not worker_pool.should_retire() and not stop_event.is_set():
+            time.sleep(0.005)
+
+    worker_pool.submit(run, identity=0)
+    worker_pool.resize(4)
+    assert worker_pool.running_num == 4
+    wait_until(lambda: len(identities) == 4)
+    assert sorted(identities) == [0, 1, 2, 3]
+
+    worker_pool.resize(1)
+    wait_until(lambda: len(worker_pool.stats()) == 1)
+    assert worker_pool.running_num == 1
+
+
+def test_join_timeout_reports_stuck_threads(worker_pool, caplog):
+    queue = MessageQueue(
+        name="queue", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+    release = threading.Event()
+
+    def stuck_in_role():
+        release.wait(3600)
+
+    def run():
+        with worker_pool.handling(
+            Message(id="stuck", role_name="role", queue=queue)
+        ):
+            stuck_in_role()
+
+    worker_pool.submit(run)
+    time.sleep(0.05)
+    worker_pool.stop()
+
+    start = time.monotonic()
+    (stats,) = worker_pool.join(timeout=0.05)
+    assert time.monotonic() - start < 0.5
+    assert stats.last_message_id == "stuck"
+    assert stats.handling_since is not None
+    assert "stuck_in_role" in caplog.text
+
+    release.set()
+    assert worker_pool.join() == []
+
+
+class UnpicklableError(Exception):
+    def __init__(self, code: int, reason: str) -> None:
+        super().__init__(f"error {code}: {reason}")
+
+
+def craft(message):
+    match message.role_name:
+        case "echo":
+            return (message.queue.name, message.role_data)
+        case "fail":
+            try:
+                raise ValueError("fail")
+            except ValueError as e:
+                raise RuntimeError("crafting fails") from e
+        case "unpicklable":
+            raise UnpicklableError(1, "unpicklable")
+        case "wait":
+            local_mod.thread_local.stop_event.wait(3600, interrupt=True)
+        case "exit":
+            os._exit(1)
+
+
+@pytest.fixture()
+def process_worker_pool():
+    pool = worker_pool_mod.ProcessWorkerPool(process_num=2, batch_size=4)
+    pool.craft = craft
+    pool.start()
+    yield pool
+    pool.stop()
+    pool.join()
+
+
+def craft_in_pool(pool, *role_names: str):
+    queue = MessageQueue(
+        name="queue", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+    messages = [
+        Message(role_name=name, role_data=str(i), queue=queue)
+        for i, name in enumerate(role_names)
+    ]
+    rv = []
+    pool.submit(lambda: rv.extend(pool.craft_many(messages)))
+    return rv
+
+
+def test_process_craft_many(process_worker_pool):
+    rv = craft_in_pool(process_worker_pool, "echo", "fail", "unpicklable")
+    process_worker_pool.join()
+
+    (result, error), (_, fail_error), (_, unpicklable_error) = rv
+    assert result == ("queue", "0")
+    assert error is None
+    assert isinstance(fail_error, RuntimeError)
+    assert isinstance(fail_error.__cause__, ValueError)
+    assert "Traceback in worker process" in fail_error.__notes__[0]
+    assert isinstance(unpicklable_error, worker_pool_mod.RemoteError)
+
+
+def test_process_full(process_worker_pool):
+    craft_in_pool(process_worker_pool)
+    craft_in_pool(process_worker_pool)
+    with pytest.raises(RuntimeError):
+        craft_in_pool(process_worker_pool)
+
+
+def test_process_stop_event(process_worker_pool):
+    rv = craft_in_pool(process_worker_pool, "wait", "echo")
+    time.sleep(0.1)
+    assert not rv
+
+    process_worker_pool.stop()
+    process_worker_pool.join()
+
+    # the message not crafted yet is interrupted as well
+    assert [type(error) for _, error in rv] == [InterruptError] * 2
+
+
+def test_process_exit(process_worker_pool):
+    pool = process_worker_pool
+    queue = MessageQueue(
+        name="queue", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+    rv = []
+
+    def run():
+        for role_names in (["echo", "exit", "echo"], ["echo"]):
+            messages = [Message(role_name=n, queue=queue) for n in role_names]
+            rv.append(pool.craft_many(messages))
+
+    pool.submit(run)
+    pool.join()
+
+    crashed, restarted = rv
+    assert crashed[0] == (("queue", None), None)
+    assert isinstance(crashed[1][1], worker_pool_mod.WorkerProcessError)
+    assert isinstance(crashed[2][1], InterruptError)
+    assert restarted == [(("queue", None), None)]
+
+
+def test_process_restart_failure():
+    pool = worker_pool_mod.ProcessWorkerPool(restart_method="forkserver")
+    # It can be forked but not pickled for the fork server
+    pool.craft = lambda message: craft(message)
+    pool.start()
+    queue = MessageQueue(
+        name="queue", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+    rv = []
+
+    def run():
+        for role_names in (["echo", "exit"], ["echo"]):
+            messages = [Message(role_name=n, queue=queue) for n in role_names]
+            rv.append(pool.craft_many(messages))
+
+    pool.submit(run)
+    pool.join()
+    pool.stop()
+
+    # The outcomes are returned though the child can't be restarted, and
+    # the later messages fail at once
+    crashed, failed = rv
+    assert crashed[0] == (("queue", None), None)
+    assert isinstance(crashed[1][1], worker_pool_mod.WorkerProcessError)
+    ((_, error),) = failed
+    assert isinstance(error, worker_pool_mod.WorkerProcessError)
+    assert "dead" in str(error)
+
+
+@pytest.mark.parametrize("restart_method", [None, "forkserver"])
+def test_process_restart_under_load(restart_method):
+    pool = worker_pool_mod.ProcessWorkerPool(
+        process_num=2, restart_method=restart_method
+    )
+    pool.craft = craft
+    pool.start()
+    queue = MessageQueue(
+        name="queue", broker=StubBroker(), encoder=HeaderBytesEncoder()
+    )
+    # Other threads of the parent keep taking locks and logging while the
+    # children are restarted
+    busy = threading.Event()
+    lock = threading.Lock()
+
+    def load():
+        while not busy.is_set():
+            with lock:
+                logging.getLogger(__name__).debug("busy")
+            time.sleep(0)
+
+    load_threads = [threading.Thread(target=load) for _ in range(4)]
+    for t in load_threads:
+        t.start()
+
+    rv = [[], []]
+
+    def run(outcomes):
+        for _ in range(2):
+            messages = [
+                Message(role_name=n, queue=queue) for n in ("exit", "echo")
+            ]
+            outcomes.extend(pool.craft_many(messages))
+        outcomes.extend(
+            pool.craft_many([Message(role_name="echo", queue=queue)])
+        )
+
+    try:
+        for outcomes in rv:
+            pool.submit(run, outcomes)
+    finally:
+        pool.join()
+        busy.set()
+        for t in load_threads:
+            t.join()
+        pool.stop()
+
+    for outcomes in rv:
+        assert len(outcomes) == 5
+        assert outcomes[-1] == (("queue", None), None)
+        assert all(
+            isinstance(error, worker_pool_mod.WorkerProcessError)
+            for _, error in outcomes[:-1:2]
+        )
+
+
+@pytest.fixture()
+def autoscaling_worker_pool():
+    pool = worker_pool_mod.AutoscalingThreadWorkerPool(
+        min_threads=1,
+        max_threads=4,
+        interval_seconds=0.02,
+        scale_up_cooldown_seconds=0,
+        scale_down_cooldown_seconds=0,
+    )
+    pool.start()
+    yield pool
+    pool.stop()
+    pool.join()
+
+
+def test_autoscale(autoscaling_worker_pool):
+    pool = autoscaling_worker_pool
+    busy = threading.Event()
+    busy.set()
+    pool.backlog = lambda: 100 if busy.is_set() else 0
+    identities = []
+
+    def run(identity):
+        identities.append(identity)
+        stop_event = local_mod.thread_local.stop_event
+        while not pool.should_retire() and not stop_event.is_set():
+            if busy.is_set():
+                # blocked in I/O when handling a message
+                with pool.handling(Message(role_name="role", queue=None)):
+                    time.sleep(0.005)
+            else:
+                time.sleep(0.005)
+
+    pool.submit(run, identity=0)
+    wait_until(lambda: pool.running_num == 4)
+    assert pool.last_decision.io_share > 0.5
+
+    busy.clear()
+    wait_until(lambda: pool.running_num == 1)
+    assert sorted(identities) == [0, 1, 2, 3]
+
+
+def test_autoscale_backlog_error(autoscaling_worker_pool, caplog):
+    pool = autoscaling_worker_pool
+
+    def backlog():
+        raise BrokerError("qsize fails")
+
+    pool.backlog = backlog
+    with caplog.at_level(logging.WARNING):
+        assert pool._autoscale().backlog is None
+    assert "Failed to measure the backlog" in caplog.text
+
+    pool.backlog = lambda: 1 // 0
+    with pytest.raises(ZeroDivisionError):
+        pool._measure_backlog()
+
+
+def test_autoscale_decide():
+    pool = worker_pool_mod.AutoscalingThreadWorkerPool(
+        min_threads=2,
+        max_threads=16,
+        scale_up_cooldown_seconds=1,
+        scale_down_cooldown_seconds=10,
+    )
+    now = 100
+
+    def decide(thread_num, utilization, io_share=0.9, backlog=None):
+        return pool._decide(thread_num, utilization, io_share, backlog, now)
+
+    # grow at most double and by the waiting messages
+    assert decide(4, 0.9) == 8
+    assert decide(4, 0.9, backlog=1) == 5
+    assert decide(12, 0.9) == 16
+    # not for CPU-bound roles, or without waiting messages
+    assert decide(4, 0.9, io_share=0.1) == 4
+    assert decide(4, 0.9, backlog=0) == 4
+    # hysteresis
+    assert decide(4, 0.5) == 4
+    # retire half of the threads not needed
+    assert decide(8, 0.1) == 4
+    assert decide(3, 0) == 2
+
+    pool._last_scaled_at = now - 5
+    # cooldowns
+    assert decide(4, 0.9) == 8
+    assert decide(8, 0.1) == 8